@@ -0,0 +1,715 @@
+#
+#
+#	z2kit v2 : Security Camp track Z2 : sort of analysis framework
+#
+#	benchmark.py
+#	Microbenchmarks
+#
+#	Copyright (C) 2018 Tsukasa OI.
+#
+#	Permission to use, copy, modify, and/or distribute this software
+#	for any purpose with or without fee is hereby granted, provided
+#	that the above copyright notice and this permission notice
+#	appear in all copies.
+#
+#	THE SOFTWARE IS PROVIDED “AS IS” AND ISC DISCLAIMS ALL WARRANTIES
+#	WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+#	MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL ISC BE LIABLE FOR
+#	ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+#	DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+#	WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+#	ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+#	PERFORMANCE OF THIS SOFTWARE.
+#
+#
+#	使い方: python -m z2kit2.benchmark [ベンチマーク名...]
+#
+import array
+import math
+import os
+import random
+import re
+import struct
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from . import c4_5
+from . import decision
+from . import decisionopt
+from . import decisions
+from . import elf
+from . import elffile
+from . import features
+from . import featurestore
+from . import filedata
+from . import forest
+from . import zstruct
+
+#  以前の zstruct による init_from の実装 (比較用)
+#  呼び出し毎にフォーマット文字列を連結し、メンバーごとに setattr を行う。
+def _legacy_init_from(cls, data, endian=None):
+	o = cls()
+	xnames  = cls.__struct_names__
+	xarray  = cls.__struct_array__
+	xendian = cls.__struct_endian__ if endian is None else endian
+	data = struct.unpack(['=', '<', '>'][xendian] + cls.__struct_format__, data)
+	j = 0
+	for i in range(len(xnames)):
+		xname = xnames[i]
+		l = xarray[i]
+		if xname is not None:
+			if l:
+				setattr(o, xname, data[j:j+l])
+			else:
+				setattr(o, xname, data[j])
+		j += l if l else 1
+	return o
+
+def _report(name, seconds, count, baseline=None):
+	s = '{:40s} {:10.1f} ns/op {:12.0f} op/s'.format(name, seconds / count * 1e9, count / seconds)
+	if baseline is not None:
+		s += '  (x{:.2f})'.format(baseline / seconds)
+	print(s)
+
+#  zstruct: Elf64_Shdr.init_from のスループット
+def bench_zstruct(count=200000):
+	T = elf.Elf64_Shdr
+	data = bytes(range(T.struct_length))
+	endian = zstruct.ENDIAN_LITTLE
+	t0 = min(timeit.repeat(lambda: _legacy_init_from(T, data, endian), number=count, repeat=3))
+	t1 = min(timeit.repeat(lambda: T.init_from(data, endian=endian), number=count, repeat=3))
+	_report('Elf64_Shdr.init_from (legacy)', t0, count)
+	_report('Elf64_Shdr.init_from', t1, count, t0)
+
+#  zstruct 構造体と同じメンバーを持つ別のクラスを生成する (比較用)
+def _zstruct_variant(T, **kwargs):
+	counts = re.findall('([0-9]*)([^0-9])', T.__struct_format__)
+	members = []
+	for name, (n, ch) in zip(T.__struct_names__, counts):
+		members.append((name, '[{}]{}'.format(n, ch) if n else ch))
+	return zstruct.zstruct(*members, default_endian=T.__struct_endian__, **kwargs)(type(T.__name__, (), {}))
+
+def _bytes_per_instance(T, data, count):
+	tracemalloc.start()
+	try:
+		before = tracemalloc.get_traced_memory()[0]
+		objs = [T.init_from(data) for i in range(count)]
+		after  = tracemalloc.get_traced_memory()[0]
+	finally:
+		tracemalloc.stop()
+	del objs
+	return (after - before) / count
+
+#  zstruct: slots=True によるヘッダーあたりのメモリ使用量
+def bench_zstruct_memory(count=20000):
+	for T in [elf.Elf64_Shdr, elf.Elf64_Phdr, elf.Elf64_Dyn]:
+		data = bytes(T.struct_length)
+		b0 = _bytes_per_instance(_zstruct_variant(T), data, count)
+		b1 = _bytes_per_instance(_zstruct_variant(T, slots=True), data, count)
+		print('{:20s} {:8.1f} bytes/header (__dict__)  {:8.1f} bytes/header (__slots__)'.format(T.__name__, b0, b1))
+
+#  名前の列から .dynsym 相当のシンボルテーブルを作る (0 番目は空のシンボル)
+#  hash_type が 'gnu' の場合は symoffset 以降を正しくハッシュした DT_GNU_HASH を、
+#  'gnu-unhashed' の場合はハッシュを記録していない (バケット・チェーンが 0 の) DT_GNU_HASH を、
+#  'sysv' の場合は DT_HASH を付ける。
+def _synthetic_symbol_table(names, hash_type, symoffset=1, nbuckets=64):
+	names = [b''] + list(names)
+	if hash_type == 'gnu':
+		# GNU 形式ではハッシュするシンボルをバケット順に並べる必要がある
+		names[symoffset:] = sorted(names[symoffset:], key=lambda n: elffile.gnu_hash(n) % nbuckets)
+	strtab = bytearray(b'\0')
+	data = bytearray()
+	for name in names:
+		data += struct.pack('<IBBHQQ', len(strtab) if name else 0, 0x12, 0, 1, 0, 0)
+		if name:
+			strtab += name + b'\0'
+	symtab = elffile.ELFSymbolTable(elf.Elf64_Sym, bytes(data), len(names), elf.Elf64_Sym.struct_length,
+		zstruct.ENDIAN_LITTLE, elffile.ELFStringTable(strtab))
+	if hash_type == 'sysv':
+		buckets = array.array('I', [0] * nbuckets)
+		chain   = array.array('I', [0] * len(names))
+		for i in range(1, len(names)):
+			b = elffile.sysv_hash(names[i]) % nbuckets
+			chain[i] = buckets[b]
+			buckets[b] = i
+		symtab.hash_table = elffile.ELFSysvHashTable(buckets, chain)
+	elif hash_type == 'gnu':
+		bloom   = array.array('Q', [0] * 4)
+		buckets = array.array('I', [0] * nbuckets)
+		chain   = array.array('I', [0] * (len(names) - symoffset))
+		for i in range(symoffset, len(names)):
+			h = elffile.gnu_hash(names[i])
+			bloom[(h // 64) % len(bloom)] |= (1 << (h % 64)) | (1 << ((h >> 6) % 64))
+			if buckets[h % nbuckets] == 0:
+				buckets[h % nbuckets] = i
+			last = i + 1 == len(names) or elffile.gnu_hash(names[i + 1]) % nbuckets != h % nbuckets
+			chain[i - symoffset] = (h & ~1) | last
+		symtab.hash_table = elffile.ELFGnuHashTable(symoffset, 6, bloom, 64, buckets, chain)
+	elif hash_type == 'gnu-unhashed':
+		symtab.hash_table = elffile.ELFGnuHashTable(symoffset, 6, array.array('Q', [0]),
+			64, array.array('I', [0]), array.array('I', [0] * (len(names) - symoffset)))
+	return symtab
+
+#  ELFSymbolTable.lookup: ハッシュテーブルの形式ごとの検索と、結果が名前の索引と一致することの確認
+#  (ハッシュテーブルに含まれないシンボルも見つかる必要がある)
+def bench_symbols(nsymbols=2000, count=20000):
+	names = [('sym_{}'.format(i)).encode('ascii') for i in range(nsymbols)]
+	missing = [('missing_{}'.format(i)).encode('ascii') for i in range(nsymbols // 10)]
+	reference = _synthetic_symbol_table(names, None)
+	expected = {name: reference.get_name(reference.lookup(name)) for name in names}
+	for hash_type, symoffset in (('sysv', 1), ('gnu', 1), ('gnu', nsymbols // 2), ('gnu-unhashed', 1)):
+		symtab = _synthetic_symbol_table(names, hash_type, symoffset)
+		for name in names:
+			i = symtab.lookup(name)
+			if i is None or symtab.get_name(i) != expected[name]:
+				raise AssertionError('{}: シンボル {} が見つかりません。'.format(hash_type, name))
+		if any(symtab.lookup(name) is not None for name in missing):
+			raise AssertionError('{}: 存在しないシンボルが見つかりました。'.format(hash_type))
+		r = random.Random(9)
+		queries = [r.choice(names) for i in range(count)]
+		t = min(timeit.repeat(lambda: [symtab.lookup(name) for name in queries], number=1, repeat=3))
+		_report('lookup ({}, symoffset={})'.format(hash_type, symoffset), t, count)
+
+#  以前の StringsFeature の実装 (比較用)
+def _legacy_strings(data):
+	feature = {}
+	s = bytearray()
+	for ch in data:
+		if ch >= 0x20 and ch < 0x7f:
+			s.append(ch)
+		else:
+			if len(s) >= 4:
+				s = bytes(s)
+				if s not in feature:
+					feature[s] = 1
+				else:
+					feature[s] += 1
+			s = bytearray()
+	if len(s) >= 4:
+		s = bytes(s)
+		if s not in feature:
+			feature[s] = 1
+		else:
+			feature[s] += 1
+	return feature
+
+#  ベンチマーク用のデータ (FileData と同じく data 属性を持つ)
+class _SyntheticData:
+	def __init__(self, data):
+		self.data = data
+
+#  印字可能な文字列とバイナリが混在する合成データ
+def _synthetic_binary(size, seed=0):
+	r = random.Random(seed)
+	words = [bytes(r.choice(b'abcdefghijklmnopqrstuvwxyz_./%0123456789') for j in range(r.randint(2, 24))) for i in range(4096)]
+	noise = bytes(r.getrandbits(8) for i in range(65536))
+	chunks = []
+	n = 0
+	while n < size:
+		if r.random() < 0.5:
+			c = r.choice(words)
+		else:
+			i = r.randrange(len(noise) - 64)
+			c = noise[i:i+r.randint(1, 64)]
+		chunks.append(c)
+		n += len(c)
+	return b''.join(chunks)[:size]
+
+def _time(func):
+	t0 = time.perf_counter()
+	result = func()
+	return time.perf_counter() - t0, result
+
+#  StringsFeature: 1/10/100 MB の合成データからの抽出 (以前の実装は legacy_max 以下のサイズのみ)
+def bench_strings(sizes=(1, 10, 100), legacy_max=1):
+	base = _synthetic_binary(1 << 20)
+	feature = features.StringsFeature()
+	for mb in sizes:
+		data = _SyntheticData(base * mb)
+		t1, f1 = _time(lambda: feature.get_feature(data))
+		if mb <= legacy_max:
+			t0, f0 = _time(lambda: _legacy_strings(data.data))
+			if f0 != f1 or list(f0.items()) != list(f1.items()):
+				raise AssertionError('StringsFeature の結果が以前の実装と一致しません。')
+			print('{:4d} MB  legacy {:8.3f} s  new {:8.3f} s  (x{:.1f})'.format(mb, t0, t1, t0 / t1))
+		else:
+			print('{:4d} MB  legacy {:>8s}    new {:8.3f} s'.format(mb, '-', t1))
+
+#  以前の C4_5DecisionLearner による決定木の構築 (比較用)
+#  ノードごとに全行・全決定器を数え直し、分岐ごとに行をコピーする。
+def _legacy_make_tree(data, used_, reprs):
+	def impurity(n0, n1):
+		n = n0 + n1
+		if n == 0:
+			return 0.0
+		p0 = float(n0) / n
+		p1 = 1.0 - p0
+		return -((0 if p0 == 0 else p0 * math.log2(p0)) + (0 if p1 == 0 else p1 * math.log2(p1)))
+	used = set(used_)
+	ndecider = len(data[0]) - 1
+	countx1 = sum(1 for d in data if d[0])
+	countx0 = len(data) - countx1
+	impurity_teacher = impurity(countx0, countx1)
+	mgainrat = None
+	for i in range(1, ndecider + 1):
+		if i in used:
+			continue
+		c = [[0, 0], [0, 0]]
+		for d in data:
+			c[1 if d[i] else 0][1 if d[0] else 0] += 1
+		count0x = c[0][0] + c[0][1]
+		count1x = c[1][0] + c[1][1]
+		impurity_decider = \
+			float(count0x) / len(data) * impurity(c[0][0], c[0][1]) + \
+			float(count1x) / len(data) * impurity(c[1][0], c[1][1])
+		gainratio = (impurity_teacher - impurity_decider) / (impurity(count0x, count1x) + 0.001)
+		if mgainrat is None or gainratio > mgainrat:
+			isplit, mgainrat, t = i, gainratio, c
+	used.add(isplit)
+	o = {'idx': isplit - 1, 'decider': reprs[isplit - 1], 'gainratio': mgainrat}
+	if len(used) == ndecider or mgainrat == 0.0:
+		v = t[0][0] + t[1][1] < t[0][1] + t[1][0]
+		o['b0'] = {'value': v}
+		o['b1'] = {'value': not v}
+		return o
+	for b in (0, 1):
+		if   t[b][0] == 0:
+			o['b{}'.format(b)] = {'value': True}
+		elif t[b][1] == 0:
+			o['b{}'.format(b)] = {'value': False}
+		else:
+			o['b{}'.format(b)] = _legacy_make_tree([x for x in data if x[isplit] == bool(b)], used, reprs)
+	return o
+
+#  教師が一部の決定器に (ノイズ付きで) 依存する合成学習データ
+def _synthetic_learned_rows(nrows, ndeciders, seed=0):
+	r = random.Random(seed)
+	rows = []
+	for i in range(nrows):
+		row = [r.random() < 0.3 for j in range(ndeciders)]
+		teacher = (row[0] and not row[1]) or (row[2] and row[3]) or r.random() < 0.05
+		rows.append([teacher] + row)
+	return rows
+
+#  葉の学習データの件数と信頼度 (以前の実装には無い) を取り除く
+def _strip_leaf_counts(obj):
+	if 'value' in obj:
+		return {'value': obj['value']}
+	return dict(obj, b0=_strip_leaf_counts(obj['b0']), b1=_strip_leaf_counts(obj['b1']))
+
+#  C4_5DecisionLearner.make_decision_tree: ビット集合による集計と以前の実装の比較
+def bench_tree(nrows=2000, ndeciders=200):
+	rows = _synthetic_learned_rows(nrows, ndeciders)
+	deciders = [decisions.PartialStringsDecisionFast('d{}'.format(i)) for i in range(ndeciders)]
+	reprs = [repr(d) for d in deciders]
+	learner = c4_5.C4_5DecisionLearner(None, deciders)
+	learner.load_learned_data(rows)
+	t0, tree0 = _time(lambda: _legacy_make_tree(rows, set(), reprs))
+	t1, tree1 = _time(lambda: learner.make_decision_tree().to_json_object())
+	if tree0 != _strip_leaf_counts(tree1):
+		raise AssertionError('決定木が以前の実装と一致しません。')
+	print('{} rows x {} deciders  legacy {:8.3f} s  new {:8.3f} s  (x{:.1f})'.format(nrows, ndeciders, t0, t1, t0 / t1))
+
+#  以前の C4_5Decision.decide の実装 (比較用)
+def _legacy_tree_decide(decisionObjects, decisionTree, data):
+	elem = decisionTree
+	while True:
+		if isinstance(elem, c4_5.C4_5DecisionLeaf):
+			return elem.value
+		if decisionObjects[elem.idx].decide(data):
+			elem = elem.branch1
+		else:
+			elem = elem.branch0
+
+#  data.bits の指定した位置の値を返す決定器
+class _BitDecision:
+	def __init__(self, index):
+		self.index = index
+	def decide(self, data):
+		return data.bits[self.index]
+	def __repr__(self):
+		return '{}({})'.format(type(self).__name__, self.index)
+
+def _random_tree(r, ndeciders, depth):
+	if depth == 0 or r.random() < 0.1:
+		return c4_5.C4_5DecisionLeaf(r.random() < 0.5)
+	branch = c4_5.C4_5DecisionBranch(r.randrange(ndeciders))
+	branch.branch0 = _random_tree(r, ndeciders, depth - 1)
+	branch.branch1 = _random_tree(r, ndeciders, depth - 1)
+	return branch
+
+#  片側が常に葉となる (深さ depth の) 細長い木
+def _random_chain(r, ndeciders, depth):
+	if depth == 0:
+		return c4_5.C4_5DecisionLeaf(r.random() < 0.5)
+	branch = c4_5.C4_5DecisionBranch(r.randrange(ndeciders))
+	if r.random() < 0.5:
+		branch.branch0 = c4_5.C4_5DecisionLeaf(r.random() < 0.5)
+		branch.branch1 = _random_chain(r, ndeciders, depth - 1)
+	else:
+		branch.branch0 = _random_chain(r, ndeciders, depth - 1)
+		branch.branch1 = c4_5.C4_5DecisionLeaf(r.random() < 0.5)
+	return branch
+
+#  C4_5Decision: コンパイルした決定木と以前の実装 (木をたどる) の比較
+#  ランダムな木とデータで、入れ子の if 文・配列による評価の結果が一致することを確かめる。
+def bench_tree_decide(ntrees=200, nsamples=200, ndeciders=64, depth=12, count=100000):
+	r = random.Random(0)
+	deciders = [_BitDecision(i) for i in range(ndeciders)]
+	samples = []
+	for i in range(nsamples):
+		sample = _SyntheticData(None)
+		sample.bits = [r.random() < 0.5 for j in range(ndeciders)]
+		samples.append(sample)
+	for i in range(ntrees):
+		if i % 4 == 3:
+			tree = _random_chain(r, ndeciders, 200)
+		else:
+			tree = _random_tree(r, ndeciders, r.choice([0, 1, depth]))
+		tree = c4_5.C4_5DecisionBranch.from_json_object(tree.to_json_object())
+		nested = c4_5.compile_decision_tree(deciders, tree, max_depth=1000)
+		flat   = c4_5.compile_decision_tree(deciders, tree, max_depth=-1)
+		decision = c4_5.C4_5Decision(deciders, tree)
+		for sample in samples:
+			expected = _legacy_tree_decide(deciders, tree, sample)
+			if nested(sample) != expected or flat(sample) != expected or decision.decide(sample) != expected:
+				raise AssertionError('コンパイルした決定木の結果が一致しません。')
+	tree = _random_tree(random.Random(1), ndeciders, depth)
+	nested = c4_5.compile_decision_tree(deciders, tree)
+	flat   = c4_5.compile_decision_tree(deciders, tree, max_depth=-1)
+	samples = [samples[i % nsamples] for i in range(count)]
+	t0, x = _time(lambda: [_legacy_tree_decide(deciders, tree, s) for s in samples])
+	t1, x = _time(lambda: [nested(s) for s in samples])
+	t2, x = _time(lambda: [flat(s) for s in samples])
+	_report('C4_5Decision.decide (legacy)', t0, count)
+	_report('C4_5Decision.decide (nested if)', t1, count, t0)
+	_report('C4_5Decision.decide (flat array)', t2, count, t0)
+
+#  文字列型の決定器が並ぶ (いずれかにマッチすれば True となる) 細長い木
+def _pattern_chain(start, count):
+	if start == count:
+		return c4_5.C4_5DecisionLeaf(False)
+	branch = c4_5.C4_5DecisionBranch(start)
+	branch.branch0 = _pattern_chain(start + 1, count)
+	branch.branch1 = c4_5.C4_5DecisionLeaf(True)
+	return branch
+
+#  C4_5Decision.decide_batch: ファイルごとの判定とまとめた判定の比較
+#  決定器の半分は文字列型 (まとめて走査できる)、残りは data.bits を参照する。
+#  ランダムな木と、文字列型の決定器が多数並ぶ木のそれぞれについて計測する。
+def bench_tree_batch(nsamples=1000, ndeciders=256, depth=12, size=65536):
+	r = random.Random(2)
+	words = ['w{:03d}x'.format(i) for i in range(ndeciders // 2)]
+	deciders  = [decisions.PartialStringsDecisionFast(w) for w in words]
+	deciders += [_BitDecision(i) for i in range(ndeciders - len(words))]
+	base = _synthetic_binary(size)
+	samples = []
+	for i in range(nsamples):
+		present = [w.encode('ASCII') for w in words if r.random() < 0.01]
+		sample = _SyntheticData(base + b'\0'.join(present))
+		sample.bits = [r.random() < 0.5 for j in range(ndeciders)]
+		samples.append(sample)
+	trees = [
+		('random', _random_tree(r, ndeciders, depth)),
+		('pattern chain', _pattern_chain(0, len(words))),
+	]
+	for name, tree in trees:
+		decision = c4_5.C4_5Decision(deciders, tree)
+		t0, r0 = _time(lambda: [decision.decide(s) for s in samples])
+		t1, r1 = _time(lambda: list(decision.decide_batch(samples)))
+		if r0 != r1:
+			raise AssertionError('decide_batch の結果が decide と一致しません。')
+		_report('decide ({})'.format(name), t0, nsamples)
+		_report('decide_batch ({})'.format(name), t1, nsamples, t0)
+
+#  data.bits の指定した位置の値を、一定の時間をかけて返す決定器
+class _SlowBitDecision(_BitDecision):
+	def __init__(self, index, seconds):
+		super().__init__(index)
+		self.seconds = seconds
+	def decide(self, data):
+		t = time.perf_counter() + self.seconds
+		while time.perf_counter() < t:
+			pass
+		return data.bits[self.index]
+
+#  decisionopt.optimize_decision: 評価の順序が不適切な AND/OR の最適化
+#  (高価で真になりやすい決定器が、安価で偽になりやすい決定器より前にある)
+def bench_decisionopt(nsamples=500):
+	r = random.Random(3)
+	rates = [0.9, 0.1, 0.9, 0.1, 0.5, 0.05]
+	samples = []
+	for i in range(nsamples):
+		sample = _SyntheticData(None)
+		sample.bits = [r.random() < p for p in rates]
+		samples.append(sample)
+	slow0 = _SlowBitDecision(0, 100e-6)
+	fast1 = _BitDecision(1)
+	slow2 = _SlowBitDecision(2, 50e-6)
+	fast3 = _BitDecision(3)
+	slow4 = _SlowBitDecision(4, 20e-6)
+	fast5 = _BitDecision(5)
+	decision = decisions.DecisionCombination_OR(
+		decisions.DecisionCombination_AND(decisions.DecisionCombination_AND(slow0, slow2), fast1),
+		decisions.DecisionCombination_OR(slow4, decisions.DecisionCombination_AND(fast3, fast5)))
+	optimized, report = decisionopt.optimize_decision(decision, samples)
+	for sample in samples:
+		if decision.decide(sample) != optimized.decide(sample):
+			raise AssertionError('最適化した決定器の結果が一致しません。')
+	print(repr(optimized))
+	print('expected {:10.1f} us -> {:10.1f} us  (saving {:5.1f} %)'.format(
+		report['expected_cost_before'] * 1e6, report['expected_cost_after'] * 1e6, report['expected_saving'] * 100))
+	print('measured {:10.1f} us -> {:10.1f} us  (saving {:5.1f} %)'.format(
+		report['measured_cost_before'] * 1e6, report['measured_cost_after'] * 1e6, report['measured_saving'] * 100))
+
+#  プロセスの最大常駐メモリー (MB)
+def _max_rss_mb():
+	import resource
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+#  FileData: streaming=True (mmap) と通常の読み込みの比較
+#  最大常駐メモリーは減少しないため、増加量の小さい streaming=True から計測する。
+def bench_filedata(size_mb=64):
+	with tempfile.NamedTemporaryFile() as f:
+		for i in range(size_mb):
+			f.write(os.urandom(1 << 20))
+		f.flush()
+		for streaming in (True, False):
+			rss0 = _max_rss_mb()
+			def run():
+				data = filedata.FileData(f.name, streaming=streaming)
+				data.sha256
+				data.get_feature(features.FileEntropyFeature())
+				return data
+			t, data = _time(run)
+			rss1 = _max_rss_mb()
+			if streaming:
+				sha256 = data.sha256
+				data.close()
+			elif data.sha256 != sha256:
+				raise AssertionError('SHA-256 が一致しません。')
+			del data
+			print('{:4d} MB  streaming={!s:5s}  {:8.3f} s  max RSS +{:8.1f} MB'.format(size_mb, streaming, t, rss1 - rss0))
+
+#  ファイルの SHA-256 による教師 (ベンチマーク用)
+class _HashTeacher:
+	def decide(self, data):
+		return data.sha256 < '8'
+	def __repr__(self):
+		return '_HashTeacher()'
+
+#  FeatureStore: 決定器を追加して学習し直す場合の、ストアの有無による比較
+def bench_featurestore(nfiles=200, ndeciders=10, nadded=10, size=65536):
+	r = random.Random(4)
+	base = _synthetic_binary(size)
+	words = [b'word%04d' % i for i in range(ndeciders + nadded)]
+	deciders = [decisions.StringsExistenceDecision(w) for w in words]
+	with tempfile.TemporaryDirectory() as tmpdir:
+		files = []
+		for i in range(nfiles):
+			path = os.path.join(tmpdir, 'f{:04d}'.format(i))
+			with open(path, 'wb') as f:
+				f.write(bytes([i & 0xff]) + base + b'\0'.join(w for w in words if r.random() < 0.3))
+			files.append(path)
+		store = featurestore.FeatureStore(os.path.join(tmpdir, 'store.sqlite'))
+		learner = c4_5.C4_5DecisionLearner(_HashTeacher(), deciders[:ndeciders])
+		t0, x = _time(lambda: learner.learn(files, store=store))
+		learner = c4_5.C4_5DecisionLearner(_HashTeacher(), deciders)
+		t1, x = _time(lambda: learner.learn(files))
+		rows = list(learner.learnedData)
+		t2, x = _time(lambda: learner.learn(files, store=store))
+		if list(learner.learnedData) != rows:
+			raise AssertionError('特徴量ストアを用いた学習データが一致しません。')
+		store.close()
+	print('{} files  initial ({} deciders) {:8.3f} s'.format(nfiles, ndeciders, t0))
+	print('{} files  +{} deciders  no store {:8.3f} s  store {:8.3f} s  (x{:.1f})'.format(nfiles, nadded, t1, t2, t1 / t2))
+
+#  C4_5DecisionLearner.add_deciders: 決定器を追加した場合の、学習し直しとの比較
+def bench_incremental(nfiles=200, ndeciders=50, nadded=5, size=262144):
+	r = random.Random(5)
+	base = _synthetic_binary(size)
+	words = [b'word%04d' % i for i in range(ndeciders + nadded)]
+	deciders = [decisions.StringsDecisionFast(w.decode('ASCII')) for w in words]
+	with tempfile.TemporaryDirectory() as tmpdir:
+		files = []
+		for i in range(nfiles):
+			path = os.path.join(tmpdir, 'f{:04d}'.format(i))
+			with open(path, 'wb') as f:
+				f.write(bytes([i & 0xff]) + base + b'\0'.join(w for w in words if r.random() < 0.3))
+			files.append(path)
+		learner = c4_5.C4_5DecisionLearner(_HashTeacher(), deciders[:ndeciders])
+		learner.learn(files)
+		t0, x = _time(lambda: learner.add_deciders(deciders[ndeciders:]))
+		full = c4_5.C4_5DecisionLearner(_HashTeacher(), deciders)
+		t1, x = _time(lambda: full.learn(files))
+		if list(learner.learnedData) != list(full.learnedData):
+			raise AssertionError('決定器を追加した学習データが一致しません。')
+		learnedFile = os.path.join(tmpdir, 'learned.bin')
+		learner.save_learned_data(learnedFile)
+		nbytes = os.path.getsize(learnedFile)
+	print('{} files x {} deciders  +{}  relearn {:8.3f} s  add_deciders {:8.3f} s  (x{:.1f})  saved {} bytes'.format(
+		nfiles, ndeciders, nadded, t1, t0, t1 / t0, nbytes))
+
+#  data.values の指定した位置の値を返す数値の決定器
+class _ValueColumn(decision.NumericValue):
+	def __init__(self, index):
+		self.index = index
+	def get_value(self, data):
+		return data.values[self.index]
+	def __repr__(self):
+		return '_ValueColumn({})'.format(self.index)
+
+#  data.values の指定した位置の値がしきい値より大きいかを返す決定器 (手作業によるバケット化)
+class _ValueThreshold:
+	def __init__(self, index, threshold):
+		self.index     = index
+		self.threshold = threshold
+	def decide(self, data):
+		return data.values[self.index] > self.threshold
+	def __repr__(self):
+		return '_ValueThreshold({}, {})'.format(self.index, self.threshold)
+
+#  C4_5DecisionLearner: 数値の列と、しきい値ごとの決定器 (nbuckets 個ずつ) による学習の比較
+def bench_numeric(nrows=2000, nfeatures=8, nbuckets=32):
+	r = random.Random(6)
+	samples = []
+	for i in range(nrows):
+		sample = _SyntheticData(None)
+		sample.values = [r.random() for j in range(nfeatures)]
+		v = sample.values
+		sample.teacher = (v[0] > 0.63 and v[1] < 0.27) or v[2] > 0.91 or r.random() < 0.02
+		samples.append(sample)
+	numeric = [_ValueColumn(j) for j in range(nfeatures)]
+	bucketed = [_ValueThreshold(j, (k + 1) / float(nbuckets + 1)) for j in range(nfeatures) for k in range(nbuckets)]
+	results = []
+	for name, objects in (('numeric', numeric), ('bucketed', bucketed)):
+		learner = c4_5.C4_5DecisionLearner(None, objects)
+		def evaluate():
+			rows = []
+			for sample in samples:
+				row = [sample.teacher]
+				row.extend(o.get_value(sample) if isinstance(o, decision.NumericValue) else o.decide(sample) for o in objects)
+				rows.append(row)
+			return rows
+		t0, rows = _time(evaluate)
+		learner.load_learned_data(rows)
+		t, tree = _time(learner.make_decision_tree)
+		d = c4_5.C4_5Decision(objects, tree)
+		flat = c4_5.compile_decision_tree(objects, tree, max_depth=-1)
+		verdicts = [d.decide(s) for s in samples]
+		if verdicts != [flat(s) for s in samples] or verdicts != list(d.decide_batch(samples)):
+			raise AssertionError('コンパイルした決定木の結果が一致しません。')
+		accuracy = sum(1 for s, v in zip(samples, verdicts) if s.teacher == v) / float(nrows)
+		print('{:8s} {:4d} columns  evaluate {:8.3f} s  make_decision_tree {:8.3f} s  depth {:3d}  accuracy {:6.2f} %'.format(
+			name, len(objects), t0, t, c4_5._tree_depth(tree), accuracy * 100))
+
+#  決定器の評価回数を数える (評価回数の実測用)
+class _CountingDecision:
+	def __init__(self, decision):
+		self.decision = decision
+		self.calls    = 0
+	def decide(self, data):
+		self.calls += 1
+		return self.decision.decide(data)
+	def get_value(self, data):
+		self.calls += 1
+		return self.decision.get_value(data)
+
+#  C4_5DecisionLearner: 深さ・分割する行数の制限と悲観的誤り率による枝刈りの、
+#  決定器の評価回数 (学習データから見積もった期待値と、テストデータでの実測値) と精度への影響
+def bench_prune(nrows=4000, nfeatures=8, nbuckets=16, noise=0.1):
+	r = random.Random(8)
+	samples = []
+	for i in range(nrows * 2):
+		sample = _SyntheticData(None)
+		sample.values = [r.random() for j in range(nfeatures)]
+		v = sample.values
+		sample.teacher = ((v[0] > 0.63 and v[1] < 0.27) or v[2] > 0.91) != (r.random() < noise)
+		samples.append(sample)
+	train, test = samples[:nrows], samples[nrows:]
+	objects = [_ValueThreshold(j, (k + 1) / float(nbuckets + 1)) for j in range(nfeatures) for k in range(nbuckets)]
+	learner = c4_5.C4_5DecisionLearner(None, objects)
+	learner.load_learned_data([[s.teacher] + [o.decide(s) for o in objects] for s in train])
+	def measure(tree):
+		counting = [_CountingDecision(o) for o in objects]
+		d = c4_5.C4_5Decision(counting, tree)
+		correct = sum(1 for s in test if d.decide(s) == s.teacher)
+		return sum(c.calls for c in counting) / float(len(test)), correct / float(len(test)) * 100
+	t, full = _time(learner.make_decision_tree)
+	t1, (pruned, report) = _time(lambda: c4_5.prune_decision_tree(full))
+	trees = [
+		('full', t, full),
+		('pruned', t + t1, pruned),
+		('max_depth=6', None, learner.make_decision_tree(max_depth=6)),
+		('min_split=50', None, learner.make_decision_tree(min_samples_split=50)),
+	]
+	for name, seconds, tree in trees:
+		stats = c4_5.decision_tree_stats(tree)
+		calls, accuracy = measure(tree)
+		print('{:12s} depth {:3d}  leaves {:4d}  evaluations/file expected {:6.2f}  measured {:6.2f}  accuracy {:6.2f} %{}'.format(
+			name, stats['depth'], stats['leaves'], stats['expected_evaluations'], calls, accuracy,
+			'' if seconds is None else '  ({:.3f} s)'.format(seconds)))
+	print('pruning: expected evaluations {:.2f} -> {:.2f} ({:.1f} % saved)'.format(
+		report['expected_evaluations_before'], report['expected_evaluations_after'], report['expected_saving'] * 100))
+
+#  C4_5ForestLearner: 逐次・並列での学習時間と、単一の決定木との精度・決定器の評価回数の比較
+def bench_forest(nrows=4000, nfeatures=8, nbuckets=16, ntrees=32, workers=4):
+	r = random.Random(7)
+	samples = []
+	for i in range(nrows * 2):
+		sample = _SyntheticData(None)
+		sample.values = [r.random() for j in range(nfeatures)]
+		v = sample.values
+		sample.teacher = (v[0] > 0.63 and v[1] < 0.27) or v[2] + v[3] > 1.6 or r.random() < 0.05
+		samples.append(sample)
+	train, test = samples[:nrows], samples[nrows:]
+	objects = [_ValueThreshold(j, (k + 1) / float(nbuckets + 1)) for j in range(nfeatures) for k in range(nbuckets)]
+	learner = c4_5.C4_5DecisionLearner(None, objects)
+	learner.load_learned_data([[s.teacher] + [o.decide(s) for o in objects] for s in train])
+	t, tree = _time(learner.make_decision_tree)
+	single = c4_5.C4_5Decision(objects, tree)
+	def accuracy(d):
+		return sum(1 for s in test if d.decide(s) == s.teacher) / float(len(test)) * 100
+	print('single   1 tree    make {:8.3f} s  accuracy {:6.2f} %'.format(t, accuracy(single)))
+	trainer = forest.C4_5ForestLearner(learner)
+	t0, trees = _time(lambda: trainer.make_forest(ntrees))
+	t1, treesp = _time(lambda: trainer.make_forest(ntrees, workers=workers))
+	if [x.to_json_object() for x in trees] != [x.to_json_object() for x in treesp]:
+		raise AssertionError('並列に作った決定木が一致しません。')
+	d = forest.C4_5ForestDecision(objects, trees)
+	acc = accuracy(d)
+	calls = sum(d.decider_calls())
+	unshared = sum(c4_5._tree_depth(x) for x in trees)
+	print('forest {:3d} trees   make {:8.3f} s  (workers={}: {:8.3f} s)  accuracy {:6.2f} %'.format(ntrees, t0, workers, t1, acc))
+	print('decider evaluations per file: {:8.2f} (at most {} without sharing)'.format(calls / float(len(test)), unshared))
+
+BENCHMARKS = {
+	'zstruct': bench_zstruct,
+	'zstruct_memory': bench_zstruct_memory,
+	'symbols': bench_symbols,
+	'strings': bench_strings,
+	'tree': bench_tree,
+	'tree_decide': bench_tree_decide,
+	'tree_batch': bench_tree_batch,
+	'decisionopt': bench_decisionopt,
+	'filedata': bench_filedata,
+	'featurestore': bench_featurestore,
+	'incremental': bench_incremental,
+	'numeric': bench_numeric,
+	'forest': bench_forest,
+	'prune': bench_prune,
+}
+
+def main(args):
+	names = args if args else list(BENCHMARKS.keys())
+	for name in names:
+		if name not in BENCHMARKS:
+			raise ValueError('`{}\': 不明なベンチマーク名です。'.format(name))
+		print('[{}]'.format(name))
+		BENCHMARKS[name]()
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -22,12 +22,28 @@
 #	PERFORMANCE OF THIS SOFTWARE.
 #
 #
+import array
+import ast
+import concurrent.futures
+import functools
+import json
 import math
+import os
+import statistics
+import struct
+import sys
+import time
+from .decision import NumericValue
+from .filedata import FileData
+from .multipattern import MultiPatternMatcher
 
+#  threshold が None でない場合、決定器は NumericValue であり、その値が threshold
+#  より大きければ branch1、そうでなければ branch0 に分岐する
 class C4_5DecisionBranch:
-	def __init__(self, idxOfDecider, reprOfDecider=None):
+	def __init__(self, idxOfDecider, reprOfDecider=None, threshold=None):
 		self.idx = idxOfDecider
 		self.drepr = reprOfDecider
+		self.threshold = threshold
 		self.gainratio = None
 		self.branch0 = None
 		self.branch1 = None
@@ -36,6 +52,8 @@ class C4_5DecisionBranch:
 		o['idx'] = self.idx
 		if self.drepr is not None:
 			o['decider'] = self.drepr
+		if self.threshold is not None:
+			o['threshold'] = self.threshold
 		if self.gainratio is not None:
 			o['gainratio'] = self.gainratio
 		o['b0'] = self.branch0.to_json_object()
@@ -45,165 +63,933 @@ class C4_5DecisionBranch:
 	def from_json_object(obj):
 		if ('idx' not in obj) and ('value' in obj):
 			return C4_5DecisionLeaf.from_json_object(obj)
-		branch = C4_5DecisionBranch(obj['idx'])
-		if 'gainratio' in branch:
+		branch = C4_5DecisionBranch(obj['idx'], obj.get('decider'), obj.get('threshold'))
+		if 'gainratio' in obj:
 			branch.gainratio = obj['gainratio']
 		branch.branch0 = C4_5DecisionBranch.from_json_object(obj['b0'])
 		branch.branch1 = C4_5DecisionBranch.from_json_object(obj['b1'])
 		return branch
 
+#  counts には、葉に到達した学習データの (教師 False の件数, 教師 True の件数) を与える
+#  (reliability は、その葉の値と教師が一致する学習データの割合となる)
 class C4_5DecisionLeaf:
-	def __init__(self, value):
+	def __init__(self, value, counts=None):
 		self.value = value
+		self.counts = counts
 		self.reliability = 1.0
+		if counts is not None and sum(counts) > 0:
+			self.reliability = float(counts[1] if value else counts[0]) / sum(counts)
 	def to_json_object(self):
 		o = {}
 		o['value'] = self.value
 		if self.reliability != 1.0:
 			o['reliability'] = self.reliability
+		if self.counts is not None:
+			o['counts'] = list(self.counts)
 		return o
 	@staticmethod
 	def from_json_object(obj):
-		leaf = C4_5DecisionLeaf(obj['value'])
+		leaf = C4_5DecisionLeaf(obj['value'], tuple(obj['counts']) if 'counts' in obj else None)
 		if 'reliability' in obj:
 			leaf.reliability = obj['reliability']
 		return leaf
 
+#  不純度 (同じ件数の組について何度も計算されるため、結果をキャッシュする)
+@functools.lru_cache(maxsize=65536)
+def _impurity(n0, n1):
+	n = n0 + n1
+	if n == 0:
+		return 0.0
+	p0 = float(n0) / n
+	p1 = 1.0 - p0
+	return -((0 if p0 == 0 else p0 * math.log2(p0)) + (0 if p1 == 0 else p1 * math.log2(p1)))
+
+if hasattr(int, 'bit_count'):
+	_popcount = int.bit_count
+else:
+	def _popcount(x):
+		return bin(x).count('1')
+
+__BITS_TO_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+
+#  真偽値の列をビット集合 (第 r ビットが r 番目の値) に変換する
+def _bits_from_values(values):
+	digits = bytes(map(bool, reversed(values))).translate(__BITS_TO_DIGITS)
+	return int(digits, 2) if digits else 0
+
+__DIGITS_TO_BITS = bytes.maketrans(b'01', b'\x00\x01')
+
+#  ビット集合を、n 個の値 (0 か 1) のバイト列に変換する
+def _values_from_bits(bits, n):
+	return bin(bits)[2:].zfill(n)[::-1].encode('ASCII').translate(__DIGITS_TO_BITS)[:n]
+
+#  数値の列 (array.array('d')) をファイルに書き出す形式 (リトルエンディアン) に変換する
+def _numeric_to_bytes(column):
+	if sys.byteorder != 'little':
+		column = array.array('d', column)
+		column.byteswap()
+	return column.tobytes()
+
+def _numeric_from_bytes(b):
+	column = array.array('d')
+	column.frombytes(b)
+	if sys.byteorder != 'little':
+		column.byteswap()
+	return column
+
+#  学習データのファイルの形式
+#  マジック, 行数, 列数, メタデータ (JSON) の長さ, メタデータ, 列の種類 (列ごとに 1 バイト;
+#  0: 真偽値, 1: 数値), 各列の値の順に並ぶ。真偽値の列はビット集合 ((行数 + 7) // 8
+#  バイトのリトルエンディアン)、数値の列は行ごとの倍精度浮動小数点数 (リトルエンディアン)。
+#  (版 1 の形式は列の種類を持たず、すべて真偽値の列)
+LEARNED_DATA_MAGIC    = b'Z2C45LD2'
+LEARNED_DATA_MAGIC_V1 = b'Z2C45LD1'
+_LEARNED_DATA_HEAD = struct.Struct('<8sQQQ')
+
+#  学習データ
+#  列 (0: 教師, 1 以降: 各決定器) ごとに、全データの判定結果をビット集合
+#  (Python の整数) として保持する。行として参照することもできる。
+#  (C4_5DecisionLearner.learnedData は以前は行のリストであった; 行のリストとして
+#  扱う (JSON に書き出すなど) 場合は to_rows() を用いる。)
+#  NumericValue による数値の列は、全データの値を array.array('d') として保持する。
+class C4_5LearnedData:
+	def __init__(self, columns, nrows):
+		self.columns = columns
+		self.nrows   = nrows
+	#  numeric には数値の列の番号の集合を与える
+	@staticmethod
+	def from_rows(rows, numeric=()):
+		rows = list(rows)
+		columns = [_column_from_values(column, i in numeric) for i, column in enumerate(zip(*rows))]
+		return C4_5LearnedData(columns, len(rows))
+	def is_numeric(self, index):
+		return isinstance(self.columns[index], array.array)
+	def all_rows(self):
+		return (1 << self.nrows) - 1
+	def __len__(self):
+		return self.nrows
+	def __getitem__(self, index):
+		if index < 0:
+			index += self.nrows
+		if index < 0 or index >= self.nrows:
+			raise IndexError('学習データの範囲外です。')
+		return [column[index] if isinstance(column, array.array) else bool((column >> index) & 1) for column in self.columns]
+	def __iter__(self):
+		for index in range(self.nrows):
+			yield self[index]
+	#  行 ([教師, 決定器 1, 決定器 2, ...]) のリストに変換する
+	def to_rows(self):
+		return list(self)
+	#  行を追加する (各行の列数は既存の列数と同じである必要がある)
+	def append_rows(self, rows):
+		rows = list(rows)
+		if len(rows) == 0:
+			return
+		if any(len(row) != len(self.columns) for row in rows):
+			raise ValueError('追加する行の列数が学習データと一致しません。')
+		for i, values in enumerate(zip(*rows)):
+			column = self.columns[i]
+			if isinstance(column, array.array):
+				column.extend(float(v) for v in values)
+			else:
+				self.columns[i] = column | (_bits_from_values(values) << self.nrows)
+		self.nrows += len(rows)
+	#  列を追加する (各列は全行の値の列; numeric には数値の列の (columns 内での) 番号の集合を与える)
+	def append_columns(self, columns, numeric=()):
+		for i, values in enumerate(columns):
+			values = list(values)
+			if len(values) != self.nrows:
+				raise ValueError('追加する列の行数が学習データと一致しません。')
+			self.columns.append(_column_from_values(values, i in numeric))
+	#  ファイルに書き出す (meta には JSON として表せる任意の情報を与えられる)
+	def save(self, f, meta=None):
+		metadata = json.dumps(meta).encode('UTF-8')
+		nbytes = (self.nrows + 7) // 8
+		f.write(_LEARNED_DATA_HEAD.pack(LEARNED_DATA_MAGIC, self.nrows, len(self.columns), len(metadata)))
+		f.write(metadata)
+		f.write(bytes(1 if isinstance(column, array.array) else 0 for column in self.columns))
+		for column in self.columns:
+			if isinstance(column, array.array):
+				f.write(_numeric_to_bytes(column))
+			else:
+				f.write(column.to_bytes(nbytes, 'little'))
+	#  ファイルから読み込み、(学習データ, メタデータ) を返す
+	@staticmethod
+	def load(f):
+		def read(n):
+			b = f.read(n)
+			if len(b) != n:
+				raise ValueError('学習データのファイルが途中で終了しています。')
+			return b
+		magic, nrows, ncolumns, metalen = _LEARNED_DATA_HEAD.unpack(read(_LEARNED_DATA_HEAD.size))
+		if magic not in (LEARNED_DATA_MAGIC, LEARNED_DATA_MAGIC_V1):
+			raise ValueError('学習データのファイルではありません。')
+		meta = json.loads(read(metalen).decode('UTF-8'))
+		kinds = read(ncolumns) if magic == LEARNED_DATA_MAGIC else bytes(ncolumns)
+		nbytes = (nrows + 7) // 8
+		columns = []
+		for kind in kinds:
+			if kind == 1:
+				columns.append(_numeric_from_bytes(read(nrows * 8)))
+			elif kind == 0:
+				columns.append(int.from_bytes(read(nbytes), 'little'))
+			else:
+				raise ValueError('学習データの列の種類 `{}\' が不明です。'.format(kind))
+		return C4_5LearnedData(columns, nrows), meta
+
+def _column_from_values(values, numeric):
+	if numeric:
+		return array.array('d', (float(v) for v in values))
+	return _bits_from_values(values)
+
+#  objects ([教師, 決定器 1, 決定器 2, ...]) のうち、数値の列となるものの番号の集合
+def _numeric_columns(objects):
+	return set(i for i, obj in enumerate(objects) if isinstance(obj, NumericValue))
+
+#  決定器の判定結果を特徴量ストアに保存する際の名前
+#  (repr が決定器を完全には表さない (`<...>' や既定の `<... object at 0x...>' のように、
+#  Python の式として解釈できない部分を含む) 場合は保存しない)
+def _decision_store_key(decision):
+	r = repr(decision)
+	try:
+		ast.parse(r, mode='eval')
+	except SyntaxError:
+		return None
+	return ('decision:' + r, getattr(decision, 'version', 1))
+
+#  学習データの行 (objects に [教師, 決定器 1, 決定器 2, ...] を与えた場合、その判定結果) を作る
+#  store に FeatureStore を与えた場合、保存済みの判定結果はそこから取得し、
+#  残りの決定器だけを評価する (文字列型の決定器は一度の走査でまとめて評価する)。
+class _LearnRowEvaluator:
+	def __init__(self, objects, store=None):
+		self.objects  = list(objects)
+		self.numeric  = _numeric_columns(self.objects)
+		self.store    = store
+		self.keys     = [_decision_store_key(d) for d in self.objects] if store is not None else None
+		self.matchers = {}
+	def __matcher(self, indices):
+		matcher = self.matchers.get(indices)
+		if matcher is None:
+			matcher = self.matchers[indices] = MultiPatternMatcher([self.objects[i] for i in indices])
+		return matcher
+	def row(self, data):
+		if not isinstance(data, FileData):
+			data = FileData(data, store=self.store)
+		n = len(self.objects)
+		if self.store is None:
+			row = [None] * n
+			missing = range(n)
+		else:
+			keys  = self.keys
+			found = self.store.get_many(data.sha256, [k for k in keys if k is not None])
+			row   = [found[k] if k in found else None for k in keys]
+			missing = [i for i in range(n) if keys[i] not in found]
+		decided = tuple(i for i in missing if i not in self.numeric)
+		if decided:
+			for i, value in zip(decided, self.__matcher(decided).decide_all(data)):
+				row[i] = value
+		for i in missing:
+			if i in self.numeric:
+				row[i] = float(self.objects[i].get_value(data))
+		if self.store is not None and missing:
+			self.store.put_many(data.sha256, {keys[i]: row[i] for i in missing if keys[i] is not None})
+		return row
+
+#  並列学習のワーカープロセスの状態 (決定器はプロセスごとに一度だけ受け取る)
+_learn_worker_state = None
+
+def _learn_worker_init(objects, store):
+	global _learn_worker_state
+	_learn_worker_state = _LearnRowEvaluator(objects, store)
+
+def _learn_worker_row(filename):
+	t0 = time.perf_counter()
+	evaluator = _learn_worker_state
+	row = evaluator.row(filename)
+	if evaluator.store is not None:
+		evaluator.store.flush()
+	return row, os.getpid(), time.perf_counter() - t0
+
+#  枝刈りの確信度 (C4.5 の既定値と同じ; 小さいほど多くの部分木を刈る)
+PRUNE_CONFIDENCE = 0.25
+
+@functools.lru_cache(maxsize=16)
+def _normal_deviate(confidence):
+	return statistics.NormalDist().inv_cdf(1.0 - confidence)
+
+#  n 件中 e 件を誤るノードの誤りの件数の (確信度 confidence での) 上限から e を引いたもの
+#  (C4.5 の悲観的誤り率の推定; Quinlan の実装と同じ近似を用いる)
+def _added_errors(n, e, confidence):
+	if n == 0:
+		return 0.0
+	if e < 1e-6:
+		return n * (1.0 - confidence ** (1.0 / n))
+	if e < 0.9999:
+		val0 = n * (1.0 - confidence ** (1.0 / n))
+		return val0 + e * (_added_errors(n, 1.0, confidence) - val0)
+	if e + 0.5 >= n:
+		return 0.67 * (n - e)
+	z2 = _normal_deviate(confidence) ** 2
+	pr = (e + 0.5 + z2 / 2 + math.sqrt(z2 * ((e + 0.5) * (1 - (e + 0.5) / n) + z2 / 4))) / (n + z2)
+	return n * pr - e
+
+#  葉の値と一致しない学習データの件数
+def _leaf_errors(value, counts):
+	return counts[0] if value else counts[1]
+
+#  決定木を葉から根に向かって畳み込む (leaf(葉), branch(分岐, branch0 の結果, branch1 の結果))
+#  (深い木でもスタックが溢れないよう、再帰はしない)
+def _fold_tree(decisionTree, leaf, branch):
+	results = []
+	stack = [(decisionTree, False)]
+	while stack:
+		elem, visited = stack.pop()
+		if isinstance(elem, C4_5DecisionLeaf):
+			results.append(leaf(elem))
+		elif visited:
+			result1 = results.pop()
+			result0 = results.pop()
+			results.append(branch(elem, result0, result1))
+		else:
+			stack.append((elem, True))
+			stack.append((elem.branch1, False))
+			stack.append((elem.branch0, False))
+	return results[0]
+
+#  部分木を枝刈りし、(枝刈りした部分木, 学習データの件数, 推定した誤りの件数) を返す
+def _prune_leaf(elem, confidence):
+	if elem.counts is None:
+		raise ValueError('葉に学習データの件数が記録されていません。')
+	e = _leaf_errors(elem.value, elem.counts)
+	return elem, elem.counts, e + _added_errors(sum(elem.counts), e, confidence)
+
+def _prune_branch(elem, result0, result1, confidence):
+	branch0, counts0, errors0 = result0
+	branch1, counts1, errors1 = result1
+	counts = (counts0[0] + counts1[0], counts0[1] + counts1[1])
+	# 葉に置き換えた場合の推定誤りが部分木のもの以下であれば置き換える
+	value = counts[1] > counts[0]
+	e = _leaf_errors(value, counts)
+	leafErrors = e + _added_errors(sum(counts), e, confidence)
+	if leafErrors <= errors0 + errors1 + 0.1:
+		return C4_5DecisionLeaf(value, counts), counts, leafErrors
+	branch = C4_5DecisionBranch(elem.idx, elem.drepr, elem.threshold)
+	branch.gainratio = elem.gainratio
+	branch.branch0 = branch0
+	branch.branch1 = branch1
+	return branch, counts, errors0 + errors1
+
+#  部分木の (分岐の数, 葉の数, 深さ, 学習データの件数, 分岐に到達する学習データの延べ件数, 誤りの件数)
+#  (件数が記録されていない葉がある場合、件数に関するものは None となる)
+def _summarize_leaf(elem):
+	if elem.counts is None:
+		return 0, 1, 0, None, None, None
+	return 0, 1, 0, elem.counts, 0, _leaf_errors(elem.value, elem.counts)
+
+def _summarize_branch(elem, result0, result1):
+	b0, l0, d0, c0, v0, e0 = result0
+	b1, l1, d1, c1, v1, e1 = result1
+	if c0 is None or c1 is None:
+		counts = visits = errors = None
+	else:
+		counts = (c0[0] + c1[0], c0[1] + c1[1])
+		visits = v0 + v1 + sum(counts)
+		errors = e0 + e1
+	return b0 + b1 + 1, l0 + l1, max(d0, d1) + 1, counts, visits, errors
+
+#  決定木の統計
+#  expected_evaluations は、学習データと同じ分布のファイルを判定する場合の、
+#  ファイルあたりの決定器の評価回数の期待値 (根から葉までの経路上の分岐の数の平均)。
+def decision_tree_stats(decisionTree):
+	branches, leaves, depth, counts, visits, errors = _fold_tree(decisionTree, _summarize_leaf, _summarize_branch)
+	stats = {
+		'depth':    depth,
+		'branches': branches,
+		'leaves':   leaves,
+		'expected_evaluations': None,
+		'training_errors':      errors,
+	}
+	if counts is not None and sum(counts) > 0:
+		stats['expected_evaluations'] = float(visits) / sum(counts)
+	return stats
+
+#  C4.5 の悲観的誤り率の推定による枝刈り (部分木の葉への置き換え) を行い、
+#  (枝刈りした決定木, 報告) を返す (与えた決定木は変更しない)
+#  葉には学習データの件数 (C4_5DecisionLeaf.counts) が記録されている必要がある。
+def prune_decision_tree(decisionTree, confidence=PRUNE_CONFIDENCE):
+	if not 0.0 < confidence < 1.0:
+		raise ValueError('confidence は 0 より大きく 1 より小さい必要があります。')
+	pruned = _fold_tree(decisionTree,
+		lambda elem: _prune_leaf(elem, confidence),
+		lambda elem, result0, result1: _prune_branch(elem, result0, result1, confidence))[0]
+	before = decision_tree_stats(decisionTree)
+	after  = decision_tree_stats(pruned)
+	report = {'confidence': confidence}
+	for key in ('depth', 'branches', 'leaves', 'training_errors', 'expected_evaluations'):
+		report[key + '_before'] = before[key]
+		report[key + '_after']  = after[key]
+	ebefore = before['expected_evaluations']
+	report['expected_saving'] = 0.0 if not ebefore else 1.0 - after['expected_evaluations'] / ebefore
+	return pruned, report
+
+#  学習データの各行に対応する入力 (ファイルのパス) を learnedInputs に記録するため、
+#  学習後に決定器 (列) や入力 (行) を追加する場合、追加した部分だけを評価すればよい。
 class C4_5DecisionLearner:
 	def __init__(self, teacherObject, decisionObjects):
 		self.teacherObject   = teacherObject
 		self.decisionObjects = decisionObjects
 		self.decisionTree    = None
 		self.learnedData     = None
+		self.learnedInputs   = None
+		self.learnStats      = None
+		self.__numeric       = None
+		self.__teacherRow    = None
+		self.__nlogn         = None
+		self.__orders        = None
+		self.__maxDepth      = None
+		self.__minSamplesSplit = 2
 	def clear_learned_data(self):
-		self.learnedData = None
+		self.learnedData   = None
+		self.learnedInputs = None
+	#  data には C4_5LearnedData か、行 ([教師, 決定器 1, 決定器 2, ...]) のリストを与える
+	#  (各行に対応する入力が分からないため、この後に決定器を追加することはできない)
 	def load_learned_data(self, data):
-		self.learnedData = data
+		if not isinstance(data, C4_5LearnedData):
+			data = C4_5LearnedData.from_rows(data, _numeric_columns([self.teacherObject] + list(self.decisionObjects)))
+		self.learnedData   = data
+		self.learnedInputs = None
+	#  学習データをファイルに書き出す (教師・決定器の repr と、各行の入力も記録する)
+	def save_learned_data(self, filename):
+		if self.learnedData is None:
+			raise ValueError("事前に学習させることが必要です。")
+		meta = {
+			'teacher':  repr(self.teacherObject),
+			'deciders': [repr(d) for d in self.decisionObjects],
+			'inputs':   self.learnedInputs,
+		}
+		with open(filename, 'wb') as f:
+			self.learnedData.save(f, meta)
+	#  save_learned_data で書き出した学習データを読み込む
+	#  (記録された決定器の repr が現在の決定器と一致しない場合はエラーとする)
+	def restore_learned_data(self, filename):
+		with open(filename, 'rb') as f:
+			data, meta = C4_5LearnedData.load(f)
+		if meta['deciders'] != [repr(d) for d in self.decisionObjects]:
+			raise ValueError('学習データの決定器が現在の決定器と一致しません。')
+		if len(data.columns) != len(self.decisionObjects) + 1:
+			raise ValueError('学習データの列数が決定器の数と一致しません。')
+		self.learnedData   = data
+		self.learnedInputs = meta['inputs']
 	def set_teacher(self, teacherObject):
 		self.teacherObject = teacherObject
-	def learn(self, inputs):
+	#  inputs には FileData かファイルのパスを与える
+	#  workers を指定した場合はその数のプロセスで並列に評価する。この場合、各ワーカーが
+	#  パスから FileData を作る (FileData はパスに置き換えて渡す) ため、教師・決定器は
+	#  pickle 可能である必要がある。
+	#  store に FeatureStore を与えた場合、保存済みの判定結果は評価し直さない
+	#  (決定器を追加して学習し直す場合、追加した決定器だけが評価される)。
+	def learn(self, inputs, workers=None, store=None):
+		self.__check_objects()
+		t0 = time.perf_counter()
+		inputs = list(inputs)
+		objects = [self.teacherObject] + list(self.decisionObjects)
+		learnedRows, workerStats = self.__evaluate(inputs, objects, workers, store)
+		self.learnedData   = C4_5LearnedData.from_rows(learnedRows, _numeric_columns(objects))
+		self.learnedInputs = self.__input_names(inputs)
+		self.__set_stats(len(learnedRows), t0, workerStats)
+	#  入力 (行) を追加する (追加した入力についてのみ、教師と全決定器を評価する)
+	def add_samples(self, inputs, workers=None, store=None):
+		if self.learnedData is None:
+			return self.learn(inputs, workers=workers, store=store)
+		self.__check_objects()
+		if self.learnedInputs is None:
+			raise ValueError("学習データの各行に対応する入力が分かりません。")
+		t0 = time.perf_counter()
+		inputs = list(inputs)
+		learnedRows, workerStats = self.__evaluate(inputs, [self.teacherObject] + list(self.decisionObjects), workers, store)
+		self.learnedData.append_rows(learnedRows)
+		self.learnedInputs.extend(self.__input_names(inputs))
+		self.__set_stats(len(learnedRows), t0, workerStats)
+	#  決定器 (列) を追加する (学習済みの入力について、追加した決定器だけを評価する)
+	def add_deciders(self, decisionObjects, workers=None, store=None):
+		decisionObjects = list(decisionObjects)
+		if self.learnedData is None:
+			self.decisionObjects = list(self.decisionObjects or []) + decisionObjects
+			return
+		if self.learnedInputs is None:
+			raise ValueError("学習データの各行に対応する入力が分かりません。")
+		t0 = time.perf_counter()
+		newRows, workerStats = self.__evaluate(self.learnedInputs, decisionObjects, workers, store)
+		self.learnedData.append_columns(zip(*newRows) if newRows else [[] for d in decisionObjects], _numeric_columns(decisionObjects))
+		self.decisionObjects = list(self.decisionObjects) + decisionObjects
+		self.__set_stats(len(newRows), t0, workerStats)
+	def __check_objects(self):
 		if self.teacherObject is None:
 			raise ValueError("教師役となる決定器オブジェクトが必要です。")
 		if self.decisionObjects is None or len(self.decisionObjects) == 0:
 			raise ValueError("学習のためには、決定器オブジェクトの (空でない) 配列を与える必要があります。")
-		self.learnedData = []
-		for data in inputs:
-			decideArray = [ self.teacherObject.decide(data) ]
-			for dec in self.decisionObjects:
-				decideArray.append(dec.decide(data))
-			self.learnedData.append(decideArray)
-	def __impurity(self, n0, n1):
-		n = n0 + n1
-		if n == 0:
-			return 0.0
-		p0 = float(n0) / n
-		p1 = 1.0 - p0
-		return -((0 if p0 == 0 else p0 * math.log2(p0)) + (0 if p1 == 0 else p1 * math.log2(p1)))
-	def __make_tree_element(self, data, used_):
+	@staticmethod
+	def __input_names(inputs):
+		return [data.filename if isinstance(data, FileData) else data for data in inputs]
+	def __set_stats(self, nfiles, t0, workerStats):
+		self.learnStats = {
+			'files':   nfiles,
+			'seconds': time.perf_counter() - t0,
+			'workers': workerStats,
+		}
+	#  入力ごとに、objects の各決定器の判定結果を求める
+	def __evaluate(self, inputs, objects, workers, store):
+		if workers is None:
+			evaluator = _LearnRowEvaluator(objects, store)
+			learnedRows = [evaluator.row(data) for data in inputs]
+			if store is not None:
+				store.flush()
+			return learnedRows, {}
+		return self.__evaluate_parallel(inputs, objects, workers, store)
+	def __evaluate_parallel(self, inputs, objects, workers, store):
+		filenames = self.__input_names(inputs)
+		learnedRows = []
+		workerStats = {}
+		with concurrent.futures.ProcessPoolExecutor(
+				max_workers=workers,
+				initializer=_learn_worker_init,
+				initargs=(objects, store)) as executor:
+			# map は入力の順に結果を返す
+			for row, pid, seconds in executor.map(_learn_worker_row, filenames):
+				learnedRows.append(row)
+				stats = workerStats.setdefault(pid, {'files': 0, 'seconds': 0.0})
+				stats['files']   += 1
+				stats['seconds'] += seconds
+		return learnedRows, workerStats
+	#  数値の列について、最も情報ゲイン比の大きいしきい値を求める
+	#  (ノードに属する行を値の順に一度走査し、しきい値以下の行の数を累積して数える)
+	#  (情報ゲイン比, しきい値, count00, count01, count10, count11) を返す (分割できなければ None)。
+	#  候補となるしきい値が多いため、不純度は n * log2(n) の表を用いて計算する
+	#  (n * 不純度(a, b) = n log n - a log a - b log b, n = a + b)。
+	#  C4.5 (Release 8) と同じく、しきい値は情報ゲインが最大になるものを選び、その情報ゲインから
+	#  しきい値の候補の数によるペナルティ log2(N - 1) / |D| (N は値の種類数) を引く
+	#  (雑音に合わせて少数の行を切り出す分割が選ばれないよう、分岐先には最低 minSplit 行を要する)。
+	#  ペナルティを引いた情報ゲインが正であれば
+	#  (情報ゲイン, 情報ゲイン比, しきい値, count00, count01, count10, count11) を返す。
+	def __numeric_split(self, order, values, countxx, countx1, impurity_teacher):
+		nlogn = self.__nlogn
+		teacherRow = self.__teacherRow
+		scale = 1.0 / countxx
+		minSplit = min(max(0.1 * countxx / 2, 2), 25)
+		best = None
+		ncuts = 0   # しきい値の候補の数 (値の種類数 - 1)
+		nl  = 0     # しきい値以下の行の数
+		nl1 = 0     # そのうち教師が True の行の数
+		prev = None
+		for r in order:
+			v = values[r]
+			if prev is not None and v != prev:
+				ncuts += 1
+				if nl >= minSplit and countxx - nl >= minSplit:
+					count1x = countxx - nl
+					count11 = countx1 - nl1
+					count10 = count1x - count11
+					impurity_decider = scale * (
+						nlogn[nl] - nlogn[nl - nl1] - nlogn[nl1] +
+						nlogn[count1x] - nlogn[count10] - nlogn[count11])
+					gain = impurity_teacher - impurity_decider
+					if best is None or gain > best[0]:
+						best = (gain, (prev + v) / 2.0, nl, nl1)
+			nl  += 1
+			nl1 += teacherRow[r]
+			prev = v
+		if best is None:
+			return None
+		gain, threshold, nl, nl1 = best
+		gain -= math.log2(ncuts) / countxx
+		if gain <= 0.0:
+			return None
+		count1x = countxx - nl
+		count11 = countx1 - nl1
+		splitinfo = scale * (nlogn[countxx] - nlogn[nl] - nlogn[count1x])
+		return (gain, gain / (splitinfo + 0.001), threshold, nl - nl1, nl1, count1x - count11, count11)
+	#  数値の列ごとの (値の順に並べた) 行の番号を、分岐先ごとに分ける
+	@staticmethod
+	def __split_orders(orders, splitRows, nbytes):
+		mask = splitRows.to_bytes(nbytes, 'little')
+		orders0 = {}
+		orders1 = {}
+		for i, order in orders.items():
+			o0 = orders0[i] = []
+			o1 = orders1[i] = []
+			for r in order:
+				if (mask[r >> 3] >> (r & 7)) & 1:
+					o1.append(r)
+				else:
+					o0.append(r)
+		return orders0, orders1
+	#  orders には、数値の列ごとに、ノードに属する行の番号を値の順に並べたものを与える
+	#  depth はこのノードの深さ (根が 0)
+	#  深い木でもスタックが溢れないよう再帰はせず、(ノード, 子ノードを作るための引数) の
+	#  リストを返す (make_decision_tree がそれらを順に処理する)。
+	def __make_tree_element(self, data, rows, used_, orders, depth):
 		used = set(used_)
-		ndecider = len(data[0]) - 1
-		ndata    = len(data)
+		ndecider = len(data.columns) - 1
+		columns  = data.columns
+		impurity = _impurity
 		mgainrat = None
 		isplit   = None
+		threshold = None
 		t_count00 = None
 		t_count01 = None
 		t_count10 = None
 		t_count11 = None
 		# 教師データの不純度を計算
-		countx0  = 0
-		countx1  = 0
-		for d in data:
-			if d[0]:
-				countx1 += 1
-			else:
-				countx0 += 1
-		countxx  = ndata
-		impurity_teacher = self.__impurity(countx0, countx1)
+		teacher  = columns[0] & rows
+		countxx  = _popcount(rows)
+		countx1  = _popcount(teacher)
+		countx0  = countxx - countx1
+		impurity_teacher = impurity(countx0, countx1)
+		# 深さの上限に達したか、分割するには行が少なすぎる場合は葉とする
+		if (self.__maxDepth is not None and depth >= self.__maxDepth) or countxx < self.__minSamplesSplit:
+			return C4_5DecisionLeaf(countx1 > countx0, (countx0, countx1)), []
+		# 分割の候補 (情報ゲイン, 情報ゲイン比, 列, しきい値, count00, count01, count10, count11)
+		candidates = []
 		# 決定器ごとに計算……
 		for i in range(1, ndecider + 1):
-			if i in used:
+			if i in used or i in self.__numeric:
 				continue
-			count00 = 0
-			count01 = 0
-			count10 = 0
-			count11 = 0
 			# 与えられた決定器の不純度を計算
-			for d in data:
-				if d[i]:
-					if d[0]:
-						count11 += 1
-					else:
-						count10 += 1
-				else:
-					if d[0]:
-						count01 += 1
-					else:
-						count00 += 1
+			# (ノードに属する行のビット集合との AND を取って数える)
+			decided = columns[i] & rows
+			count1x = _popcount(decided)
+			count11 = _popcount(decided & teacher)
+			count10 = count1x - count11
+			count01 = countx1 - count11
+			count00 = countx0 - count10
 			count0x = count00 + count01
-			count1x = count10 + count11
 			# 不純度の計算においては、決定器による分割の重み付けを行う
 			impurity_decider = \
-				float(count0x) / countxx * self.__impurity(count00, count01) + \
-				float(count1x) / countxx * self.__impurity(count10, count11)
+				float(count0x) / countxx * impurity(count00, count01) + \
+				float(count1x) / countxx * impurity(count10, count11)
 			# 情報ゲイン (不純度を減らせる量) の計算
 			gain_decider = impurity_teacher - impurity_decider
 			# 情報ゲイン比の計算 (分割そのものの不純度による情報ゲインの正規化)
-			splitinfo_decider = self.__impurity(count0x, count1x) + 0.001
+			splitinfo_decider = impurity(count0x, count1x) + 0.001
 			gainratio_decider = gain_decider / splitinfo_decider
-			# 情報ゲイン比が最大になるものを選択
-			if mgainrat is None or gainratio_decider > mgainrat:
-				isplit = i
-				mgainrat = gainratio_decider
-				t_count00 = count00
-				t_count01 = count01
-				t_count10 = count10
-				t_count11 = count11
+			candidates.append((gain_decider, gainratio_decider, i, None, count00, count01, count10, count11))
+		# 数値の列はしきい値を選んで分割する (同じ列を何度でも用いることができる)
+		# この場合、C4.5 と同じく情報ゲインが平均以上の候補に限って情報ゲイン比を比べる
+		# (情報ゲイン比は分割そのものの不純度が小さい偏った分割を過大に評価するため)。
+		if self.__numeric:
+			for i in sorted(self.__numeric):
+				split = self.__numeric_split(orders[i], columns[i], countxx, countx1, impurity_teacher)
+				if split is not None:
+					gain, gainratio, th, count00, count01, count10, count11 = split
+					candidates.append((gain, gainratio, i, th, count00, count01, count10, count11))
+			if candidates:
+				average = sum(c[0] for c in candidates) / len(candidates)
+				candidates = [c for c in candidates if c[0] >= average - 1e-9]
+		# 情報ゲイン比が最大になるものを選択
+		for c in candidates:
+			if mgainrat is None or c[1] > mgainrat:
+				mgainrat, isplit, threshold, t_count00, t_count01, t_count10, t_count11 = c[1:]
+		# 分割できる決定器が無い場合、多い方の値を持つ葉とする
+		if isplit is None:
+			return C4_5DecisionLeaf(countx1 > countx0, (countx0, countx1)), []
 		# 分割ノードを生成
-		used.add(isplit)
-		element = C4_5DecisionBranch(isplit - 1, repr(self.decisionObjects[isplit - 1]))
+		if threshold is None:
+			used.add(isplit)
+			splitRows = columns[isplit]
+		else:
+			values = columns[isplit]
+			splitRows = _bits_from_values([v > threshold for v in values])
+		element = C4_5DecisionBranch(isplit - 1, repr(self.decisionObjects[isplit - 1]), threshold)
 		element.gainratio = mgainrat
 		# これ以上分割できないかもう有用な分類がない場合、正解率の高い方を適当に選ぶ
-		if len(used) == ndecider or mgainrat == 0.0:
-			if t_count00 + t_count11 >= t_count01 + t_count10:
-				element.branch0 = C4_5DecisionLeaf(False)
-				element.branch1 = C4_5DecisionLeaf(True)
-			else:
-				element.branch0 = C4_5DecisionLeaf(True)
-				element.branch1 = C4_5DecisionLeaf(False)
-			return element
+		# (数値の列は何度でも用いることができるため、決定器を使い切ることはない)
+		if (len(used) == ndecider and not self.__numeric) or mgainrat == 0.0:
+			value = t_count00 + t_count11 < t_count01 + t_count10
+			element.branch0 = C4_5DecisionLeaf(value, (t_count00, t_count01))
+			element.branch1 = C4_5DecisionLeaf(not value, (t_count10, t_count11))
+			return element, []
 		# 教師データに基づいて値を決定
+		# (分岐先の行は、行をコピーせずビット集合で表す)
+		orders0 = orders1 = orders
+		if orders and (min(t_count00, t_count01) > 0 or min(t_count10, t_count11) > 0):
+			orders0, orders1 = self.__split_orders(orders, splitRows, (data.nrows + 7) // 8)
+		children = []
 		if   t_count00 == 0:        # 決定器 False, 教師 False のデータが無い (決定器 False の場合、すべて教師 True)
-			element.branch0 = C4_5DecisionLeaf(True)
+			element.branch0 = C4_5DecisionLeaf(True, (t_count00, t_count01))
 		elif t_count01 == 0:
-			element.branch0 = C4_5DecisionLeaf(False)
+			element.branch0 = C4_5DecisionLeaf(False, (t_count00, t_count01))
 		else:
-			element.branch0 = self.__make_tree_element([x for x in data if x[isplit] == False], used)
+			children.append((element, 'branch0', rows & ~splitRows, used, orders0, depth + 1))
 		if   t_count10 == 0:
-			element.branch1 = C4_5DecisionLeaf(True)
+			element.branch1 = C4_5DecisionLeaf(True, (t_count10, t_count11))
 		elif t_count11 == 0:
-			element.branch1 = C4_5DecisionLeaf(False)
+			element.branch1 = C4_5DecisionLeaf(False, (t_count10, t_count11))
 		else:
-			element.branch1 = self.__make_tree_element([x for x in data if x[isplit] == True], used)
-		return element
-	def make_decision_tree(self):
+			children.append((element, 'branch1', rows & splitRows, used, orders1, depth + 1))
+		return element, children
+	#  数値の列の行の番号を値の順に並べたもの (同じ学習データに対しては一度だけ求める)
+	#  (学習データそのものへの参照を保持し、同一のオブジェクトかどうかで判定する;
+	#  行が追加された場合は求め直す)
+	def __sorted_orders(self, data, numeric):
+		if self.__orders is None or self.__orders[0] is not data or self.__orders[1] != data.nrows:
+			self.__orders = (data, data.nrows, {})
+		orders = self.__orders[2]
+		for i in numeric:
+			if i not in orders:
+				orders[i] = sorted(range(data.nrows), key=data.columns[i].__getitem__)
+		return {i: orders[i] for i in numeric}
+	#  rows に行のビット集合を与えた場合はそれらの行だけを、deciders に決定器の番号
+	#  (0 から始まる) を与えた場合はそれらの決定器だけを用いて決定木を作る
+	#  max_depth を与えた場合は木の深さをそれ以下に、min_samples_split を与えた場合は
+	#  その数未満の行しか属さないノードを分割しない (いずれも多い方の値を持つ葉とする)。
+	def make_decision_tree(self, rows=None, deciders=None, max_depth=None, min_samples_split=2):
+		if max_depth is not None and max_depth < 0:
+			raise ValueError('max_depth は 0 以上である必要があります。')
+		if not isinstance(min_samples_split, int) or min_samples_split < 2:
+			raise ValueError('min_samples_split は 2 以上の整数である必要があります。')
 		if self.learnedData is None:
 			raise ValueError("事前に学習させることが必要です。")
-		self.decisionTree = self.__make_tree_element(self.learnedData, set())
+		if len(self.learnedData) == 0:
+			raise ValueError("学習データが空です。")
+		data = self.learnedData
+		rows = data.all_rows() if rows is None else rows & data.all_rows()
+		if rows == 0:
+			raise ValueError("学習に用いる行がありません。")
+		used = set()
+		if deciders is not None:
+			allowed = set(i + 1 for i in deciders)
+			used = set(i for i in range(1, len(data.columns)) if i not in allowed)
+		# 数値の列は、値の順に並べた行の番号を一度だけ求めておく
+		# (分岐するたびに、順序を保ったまま分岐先ごとに分ける)
+		self.__numeric = set(i for i in range(1, len(data.columns)) if data.is_numeric(i) and i not in used)
+		self.__teacherRow = _values_from_bits(data.columns[0], data.nrows)
+		self.__nlogn = [0.0] + [k * math.log2(k) for k in range(1, data.nrows + 1)] if self.__numeric else None
+		orders = self.__sorted_orders(data, self.__numeric)
+		if rows != data.all_rows():
+			orders = self.__split_orders(orders, rows, (data.nrows + 7) // 8)[1]
+		self.__maxDepth = max_depth
+		self.__minSamplesSplit = min_samples_split
+		try:
+			root, children = self.__make_tree_element(data, rows, used, orders, 0)
+			# 子ノードは branch0 から順に (深さ優先で) 作る
+			stack = children[::-1]
+			while stack:
+				parent, name, rows, used, orders, depth = stack.pop()
+				element, children = self.__make_tree_element(data, rows, used, orders, depth)
+				setattr(parent, name, element)
+				stack.extend(children[::-1])
+			self.decisionTree = root
+		finally:
+			self.__numeric    = None
+			self.__teacherRow = None
+			self.__nlogn      = None
 		return self.decisionTree
+	#  decisionTree を枝刈りし、報告 (prune_decision_tree を参照) を返す
+	def prune_decision_tree(self, confidence=PRUNE_CONFIDENCE):
+		if self.decisionTree is None:
+			raise ValueError("事前に決定木を作ることが必要です。")
+		self.decisionTree, report = prune_decision_tree(self.decisionTree, confidence)
+		return report
+
+
+#  コンパイルする決定木の最大の深さ
+#  (これより深い木は、入れ子の if 文ではなく配列で表した木として評価する)
+COMPILE_MAX_DEPTH = 64
+
+#  入れ子の if 文として生成できる木の深さの上限
+#  (Python のインデントの段数の上限は 100 段であるため)
+__NESTED_MAX_DEPTH = 96
+
+#  そのまま Python のリテラルとして埋め込める葉の値
+__LITERAL_TYPES = (bool, int, float, str, type(None))
+
+def _tree_depth(decisionTree):
+	depth = 0
+	stack = [(decisionTree, 0)]
+	while stack:
+		elem, d = stack.pop()
+		depth = max(depth, d)
+		if isinstance(elem, C4_5DecisionBranch):
+			stack.append((elem.branch0, d + 1))
+			stack.append((elem.branch1, d + 1))
+	return depth
+
+#  分岐ノードの判定を行う関数 (数値の決定器の場合はしきい値と比較する)
+def _branch_decider(decisionObjects, idx, threshold):
+	if threshold is None:
+		return decisionObjects[idx].decide
+	get_value = decisionObjects[idx].get_value
+	return lambda data: get_value(data) > threshold
 
+#  決定木を入れ子の if 文からなる関数にコンパイルする
+#  (各決定器の decide (数値の決定器では get_value) はクロージャの変数として束縛する)
+def _compile_nested(decisionObjects, decisionTree):
+	deciders = {}
+	values   = []
+	lines    = []
+	def literal(value):
+		if type(value) in __LITERAL_TYPES and (type(value) is not float or math.isfinite(value)):
+			return repr(value)
+		values.append(value)
+		return 'v{}'.format(len(values) - 1)
+	def emit(elem, indent):
+		tabs = '\t' * indent
+		if isinstance(elem, C4_5DecisionLeaf):
+			lines.append('{}return {}'.format(tabs, literal(elem.value)))
+		else: # isinstance(elem, C4_5DecisionBranch) == True
+			obj = decisionObjects[elem.idx]
+			if elem.threshold is None:
+				deciders.setdefault(elem.idx, obj.decide)
+				lines.append('{}if d{}(data):'.format(tabs, elem.idx))
+			else:
+				deciders.setdefault(elem.idx, obj.get_value)
+				lines.append('{}if d{}(data) > {}:'.format(tabs, elem.idx, literal(elem.threshold)))
+			emit(elem.branch1, indent + 1)
+			lines.append('{}else:'.format(tabs))
+			emit(elem.branch0, indent + 1)
+	emit(decisionTree, 2)
+	names  = ['d{}'.format(i) for i in deciders.keys()]
+	names += ['v{}'.format(i) for i in range(len(values))]
+	source = '\n'.join(['def make({}):'.format(', '.join(names)), '\tdef decide(data):'] + lines + ['\treturn decide'])
+	env = {}
+	exec(compile(source, '<C4_5Decision>', 'exec'), env)
+	return env['make'](*(list(deciders.values()) + values))
+
+#  決定木を配列で表す (ノード 0 が根)
+#  各ノードについて (決定器の番号 (葉では None), False 側の子, True 側の子,
+#  葉の値 (分岐ノードではしきい値)) を返す。
+def _flatten_tree(decisionTree):
+	indices = []
+	branch0 = []
+	branch1 = []
+	values  = []
+	stack = [(decisionTree, None, None)]
+	while stack:
+		elem, parent, side = stack.pop()
+		node = len(indices)
+		if parent is not None:
+			side[parent] = node
+		branch0.append(None)
+		branch1.append(None)
+		if isinstance(elem, C4_5DecisionLeaf):
+			indices.append(None)
+			values.append(elem.value)
+		else: # isinstance(elem, C4_5DecisionBranch) == True
+			indices.append(elem.idx)
+			values.append(elem.threshold)
+			stack.append((elem.branch0, node, branch0))
+			stack.append((elem.branch1, node, branch1))
+	return indices, branch0, branch1, values
+
+#  決定木を配列で表し、ループで評価する関数を作る (深い木のため)
+def _compile_flat(decisionObjects, decisionTree):
+	indices, branch0, branch1, values = _flatten_tree(decisionTree)
+	deciders = [None if idx is None else _branch_decider(decisionObjects, idx, values[node]) for node, idx in enumerate(indices)]
+	def decide(data):
+		node = 0
+		while True:
+			decider = deciders[node]
+			if decider is None:
+				return values[node]
+			node = branch1[node] if decider(data) else branch0[node]
+	return decide
 
+#  決定木を、与えられたデータに対する判定を返す関数にコンパイルする
+def compile_decision_tree(decisionObjects, decisionTree, max_depth=COMPILE_MAX_DEPTH):
+	if _tree_depth(decisionTree) > min(max_depth, __NESTED_MAX_DEPTH):
+		return _compile_flat(decisionObjects, decisionTree)
+	return _compile_nested(decisionObjects, decisionTree)
+
+
+#  決定木は生成時にコンパイルされる
+#  (decisionObjects や decisionTree を変更した場合は compile() を呼び直すこと)
 class C4_5Decision:
 	def __init__(self, decisionObjects, decisionTree):
 		self.decisionObjects = decisionObjects
 		self.decisionTree    = decisionTree
+		self.compile()
+	def compile(self):
+		self.__decide = compile_decision_tree(self.decisionObjects, self.decisionTree)
 	def decide(self, data):
-		elem = self.decisionTree
-		while True:
-			if isinstance(elem, C4_5DecisionLeaf):
-				return elem.value
-			else: # isinstance(elem, C4_5DecisionBranch) == True
-				d = self.decisionObjects[elem.idx].decide(data)
-				if d:
-					elem = elem.branch1
+		return self.__decide(data)
+	#  この数以上の文字列型の決定器を評価し得るデータは、一度の走査でまとめて評価する
+	#  (少数のパターンであれば、個別に検索する方が速い)
+	BULK_MATCH_MIN_PATTERNS = 32
+	#  複数のデータをまとめて判定し、入力の順に結果を返す
+	#  batch_size 個ずつのデータを木の段ごとに振り分けるため、各ノードの決定器は
+	#  そのノードに到達したデータに対してのみ評価される。
+	def decide_batch(self, datas, batch_size=1024):
+		if batch_size < 1:
+			raise ValueError('batch_size は 1 以上である必要があります。')
+		flat = _flatten_tree(self.decisionTree)
+		indices, branch0, branch1, values = flat
+		# 木に含まれる文字列型の決定器をまとめたもの
+		used = sorted(set(i for i in indices if i is not None))
+		matcher = MultiPatternMatcher([self.decisionObjects[i] for i in used])
+		patterns = {i: j for j, i in enumerate(used) if matcher.is_pattern(j)}
+		# ノードから葉までの経路上にある文字列型の決定器の最大数
+		# (子ノードは常に親ノードより後ろに置かれる)
+		npatterns = [0] * len(indices)
+		for node in reversed(range(len(indices))):
+			idx = indices[node]
+			if idx is not None:
+				npatterns[node] = max(npatterns[branch0[node]], npatterns[branch1[node]]) + (idx in patterns)
+		state = (flat, matcher, patterns, npatterns)
+		batch = []
+		for data in datas:
+			batch.append(data)
+			if len(batch) == batch_size:
+				yield from self.__decide_batch(state, batch)
+				batch = []
+		if batch:
+			yield from self.__decide_batch(state, batch)
+	def __decide_batch(self, state, batch):
+		(indices, branch0, branch1, values), matcher, patterns, npatterns = state
+		decisionObjects = self.decisionObjects
+		bulkMin = self.BULK_MATCH_MIN_PATTERNS
+		results = [None] * len(batch)
+		matches = [None] * len(batch)  # ファイルごとの MultiPatternMatcher.match の結果
+		level = [(0, range(len(batch)))]
+		while level:
+			nextLevel = []
+			for node, members in level:
+				idx = indices[node]
+				if idx is None:
+					value = values[node]
+					for m in members:
+						results[m] = value
+					continue
+				members0 = []
+				members1 = []
+				decide = _branch_decider(decisionObjects, idx, values[node])
+				if idx in patterns:
+					j = patterns[idx]
+					bulk = npatterns[node] >= bulkMin
+					for m in members:
+						found = matches[m]
+						if found is None and bulk:
+							found = matches[m] = matcher.match(batch[m].data)
+						if matcher.decide_matched(j, found) if found is not None else decide(batch[m]):
+							members1.append(m)
+						else:
+							members0.append(m)
 				else:
-					elem = elem.branch0
+					for m in members:
+						if decide(batch[m]):
+							members1.append(m)
+						else:
+							members0.append(m)
+				if members0:
+					nextLevel.append((branch0[node], members0))
+				if members1:
+					nextLevel.append((branch1[node], members1))
+			level = nextLevel
+		return results
+	#  コンパイルされた関数は pickle できないため、復元時にコンパイルし直す
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		del state['_C4_5Decision__decide']
+		return state
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.compile()
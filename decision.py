@@ -28,3 +28,9 @@ class Decision(metaclass=abc.ABCMeta):
 	@abc.abstractmethod
 	def decide(self, data):
 		raise NotImplementedError()
+
+#  数値を返す特徴 (C4.5 の決定木では、しきい値との比較により分岐する)
+class NumericValue(metaclass=abc.ABCMeta):
+	@abc.abstractmethod
+	def get_value(self, data):
+		raise NotImplementedError()
@@ -0,0 +1,192 @@
+#
+#
+#	z2kit v2 : Security Camp track Z2 : sort of analysis framework
+#
+#	decisionopt.py
+#	Cost-aware reordering of decision combinations
+#
+#	Copyright (C) 2018 Tsukasa OI.
+#
+#	Permission to use, copy, modify, and/or distribute this software
+#	for any purpose with or without fee is hereby granted, provided
+#	that the above copyright notice and this permission notice
+#	appear in all copies.
+#
+#	THE SOFTWARE IS PROVIDED “AS IS” AND ISC DISCLAIMS ALL WARRANTIES
+#	WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+#	MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL ISC BE LIABLE FOR
+#	ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+#	DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+#	WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+#	ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+#	PERFORMANCE OF THIS SOFTWARE.
+#
+#
+#	使い方:
+#		optimized, report = optimize_decision(decision, samples=[FileData(...), ...])
+#
+#	AND/OR の入れ子を n 個の決定器の ALL/ANY にまとめ、各決定器のコスト
+#	(評価にかかる時間) と真になる確率から、期待されるコストが最小になるよう
+#	評価の順序を並べ替える。各決定器の結果は互いに独立であると仮定する。
+#
+import time
+from .decisions import DecisionCombination_AND, DecisionCombination_OR, \
+	DecisionCombination_ALL, DecisionCombination_ANY, \
+	DecisionCombination_XOR, DecisionCombination_NOT
+
+#  コストも確率も分からない決定器に用いる値
+DEFAULT_COST        = 1.0
+DEFAULT_PROBABILITY = 0.5
+
+def _operands(decision):
+	if isinstance(decision, (DecisionCombination_ALL, DecisionCombination_ANY)):
+		return decision.decisions
+	if isinstance(decision, (DecisionCombination_AND, DecisionCombination_OR, DecisionCombination_XOR)):
+		return [decision.d1, decision.d2]
+	if isinstance(decision, DecisionCombination_NOT):
+		return [decision.decision]
+	return None
+
+def _is_all(decision):
+	return isinstance(decision, (DecisionCombination_AND, DecisionCombination_ALL))
+
+def _is_any(decision):
+	return isinstance(decision, (DecisionCombination_OR, DecisionCombination_ANY))
+
+#  AND/OR の入れ子を ALL/ANY にまとめる (評価の順序は変えない)
+def flatten_decision(decision):
+	operands = _operands(decision)
+	if operands is None:
+		return decision
+	operands = [flatten_decision(d) for d in operands]
+	if _is_all(decision) or _is_any(decision):
+		cls = DecisionCombination_ALL if _is_all(decision) else DecisionCombination_ANY
+		flat = []
+		for d in operands:
+			if isinstance(d, cls):
+				flat.extend(d.decisions)
+			else:
+				flat.append(d)
+		return cls(flat)
+	if isinstance(decision, DecisionCombination_XOR):
+		return DecisionCombination_XOR(operands[0], operands[1])
+	return DecisionCombination_NOT(operands[0])
+
+#  組み合わせではない (末端の) 決定器の一覧 (重複無し)
+def leaf_decisions(decision):
+	leaves = []
+	seen = set()
+	stack = [decision]
+	while stack:
+		d = stack.pop()
+		operands = _operands(d)
+		if operands is not None:
+			stack.extend(reversed(operands))
+		elif id(d) not in seen:
+			seen.add(id(d))
+			leaves.append(d)
+	return leaves
+
+def _clear_cache(data):
+	if hasattr(data, 'clear_feature_cache'):
+		data.clear_feature_cache()
+
+#  末端の決定器ごとに、サンプルに対する平均の評価時間 (秒) と真になる割合を測る
+#  (特徴量のキャッシュの影響を除くため、評価ごとにキャッシュを消す)
+def measure_decisions(decision, samples):
+	samples = list(samples)
+	if len(samples) == 0:
+		raise ValueError('サンプルが空です。')
+	stats = {}
+	for d in leaf_decisions(decision):
+		seconds = 0.0
+		ntrue = 0
+		for data in samples:
+			_clear_cache(data)
+			t0 = time.perf_counter()
+			if d.decide(data):
+				ntrue += 1
+			seconds += time.perf_counter() - t0
+		stats[id(d)] = (seconds / len(samples), float(ntrue) / len(samples))
+	return stats
+
+#  決定器の期待されるコストと真になる確率 (現在の評価の順序による)
+#  stats は id(決定器) から (コスト, 確率) への辞書
+def estimate_decision(decision, stats):
+	operands = _operands(decision)
+	if operands is None:
+		if id(decision) in stats:
+			return stats[id(decision)]
+		return (getattr(decision, 'estimated_cost', DEFAULT_COST), DEFAULT_PROBABILITY)
+	estimates = [estimate_decision(d, stats) for d in operands]
+	if _is_all(decision) or _is_any(decision):
+		# 前の決定器で結果が決まらなかった場合にのみ、次の決定器を評価する
+		cost = 0.0
+		reach = 1.0
+		for c, p in estimates:
+			cost  += reach * c
+			reach *= p if _is_all(decision) else 1.0 - p
+		if _is_all(decision):
+			return (cost, reach)
+		return (cost, 1.0 - reach)
+	if isinstance(decision, DecisionCombination_XOR):
+		(c1, p1), (c2, p2) = estimates
+		return (c1 + c2, p1 * (1.0 - p2) + p2 * (1.0 - p1))
+	c, p = estimates[0]
+	return (c, 1.0 - p)
+
+#  ALL/ANY の評価の順序を、期待されるコストが最小になるよう並べ替える
+#  (ALL ではコスト / 偽になる確率、ANY ではコスト / 真になる確率の小さい順)
+def _reorder(decision, stats):
+	operands = _operands(decision)
+	if operands is None:
+		return decision
+	operands = [_reorder(d, stats) for d in operands]
+	if isinstance(decision, (DecisionCombination_ALL, DecisionCombination_ANY)):
+		isAll = isinstance(decision, DecisionCombination_ALL)
+		def key(d):
+			c, p = estimate_decision(d, stats)
+			q = 1.0 - p if isAll else p
+			return c / q if q > 0 else float('inf')
+		return type(decision)(sorted(operands, key=key))
+	if isinstance(decision, DecisionCombination_XOR):
+		return DecisionCombination_XOR(operands[0], operands[1])
+	return DecisionCombination_NOT(operands[0])
+
+def _measure_total(decision, samples):
+	seconds = 0.0
+	for data in samples:
+		_clear_cache(data)
+		t0 = time.perf_counter()
+		decision.decide(data)
+		seconds += time.perf_counter() - t0
+	return seconds / len(samples)
+
+#  決定器を最適化する
+#  samples を与えた場合は各決定器のコストと確率をそれから測り、与えない場合は
+#  決定器の estimated_cost (と既定の確率) を用いる。costs (決定器から (コスト, 確率)
+#  への辞書) を与えた場合はその値を優先する。
+#  最適化した決定器と、期待される (サンプルがあれば実測した) コストの報告を返す。
+def optimize_decision(decision, samples=None, costs=None):
+	if samples is not None:
+		samples = list(samples)
+	stats = {}
+	if samples:
+		stats.update(measure_decisions(decision, samples))
+	if costs is not None:
+		stats.update((id(d), v) for d, v in costs.items())
+	optimized = _reorder(flatten_decision(decision), stats)
+	before = estimate_decision(decision, stats)[0]
+	after  = estimate_decision(optimized, stats)[0]
+	report = {
+		'expected_cost_before': before,
+		'expected_cost_after':  after,
+		'expected_saving':      0.0 if before == 0 else 1.0 - after / before,
+	}
+	if samples:
+		before = _measure_total(decision, samples)
+		after  = _measure_total(optimized, samples)
+		report['measured_cost_before'] = before
+		report['measured_cost_after']  = after
+		report['measured_saving']      = 0.0 if before == 0 else 1.0 - after / before
+	return optimized, report
@@ -22,48 +22,56 @@
 #	PERFORMANCE OF THIS SOFTWARE.
 #
 #
-import json
 import ssdeep
-from .decision import Decision
+from .decision import Decision, NumericValue
 from .features import *
+from .vtscans import VTScanStore, get_scan_store
 
+#  各決定器の estimated_cost は、ファイルあたりの評価コストの (おおよその) 相対値
+#  (decisionopt による AND/OR の並べ替えに用いる)
+
+#  scansFile にはスキャン結果ファイルのパスか VTScanStore を与える
+#  (パスの場合、同じファイルを使う決定器の間でスキャン結果が共有される)
+#  index には SQLite 形式の索引を用いる場合にそのパス (もしくは True) を与える
+#  (get_scan_store を参照; 既定ではメモリ上に保持する)
 class VTDetectionNameDecision(Decision):
-	def __init__(self, scansFile, softwareName, detectionName):
-		self.scans = {}
-		with open(scansFile, 'r', encoding='utf-8') as f:
-			scans = json.load(f)
-			for scan in scans:
-				self.scans[scan['sha256']] = scan
+	estimated_cost = 0.1
+	def __init__(self, scansFile, softwareName, detectionName, index=None):
+		if isinstance(scansFile, VTScanStore):
+			self.scans = scansFile
+		else:
+			self.scans = get_scan_store(scansFile, index)
 		self.softwareName  = softwareName
 		self.detectionName = detectionName
 	def decide(self, data):
-		if data.sha256 not in self.scans:
-			return False
-		scan = self.scans[data.sha256]
-		if self.softwareName not in scan['scans']:
-			return False
-		if not scan['scans'][self.softwareName]['detected']:
-			return False
-		return scan['scans'][self.softwareName]['result'] == self.detectionName
+		result = self.scans.get_result(data.sha256, self.softwareName)
+		return result is not None and result == self.detectionName
 	def __repr__(self):
 		return 'VTDetectionNameDecision(<...>, {}, {})'.format(repr(self.softwareName), repr(self.detectionName))
 
 class BinStringDecision(Decision):
+	estimated_cost = 1.0
 	def __init__(self, pattern):
 		self.pattern = pattern
 	def decide(self, data):
 		x = data.data.find(self.pattern)
 		return x != -1
+	#  MultiPatternMatcher 用: (パターン, 印字可能文字の境界が必要か)
+	def get_search_pattern(self):
+		if not isinstance(self.pattern, (bytes, bytearray)):
+			return None
+		return (bytes(self.pattern), False)
 	def __repr__(self):
 		return 'BinStringDecision({})'.format(repr(self.pattern))
 
 class LstrfuzzyMatchDecision(Decision):
+	estimated_cost = 50.0
 	def __init__(self, fuzzyhash, threshold):
 		self.fuzzyhash = fuzzyhash
 		self.threshold = threshold
 		self.feature   = LstrfuzzyFeature()
 	def decide(self, data):
-		feature = self.feature.get_feature(data)
+		feature = data.get_feature(self.feature)
 		if not feature:
 			return False
 		return ssdeep.compare(feature, self.fuzzyhash) > self.threshold
@@ -71,12 +79,13 @@ class LstrfuzzyMatchDecision(Decision):
 		return 'LstrfuzzyMatchDecision({}, {})'.format(repr(self.fuzzyhash), repr(self.threshold))
 
 class FuzzyHashMatchDecision(Decision):
+	estimated_cost = 50.0
 	def __init__(self, fuzzyhash, threshold):
 		self.fuzzyhash = fuzzyhash
 		self.threshold = threshold
 		self.feature   = FuzzyHashFeature()
 	def decide(self, data):
-		feature = self.feature.get_feature(data)
+		feature = data.get_feature(self.feature)
 		if not feature:
 			return False
 		return ssdeep.compare(feature, self.fuzzyhash) > self.threshold
@@ -84,16 +93,18 @@ class FuzzyHashMatchDecision(Decision):
 		return 'FuzzyHashMatchDecision({}, {})'.format(repr(self.fuzzyhash), repr(self.threshold))
 
 class StringsExistenceDecision(Decision):
+	estimated_cost = 20.0
 	def __init__(self, match):
 		self.match   = match
 		self.feature = StringsFeature()
 	def decide(self, data):
-		feature = self.feature.get_feature(data)
+		feature = data.get_feature(self.feature)
 		return (self.match in feature)
 	def __repr__(self):
 		return 'StringsExistenceDecision({})'.format(repr(self.match))
 
 class StringsDecisionFast(Decision):
+	estimated_cost = 1.0
 	def __init__(self, match):
 		self.match = match.encode('ASCII')
 		self.matchlen = len(self.match)
@@ -108,14 +119,19 @@ class StringsDecisionFast(Decision):
 			if x + self.matchlen < len(data.data) and data.data[x+self.matchlen] >= 0x20 and data.data[x+self.matchlen] < 0x7f:
 				continue
 			return True
+	def get_search_pattern(self):
+		return (self.match, True)
 	def __repr__(self):
 		return 'StringsDecisionFast({})'.format(repr(self.match.decode('ASCII')))
 
 class PartialStringsDecisionFast(Decision):
+	estimated_cost = 1.0
 	def __init__(self, match):
 		self.match = match.encode('ASCII')
 	def decide(self, data):
 		return data.data.find(self.match) != -1
+	def get_search_pattern(self):
+		return (self.match, False)
 	def __repr__(self):
 		return 'PartialStringsDecisionFast({})'.format(repr(self.match.decode('ASCII')))
 
@@ -138,6 +154,29 @@ class DecisionCombination_OR(Decision):
 	def __repr__(self):
 		return 'DecisionCombination_OR({}, {})'.format(repr(self.d1), repr(self.d2))
 
+#  n 個の決定器の AND/OR (前から順に評価し、結果が決まった時点で打ち切る)
+class DecisionCombination_ALL(Decision):
+	def __init__(self, decisions):
+		self.decisions = list(decisions)
+	def decide(self, data):
+		for d in self.decisions:
+			if not d.decide(data):
+				return False
+		return True
+	def __repr__(self):
+		return 'DecisionCombination_ALL([{}])'.format(', '.join(repr(d) for d in self.decisions))
+
+class DecisionCombination_ANY(Decision):
+	def __init__(self, decisions):
+		self.decisions = list(decisions)
+	def decide(self, data):
+		for d in self.decisions:
+			if d.decide(data):
+				return True
+		return False
+	def __repr__(self):
+		return 'DecisionCombination_ANY([{}])'.format(', '.join(repr(d) for d in self.decisions))
+
 class DecisionCombination_XOR(Decision):
 	def __init__(self, d1, d2):
 		self.d1 = d1
@@ -156,9 +195,57 @@ class DecisionCombination_NOT(Decision):
 		return 'DecisionCombination_NOT({})'.format(repr(self.decision))
 
 class ConstantDecision(Decision):
+	estimated_cost = 0.0
 	def __init__(self, value):
 		self.value = value
 	def decide(self, data):
 		return self.value
 	def __repr__(self):
 		return 'ConstantDecision({})'.format(repr(self.value))
+
+
+#  数値を返す特徴 (C4_5DecisionLearner は、しきい値を自動的に選んで分岐する)
+#  (特徴量を求められない場合は 0 を返す)
+class FileEntropyValue(NumericValue):
+	estimated_cost = 5.0
+	def __init__(self):
+		self.feature = FileEntropyFeature()
+	def get_value(self, data):
+		return data.get_feature(self.feature)
+	def __repr__(self):
+		return 'FileEntropyValue()'
+
+class FuzzyHashScore(NumericValue):
+	estimated_cost = 50.0
+	def __init__(self, fuzzyhash):
+		self.fuzzyhash = fuzzyhash
+		self.feature   = FuzzyHashFeature()
+	def get_value(self, data):
+		feature = data.get_feature(self.feature)
+		if not feature:
+			return 0
+		return ssdeep.compare(feature, self.fuzzyhash)
+	def __repr__(self):
+		return 'FuzzyHashScore({})'.format(repr(self.fuzzyhash))
+
+class LstrfuzzyScore(NumericValue):
+	estimated_cost = 50.0
+	def __init__(self, fuzzyhash):
+		self.fuzzyhash = fuzzyhash
+		self.feature   = LstrfuzzyFeature()
+	def get_value(self, data):
+		feature = data.get_feature(self.feature)
+		if not feature:
+			return 0
+		return ssdeep.compare(feature, self.fuzzyhash)
+	def __repr__(self):
+		return 'LstrfuzzyScore({})'.format(repr(self.fuzzyhash))
+
+class SectionCountValue(NumericValue):
+	estimated_cost = 1.0
+	def get_value(self, data):
+		if not data.elffile or not data.elffile.section_headers:
+			return 0
+		return len(data.elffile.section_headers)
+	def __repr__(self):
+		return 'SectionCountValue()'
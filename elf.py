@@ -86,6 +86,8 @@ ELFOSABI_ARM        = 97
 ELFOSABI_STANDALONE = 255
 
 class __Elf_IdentHeader_impl:
+	# zstruct(slots=True) の構造体がインスタンスごとの __dict__ を持たないように
+	__slots__ = ()
 	def is_valid_elf(self):
 		#  ELF 識別情報が正しいものかを読み取る。
 		#   * 先頭から '\x7fELF' であること
@@ -117,7 +119,7 @@ class __Elf_IdentHeader_impl:
 	def get_class(self):
 		return self.e_ident[EI_CLASS]
 
-@zstruct.zstruct(('e_ident', '[16]unsigned char'))
+@zstruct.zstruct(('e_ident', '[16]unsigned char'), slots=True)
 class Elf_IdentHeader(__Elf_IdentHeader_impl):
 	pass
 
@@ -316,7 +318,7 @@ EM_BPF             = 247   # Linux BPF -- in-kernel virtual machine
 
 
 class __Elf_Ehdr_impl(__Elf_IdentHeader_impl):
-	pass
+	__slots__ = ()
 
 @zstruct.zstruct(
 	('e_ident',     '[16]unsigned char'),
@@ -339,6 +341,7 @@ class __Elf_Ehdr_impl(__Elf_IdentHeader_impl):
 		'Elf32_Addr': 'uint32_t',
 		'Elf32_Off':  'uint32_t',
 	},
+	slots = True,
 )
 class Elf32_Ehdr(__Elf_Ehdr_impl):
 	pass
@@ -364,6 +367,7 @@ class Elf32_Ehdr(__Elf_Ehdr_impl):
 		'Elf64_Addr': 'uint64_t',
 		'Elf64_Off':  'uint64_t',
 	},
+	slots = True,
 )
 class Elf64_Ehdr(__Elf_Ehdr_impl):
 	pass
@@ -419,7 +423,7 @@ SHF_GROUP      = 1 <<  9   # 0x0200
 SHF_TLS        = 1 << 10   # 0x0400
 
 class __Elf_Shdr_impl:
-	pass
+	__slots__ = ()
 
 @zstruct.zstruct(
 	('sh_name',       ':Elf32_Word'),
@@ -437,6 +441,7 @@ class __Elf_Shdr_impl:
 		'Elf32_Addr': 'uint32_t',
 		'Elf32_Off':  'uint32_t',
 	},
+	slots = True,
 )
 class Elf32_Shdr(__Elf_Shdr_impl):
 	pass
@@ -458,6 +463,7 @@ class Elf32_Shdr(__Elf_Shdr_impl):
 		'Elf64_Addr':  'uint64_t',
 		'Elf64_Off':   'uint64_t',
 	},
+	slots = True,
 )
 class Elf64_Shdr(__Elf_Shdr_impl):
 	pass
@@ -488,7 +494,7 @@ PF_W = 1 << 1  # 2
 PF_R = 1 << 2  # 4
 
 class __Elf_Phdr_impl:
-	pass
+	__slots__ = ()
 
 @zstruct.zstruct(
 	('p_type',       ':Elf32_Word'),
@@ -504,6 +510,7 @@ class __Elf_Phdr_impl:
 		'Elf32_Addr': 'uint32_t',
 		'Elf32_Off':  'uint32_t',
 	},
+	slots = True,
 )
 class Elf32_Phdr(__Elf_Phdr_impl):
 	pass
@@ -523,6 +530,7 @@ class Elf32_Phdr(__Elf_Phdr_impl):
 		'Elf64_Addr':  'uint64_t',
 		'Elf64_Off':   'uint64_t',
 	},
+	slots = True,
 )
 class Elf64_Phdr(__Elf_Phdr_impl):
 	pass
@@ -568,8 +576,10 @@ DT_FLAGS           = 30
 DT_ENCODING        = 32
 DT_PREINIT_ARRAY   = 32
 DT_PREINIT_ARRAYSZ = 33
+DT_GNU_HASH        = 0x6ffffef5
 
 class __Elf_Dyn_impl:
+	__slots__ = ()
 	# d_addr は d_val のエイリアス (/usr/include/elf.h にて union であることを確認)
 	#  * Elf32_Word  == Elf32_Addr
 	#  * Elf64_Xword == Elf64_Addr
@@ -587,6 +597,7 @@ class __Elf_Dyn_impl:
 		'Elf32_Sword':  'int32_t',
 		'Elf32_Word':  'uint32_t',
 	},
+	slots = True,
 )
 class Elf32_Dyn(__Elf_Dyn_impl):
 	pass
@@ -598,6 +609,90 @@ class Elf32_Dyn(__Elf_Dyn_impl):
 		'Elf64_Sxword':  'int64_t',
 		'Elf64_Xword':  'uint64_t',
 	},
+	slots = True,
 )
 class Elf64_Dyn(__Elf_Dyn_impl):
 	pass
+
+
+########################################################################
+#
+#   ELF シンボルテーブル
+#
+########################################################################
+
+#  st_info (上位 4 ビット: バインド)
+STB_LOCAL      =  0
+STB_GLOBAL     =  1
+STB_WEAK       =  2
+STB_GNU_UNIQUE = 10
+
+#  st_info (下位 4 ビット: 種類)
+STT_NOTYPE    =  0
+STT_OBJECT    =  1
+STT_FUNC      =  2
+STT_SECTION   =  3
+STT_FILE      =  4
+STT_COMMON    =  5
+STT_TLS       =  6
+STT_GNU_IFUNC = 10
+
+#  st_other (下位 2 ビット: 可視性)
+STV_DEFAULT   = 0
+STV_INTERNAL  = 1
+STV_HIDDEN    = 2
+STV_PROTECTED = 3
+
+#  st_info および st_other の分解 (32-bit と 64-bit で共通)
+def ELF_ST_BIND(info):
+	return info >> 4
+def ELF_ST_TYPE(info):
+	return info & 0xf
+def ELF_ST_INFO(bind, type):
+	return (bind << 4) + (type & 0xf)
+def ELF_ST_VISIBILITY(other):
+	return other & 0x03
+
+class __Elf_Sym_impl:
+	__slots__ = ()
+	def get_bind(self):
+		return ELF_ST_BIND(self.st_info)
+	def get_type(self):
+		return ELF_ST_TYPE(self.st_info)
+	def get_visibility(self):
+		return ELF_ST_VISIBILITY(self.st_other)
+
+@zstruct.zstruct(
+	('st_name',  ':Elf32_Word'),
+	('st_value', ':Elf32_Addr'),
+	('st_size',  ':Elf32_Word'),
+	('st_info',  'unsigned char'),
+	('st_other', 'unsigned char'),
+	('st_shndx', ':Elf32_Section'),
+	typedefs = {
+		'Elf32_Word':    'uint32_t',
+		'Elf32_Addr':    'uint32_t',
+		'Elf32_Section': 'uint16_t',
+	},
+	slots = True,
+)
+class Elf32_Sym(__Elf_Sym_impl):
+	pass
+
+@zstruct.zstruct(
+	('st_name',  ':Elf64_Word'),
+	('st_info',  'unsigned char'),  # Elf32 と位置が違うことに注意
+	('st_other', 'unsigned char'),
+	('st_shndx', ':Elf64_Section'),
+	('st_value', ':Elf64_Addr'),
+	('st_size',  ':Elf64_Xword'),
+	typedefs = {
+		'Elf64_Word':    'uint32_t',
+		'Elf64_Xword':   'uint64_t',
+		'Elf64_Addr':    'uint64_t',
+		'Elf64_Section': 'uint16_t',
+	},
+	slots = True,
+)
+class Elf64_Sym(__Elf_Sym_impl):
+	pass
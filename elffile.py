@@ -22,12 +22,159 @@
 #	PERFORMANCE OF THIS SOFTWARE.
 #
 #
+import array
+import bisect
+import mmap
+import sys
 from . import elf
+from . import zstruct
 
 
 
 
 
+#  文字列テーブル (.shstrtab, .dynstr など)
+#  テーブル全体を一度に読み取っておき、オフセットごとの文字列をキャッシュする。
+class ELFStringTable:
+	def __init__(self, data):
+		self.data = bytes(data)
+		self.__cache = {}
+	def __len__(self):
+		return len(self.data)
+	def get_string(self, offset):
+		s = self.__cache.get(offset)
+		if s is None:
+			if offset < 0:
+				raise ValueError('オフセット `{}\' は 0 未満になることができません。'.format(offset))
+			i = self.data.find(b'\0', offset)
+			s = self.data[offset:] if i == -1 else self.data[offset:i]
+			self.__cache[offset] = s
+		return s
+
+
+
+#  GNU 形式のハッシュ関数 (DT_GNU_HASH)
+def gnu_hash(name):
+	h = 5381
+	for c in name:
+		h = (h * 33 + c) & 0xffffffff
+	return h
+
+#  System V 形式のハッシュ関数 (DT_HASH)
+def sysv_hash(name):
+	h = 0
+	for c in name:
+		h = (h << 4) + c
+		g = h & 0xf0000000
+		if g:
+			h ^= g >> 24
+		h &= ~g
+	return h & 0xffffffff
+
+#  GNU 形式のシンボルハッシュテーブル (DT_GNU_HASH)
+class ELFGnuHashTable:
+	def __init__(self, symoffset, bloom_shift, bloom, bloom_bits, buckets, chain):
+		self.symoffset   = symoffset
+		self.bloom_shift = bloom_shift
+		self.bloom       = bloom
+		self.bloom_bits  = bloom_bits
+		self.buckets     = buckets
+		self.chain       = chain
+	#  ハッシュテーブルに含まれるシンボル数 (シンボルテーブルの長さ)
+	def symbol_count(self):
+		return self.symoffset + len(self.chain)
+	#  symoffset 未満のシンボル (未定義のシンボルなど) や、リンカーがハッシュを
+	#  記録していないシンボルは見つからない (ELFSymbolTable.lookup が名前の索引で補う)
+	def lookup(self, name, symtab):
+		if len(self.buckets) == 0 or len(self.bloom) == 0:
+			return None
+		h = gnu_hash(name)
+		# Bloom フィルターにより、存在しないシンボルの大半は即座に除外できる
+		C = self.bloom_bits
+		word = self.bloom[(h // C) % len(self.bloom)]
+		mask = (1 << (h % C)) | (1 << ((h >> self.bloom_shift) % C))
+		if word & mask != mask:
+			return None
+		i = self.buckets[h % len(self.buckets)]
+		if i < self.symoffset:
+			return None
+		while i - self.symoffset < len(self.chain):
+			h2 = self.chain[i - self.symoffset]
+			if (h | 1) == (h2 | 1) and symtab.get_name(i) == name:
+				return i
+			if h2 & 1:
+				break
+			i += 1
+		return None
+
+#  System V 形式のシンボルハッシュテーブル (DT_HASH)
+class ELFSysvHashTable:
+	def __init__(self, buckets, chain):
+		self.buckets = buckets
+		self.chain   = chain
+	def symbol_count(self):
+		return len(self.chain)
+	def lookup(self, name, symtab):
+		if len(self.buckets) == 0:
+			return None
+		i = self.buckets[sysv_hash(name) % len(self.buckets)]
+		visited = 0
+		while i != 0 and i < len(self.chain) and visited < len(self.chain):
+			if symtab.get_name(i) == name:
+				return i
+			i = self.chain[i]
+			visited += 1
+		return None
+
+#  シンボルテーブル (.symtab, .dynsym)
+#  各メンバーを列ごとの array.array として保持し、シンボル名は参照された時に解決する。
+class ELFSymbolTable:
+	def __init__(self, T, data, count, entsize, endian, strtab, offset=0):
+		self.sym_type   = T
+		self.strtab     = strtab
+		self.count      = count
+		self.columns    = T.unpack_columns(data, count, entsize, endian=endian, offset=offset)
+		self.hash_table = None
+		self.__names_index = None
+		for name, column in self.columns.items():
+			setattr(self, name, column)
+	def __len__(self):
+		return self.count
+	def __getitem__(self, index):
+		if index < 0:
+			index += self.count
+		if not (0 <= index < self.count):
+			raise IndexError('シンボルのインデックス `{}\' が範囲外です。'.format(index))
+		o = self.sym_type()
+		for name, column in self.columns.items():
+			setattr(o, name, column[index])
+		return o
+	def get_name(self, index):
+		if self.strtab is None:
+			return None
+		return self.strtab.get_string(self.st_name[index])
+	#  シンボル名からインデックスを探す (見つからなければ None)
+	#  ハッシュテーブルがあればまずそれを使い、見つからなければ (ハッシュテーブルに
+	#  含まれないシンボルもあるため) 名前の索引を一度だけ構築して探す。
+	#  このため、ハッシュテーブルの形式によらず同じシンボルが見つかる。
+	def lookup(self, name):
+		if isinstance(name, str):
+			name = name.encode('utf-8')
+		if self.hash_table is not None:
+			i = self.hash_table.lookup(name, self)
+			if i is not None:
+				return i
+		if self.__names_index is None:
+			t = {}
+			for i in range(1, self.count):
+				s = self.get_name(i)
+				if s and s not in t:
+					t[s] = i
+			self.__names_index = t
+		return self.__names_index.get(name)
+
+
+
 class ELFFile:
 
 	def __check_offset_and_length(self, offset, length):
@@ -42,8 +189,22 @@ class ELFFile:
 			return b''
 		return self.__f.read(length)
 
+	#  データ範囲の取得
+	#  (バイト列をバックエンドとする場合はコピーせずにバッファーとその中のオフセットを返す)
+	def __read_range(self, offset, length):
+		if self.__view is None:
+			return self.read_data(offset, length), 0
+		self.__check_offset_and_length(offset, length)
+		if offset + length > len(self.__view):
+			raise IOError('指定したオフセット `{}\' から長さ `{}\' のデータを読み取れません (実際の読み取り長: `{}\')。'\
+				.format(offset, length, max(len(self.__view) - offset, 0)))
+		return self.__view, offset
+
 	#  データの読み取り (できるだけ安全に)
 	def read_data(self, offset, length):
+		if self.__view is not None:
+			buf, offset = self.__read_range(offset, length)
+			return bytes(buf[offset:offset+length])
 		self.__check_offset_and_length(offset, length)
 		self.__f.seek(offset, 0)
 		if self.__f.tell() != offset:
@@ -54,9 +215,18 @@ class ELFFile:
 				.format(offset, length, len(data)))
 		return data
 
+	#  データの読み取り (バイト列をバックエンドとする場合はコピーせずに memoryview を返す)
+	def read_view(self, offset, length):
+		buf, offset = self.__read_range(offset, length)
+		if buf is self.__view:
+			return buf[offset:offset+length]
+		return memoryview(buf)
+
 	#  データの読み取り (読み取れなかった分のデータは補完しない)
 	def read_data_possible(self, offset, length):
 		self.__check_offset_and_length(offset, length)
+		if self.__view is not None:
+			return bytes(self.__view[offset:offset+length])
 		self.__f.seek(offset, 0)
 		if self.__f.tell() != offset or length == 0:
 			return b''
@@ -65,10 +235,13 @@ class ELFFile:
 	#  データの読み取り (読み取れなかった分のデータは 0 埋め)
 	def read_data_anyway(self, offset, length):
 		self.__check_offset_and_length(offset, length)
-		self.__f.seek(offset, 0)
-		if self.__f.tell() != offset or length == 0:
-			return b'\x00' * length
-		data = self.__f.read(length)
+		if self.__view is not None:
+			data = bytes(self.__view[offset:offset+length])
+		else:
+			self.__f.seek(offset, 0)
+			if self.__f.tell() != offset or length == 0:
+				return b'\x00' * length
+			data = self.__f.read(length)
 		if len(data) < length:
 			data += b'\x00' * (length - len(data))
 		return data
@@ -82,106 +255,177 @@ class ELFFile:
 	#  自動データ読み取り (ELF クラスおよびエンディアン分岐)
 	def read_data_type(self, offset, t32, t64):
 		T = self.get_data_type(t32, t64)
-		return T.init_from(self.read_data(offset, T.struct_length), endian=self.elf_ident_endian)
+		buf, offset = self.__read_range(offset, T.struct_length)
+		return T.init_from_buffer(buf, offset, endian=self.elf_ident_endian)
+
+	#  自動データ読み取り (テーブル; 一度の読み取りで全エントリーを取得する)
+	def read_data_type_array(self, offset, count, entsize, t32, t64):
+		T = self.get_data_type(t32, t64)
+		if count <= 0:
+			return []
+		if entsize < T.struct_length:
+			raise IOError('テーブルのエントリーサイズが小さすぎます。')
+		buf, offset = self.__read_range(offset, (count - 1) * entsize + T.struct_length)
+		return T.init_array_from(buf, count, entsize, endian=self.elf_ident_endian, offset=offset)
 
 
 
 	#
 	#  初期化
+	#  f にはファイルオブジェクトの他、バイト列 (bytes, bytearray, memoryview, mmap) を与えることができる。
+	#  バイト列を与えた場合、シークを行わずにその内容を直接 (できるだけコピーせずに) 読み取る。
 	def __init__(self, f):
-		self.__f = f  # ファイル
-		self.elf_ident = elf.Elf_IdentHeader.init_from(self.read_data(0, elf.Elf_IdentHeader.struct_length))
+		if isinstance(f, (bytes, bytearray, memoryview, mmap.mmap)):
+			self.__f    = None
+			self.__view = memoryview(f).cast('B')  # バイト列
+		else:
+			self.__f    = f  # ファイル
+			self.__view = None
+		buf, offset = self.__read_range(0, elf.Elf_IdentHeader.struct_length)
+		self.elf_ident = elf.Elf_IdentHeader.init_from_buffer(buf, offset)
 		self.elf_ident_class  = self.elf_ident.get_class()
 		self.elf_ident_endian = self.elf_ident.get_endian()
 		if not self.elf_ident.is_valid_elf():
 			raise ValueError('指定されたファイルは正しい ELF ファイルではありません。')
 		self.elf_header = self.read_data_type(0, elf.Elf32_Ehdr, elf.Elf64_Ehdr)
-		if True:
-			try:
-				self.read_program_headers()
-			except:
-				pass
+		#  プログラムヘッダー・セクションヘッダー・動的リンク情報は最初に参照された時に読み取る。
+		#  読み取りに失敗した場合、その例外は parse_errors に記録される。
+		self.__parsed = {}
+		self.__string_tables = {}
+		self.parse_errors = {}
+
+	#  遅延読み取り (失敗した場合は例外を記録し、既定値もしくは途中までの結果を使う)
+	def __parse_lazily(self, name, func, default):
+		if name not in self.__parsed:
 			try:
-				self.read_section_headers()
-			except:
-				pass
-		else:
-			self.read_program_headers()
-			self.read_section_headers()
+				func()
+			except Exception as e:
+				self.parse_errors[name] = e
+			self.__parsed.setdefault(name, default)
+		return self.__parsed[name]
+
+	@property
+	def program_headers(self):
+		return self.__parse_lazily('program_headers', self.read_program_headers, None)
+	@property
+	def program_loadinfo(self):
+		if 'program_loadinfo' not in self.__parsed:
+			self.__parsed['program_loadinfo'] = [x for x in (self.program_headers or []) if x.p_type == elf.PT_LOAD]
+		return self.__parsed['program_loadinfo']
+	@property
+	def dynamic_header(self):
+		self.__parse_lazily('dynamic_headers', self.__init_dynamic, {})
+		return self.__parsed['dynamic_header']
+	@property
+	def dynamic_headers(self):
+		return self.__parse_lazily('dynamic_headers', self.__init_dynamic, {})
+	@property
+	def section_headers(self):
+		return self.__parse_lazily('section_headers', self.read_section_headers, None)
 
 	#  プログラムヘッダーの読み取り
 	def read_program_headers(self):
-		self.program_headers  = None
-		self.program_loadinfo = []
-		self.dynamic_header   = None
-		self.dynamic_headers  = {}
 		ptype = self.get_data_type(elf.Elf32_Phdr, elf.Elf64_Phdr)
 		t = []
 		if self.elf_header.e_phoff != 0 and self.elf_header.e_phnum > 0:
 			if self.elf_header.e_phentsize < ptype.struct_length:
 				raise IOError('プログラムヘッダーのエントリーサイズが小さすぎます。')
-			for i in range(self.elf_header.e_phnum):
-				t.append(self.read_data_type(self.elf_header.e_phoff + i * self.elf_header.e_phentsize, elf.Elf32_Phdr, elf.Elf64_Phdr))
-		self.program_headers = t
-		self.__init_loadinfo()
-		self.__init_dynamic()
-	def __init_loadinfo(self):
-		self.program_loadinfo = [x for x in self.program_headers if x.p_type == elf.PT_LOAD]
+			t = self.read_data_type_array(self.elf_header.e_phoff, self.elf_header.e_phnum, self.elf_header.e_phentsize, elf.Elf32_Phdr, elf.Elf64_Phdr)
+		self.__parsed['program_headers'] = t
+		self.__parsed.pop('program_loadinfo', None)
+		self.__parsed.pop('vaddr_index', None)
+		return t
 
 	#  動的リンクヘッダーの読み取り
 	def __init_dynamic(self):
-		for ph in self.program_headers:
+		self.__parsed['dynamic_header']  = None
+		self.__parsed['dynamic_headers'] = {}
+		for ph in (self.program_headers or []):
 			if ph.p_type != elf.PT_DYNAMIC:
 				continue
-			self.dynamic_header = ph
+			self.__parsed['dynamic_header'] = ph
 			ptype = self.get_data_type(elf.Elf32_Dyn, elf.Elf64_Dyn)
 			plen  = ptype.struct_length
-			for i in range(ph.p_memsz // plen):
-				d = ptype.init_from(self.read_by_vaddr(ph.p_vaddr + i * plen, plen), endian=self.elf_ident_endian)
-				self.dynamic_headers[d.d_tag] = d.d_val
-				if d.d_tag == elf.DT_NULL:
-					break
+			# DT_NULL が見つかるまで、ある程度の数のエントリーをまとめて読み取る
+			CHUNK_ENTRIES = 64
+			nent = ph.p_memsz // plen
+			for i in range(0, nent, CHUNK_ENTRIES):
+				n = min(CHUNK_ENTRIES, nent - i)
+				data = self.read_by_vaddr(ph.p_vaddr + i * plen, n * plen)
+				for d in ptype.init_array_from(data, n, endian=self.elf_ident_endian):
+					self.__parsed['dynamic_headers'][d.d_tag] = d.d_val
+					if d.d_tag == elf.DT_NULL:
+						return
 			return
 
 	#  セクションヘッダーの読み取り
 	def read_section_headers(self):
-		self.section_headers = None
 		ptype = self.get_data_type(elf.Elf32_Shdr, elf.Elf64_Shdr)
 		t = []
 		if self.elf_header.e_shoff != 0 and self.elf_header.e_shnum > 0:
 			if self.elf_header.e_shentsize < ptype.struct_length:
-				raise IOError('プログラムヘッダーのエントリーサイズが小さすぎます。')
-			for i in range(self.elf_header.e_shnum):
-				t.append(self.read_data_type(self.elf_header.e_shoff + i * self.elf_header.e_shentsize, elf.Elf32_Shdr, elf.Elf64_Shdr))
-		self.section_headers = t
+				raise IOError('セクションヘッダーのエントリーサイズが小さすぎます。')
+			t = self.read_data_type_array(self.elf_header.e_shoff, self.elf_header.e_shnum, self.elf_header.e_shentsize, elf.Elf32_Shdr, elf.Elf64_Shdr)
+		self.__parsed['section_headers'] = t
+		self.__parsed.pop('section_string_table', None)
+		self.__parsed.pop('sections_by_name', None)
+		self.__parsed.pop('symbols', None)
+		self.__parsed.pop('dynamic_symbols', None)
+		self.__string_tables.clear()
+		return t
+
+	#  PT_LOAD セグメントの仮想アドレスによる索引
+	#  (開始アドレス順に並べ、二分探索で対象のセグメントを探す)
+	def __vaddr_index(self):
+		if 'vaddr_index' not in self.__parsed:
+			segs = []
+			for i, loadinfo in enumerate(self.program_loadinfo):
+				# TODO: p_align のハンドリング
+				if loadinfo.p_memsz == 0:
+					continue
+				segs.append((
+					loadinfo.p_vaddr,
+					loadinfo.p_vaddr + loadinfo.p_filesz,
+					loadinfo.p_vaddr + loadinfo.p_memsz,
+					loadinfo.p_offset,
+					i,
+				))
+			segs.sort()
+			# セグメントが重なっている場合に備え、終端アドレスの累積最大値も保持する
+			maxends = []
+			m = None
+			for seg in segs:
+				m = seg[2] if m is None or seg[2] > m else m
+				maxends.append(m)
+			self.__parsed['vaddr_index'] = ([seg[0] for seg in segs], segs, maxends)
+		return self.__parsed['vaddr_index']
 
 	#  プログラムヘッダーによって指定されるアドレスの読み取り (ロードされない部分はゼロバイト埋め)
 	def read_by_vaddr(self, vaddr, length):
 		if length == 0:
 			return b''
+		starts, segs, maxends = self.__vaddr_index()
+		end = vaddr + length
+		# 範囲と重なるセグメントを探す
+		found = []
+		i = bisect.bisect_left(starts, end) - 1
+		while i >= 0 and maxends[i] > vaddr:
+			if segs[i][2] > vaddr:
+				found.append(segs[i])
+			i -= 1
+		# 単一のセグメントのファイル上のデータに収まる場合は直接読み取る
+		if len(found) == 1 and found[0][0] <= vaddr and end <= found[0][1]:
+			return self.read_data_anyway(found[0][3] + (vaddr - found[0][0]), length)
 		data = bytearray(length)
-		for loadinfo in self.program_loadinfo:
-			# TODO: p_align のハンドリング
-			off = loadinfo.p_vaddr - vaddr
-			p1 = loadinfo.p_vaddr
-			p2 = loadinfo.p_vaddr + loadinfo.p_filesz
-			p3 = loadinfo.p_vaddr + loadinfo.p_memsz
-			p1 -= vaddr
-			p2 -= vaddr
-			p3 -= vaddr
-			if p1 < 0:
-				p1 = 0
-			if p3 > length:
-				p3 = length
-			if p2 < 0:
-				p2 = 0
-			elif p2 > length:
-				p2 = length
-			if p3 <= 0 or length <= p1 or p1 == p3:
-				continue
-			data[p1:p2] = self.read_data_anyway(loadinfo.p_offset + p1 - off, p2 - p1)
-			for i in range(p2, p3):
-				data[i] = 0
+		# 重なっている場合は後のプログラムヘッダーを優先する
+		found.sort(key=lambda seg: seg[4])
+		for start, fileend, memend, offset, order in found:
+			p1 = max(start - vaddr, 0)
+			p2 = min(max(fileend - vaddr, 0), length)
+			p3 = min(memend - vaddr, length)
+			data[p1:p2] = self.read_data_anyway(offset + (vaddr - start) + p1, p2 - p1)
+			if p2 < p3:
+				data[p2:p3] = bytes(p3 - p2)
 		return bytes(data)
 
 	#  ヌル終端文字列の読み取り
@@ -201,4 +445,194 @@ class ELFFile:
 	def read_string_by_offset(self, offset):
 		return self.__read_string_by_addr(offset, self.read_data_anyway)
 	def read_string_by_vaddr(self, vaddr):
-		return self.__read_string_by_addr(offset, self.read_by_vaddr)
+		return self.__read_string_by_addr(vaddr, self.read_by_vaddr)
+
+	#  文字列テーブルの読み取り (セクションとして; 一度読み取ったものはキャッシュされる)
+	def read_string_table_section(self, index):
+		key = ('section', index)
+		if key not in self.__string_tables:
+			sh = self.section_headers[index]
+			if sh.sh_type == elf.SHT_NOBITS:
+				data = b''
+			else:
+				data = self.read_data_anyway(sh.sh_offset, sh.sh_size)
+			self.__string_tables[key] = ELFStringTable(data)
+		return self.__string_tables[key]
+
+	#  セクション名の文字列テーブル (e_shstrndx)
+	def __init_section_string_table(self):
+		section_headers = self.section_headers
+		self.__parsed['section_string_table'] = None
+		if not section_headers:
+			return
+		index = self.elf_header.e_shstrndx
+		if index == elf.SHN_UNDEF:
+			return
+		if index == elf.SHN_XINDEX:
+			# セクション数が多い場合、実際のインデックスは最初のセクションヘッダーの sh_link に入る
+			index = section_headers[0].sh_link
+		self.__parsed['section_string_table'] = self.read_string_table_section(index)
+	@property
+	def section_string_table(self):
+		return self.__parse_lazily('section_string_table', self.__init_section_string_table, None)
+
+	#  動的リンク用の文字列テーブル (DT_STRTAB および DT_STRSZ)
+	def __init_dynamic_string_table(self):
+		self.__parsed['dynamic_string_table'] = None
+		dyn = self.dynamic_headers
+		if elf.DT_STRTAB not in dyn or elf.DT_STRSZ not in dyn:
+			return
+		self.__parsed['dynamic_string_table'] = ELFStringTable(self.read_by_vaddr(dyn[elf.DT_STRTAB], dyn[elf.DT_STRSZ]))
+	@property
+	def dynamic_string_table(self):
+		return self.__parse_lazily('dynamic_string_table', self.__init_dynamic_string_table, None)
+
+	#  セクション名の取得
+	def get_section_name(self, sh):
+		strtab = self.section_string_table
+		if strtab is None:
+			return None
+		return strtab.get_string(sh.sh_name)
+
+	#  セクション名による索引 (同名のセクションがある場合は最初のものを使う)
+	def __init_sections_by_name(self):
+		section_headers = self.section_headers
+		t = {}
+		self.__parsed['sections_by_name'] = t
+		for sh in (section_headers or []):
+			name = self.get_section_name(sh)
+			if name is not None and name not in t:
+				t[name] = sh
+	@property
+	def sections_by_name(self):
+		return self.__parse_lazily('sections_by_name', self.__init_sections_by_name, {})
+
+	#  ワード列の読み取り (仮想アドレスによる; ハッシュテーブル用)
+	def __read_words_by_vaddr(self, vaddr, count, typecode):
+		MAX_WORDS = 1 << 24
+		if count > MAX_WORDS:
+			raise IOError('テーブルの要素数 `{}\' が大きすぎます。'.format(count))
+		a = array.array(typecode)
+		a.frombytes(self.read_by_vaddr(vaddr, count * a.itemsize))
+		if (self.elf_ident_endian == zstruct.ENDIAN_LITTLE) != (sys.byteorder == 'little'):
+			a.byteswap()
+		return a
+
+	#  仮想アドレス vaddr を含むセグメントの、ファイル上のデータの終端 (仮想アドレス)
+	#  (vaddr を含むセグメントが無い場合は vaddr)
+	def __file_backed_end(self, vaddr):
+		starts, segs, maxends = self.__vaddr_index()
+		end = vaddr
+		i = bisect.bisect_right(starts, vaddr) - 1
+		while i >= 0 and maxends[i] > vaddr:
+			if segs[i][1] > vaddr:
+				end = max(end, segs[i][1])
+			i -= 1
+		return end
+
+	#  GNU 形式のハッシュテーブルの読み取り
+	#  (symcount が不明な場合、チェーンの終端からシンボル数を求める)
+	def __read_gnu_hash(self, vaddr, symcount=None):
+		nbuckets, symoffset, bloom_size, bloom_shift = self.__read_words_by_vaddr(vaddr, 4, 'I')
+		bloom_type = self.get_data_type('I', 'Q')
+		bloom   = self.__read_words_by_vaddr(vaddr + 16, bloom_size, bloom_type)
+		vaddr  += 16 + bloom_size * bloom.itemsize
+		buckets = self.__read_words_by_vaddr(vaddr, nbuckets, 'I')
+		vaddr  += nbuckets * 4
+		if symcount is None:
+			last = max(buckets) if len(buckets) else 0
+			if last < symoffset:
+				symcount = symoffset
+			else:
+				# 最後のバケットが指すチェーンを終端 (最下位ビットが 1) まで辿る
+				# (ファイル上のデータを持つ、チェーンを含むセグメントの終端までに限る;
+				# それ以降はゼロ埋めされるため、壊れたバケットでは終端が見つからない)
+				CHUNK_WORDS = 256
+				n = last - symoffset
+				limit = self.__file_backed_end(vaddr)
+				while True:
+					count = min(CHUNK_WORDS, (limit - (vaddr + n * 4)) // 4)
+					if count <= 0:
+						raise IOError('GNU 形式のハッシュテーブルのチェーンの終端が見つかりません。')
+					chunk = self.__read_words_by_vaddr(vaddr + n * 4, count, 'I')
+					ends = [i for i, h in enumerate(chunk) if h & 1]
+					if ends:
+						symcount = symoffset + n + ends[0] + 1
+						break
+					n += count
+		chain = self.__read_words_by_vaddr(vaddr, max(symcount - symoffset, 0), 'I')
+		return ELFGnuHashTable(symoffset, bloom_shift, bloom, bloom.itemsize * 8, buckets, chain)
+
+	#  System V 形式のハッシュテーブルの読み取り
+	def __read_sysv_hash(self, vaddr):
+		nbuckets, nchain = self.__read_words_by_vaddr(vaddr, 2, 'I')
+		buckets = self.__read_words_by_vaddr(vaddr + 8, nbuckets, 'I')
+		chain   = self.__read_words_by_vaddr(vaddr + 8 + nbuckets * 4, nchain, 'I')
+		return ELFSysvHashTable(buckets, chain)
+
+	#  セクションとしてのシンボルテーブルの読み取り
+	def __read_symbol_table_section(self, sh):
+		T = self.get_data_type(elf.Elf32_Sym, elf.Elf64_Sym)
+		entsize = sh.sh_entsize if sh.sh_entsize else T.struct_length
+		if entsize < T.struct_length:
+			raise IOError('シンボルテーブルのエントリーサイズが小さすぎます。')
+		count = sh.sh_size // entsize
+		strtab = None
+		if 0 < sh.sh_link < len(self.section_headers):
+			strtab = self.read_string_table_section(sh.sh_link)
+		if count == 0:
+			return ELFSymbolTable(T, b'', 0, entsize, self.elf_ident_endian, strtab)
+		buf, offset = self.__read_range(sh.sh_offset, (count - 1) * entsize + T.struct_length)
+		return ELFSymbolTable(T, buf, count, entsize, self.elf_ident_endian, strtab, offset)
+
+	#  静的シンボルテーブル (SHT_SYMTAB)
+	def __init_symbols(self):
+		section_headers = self.section_headers
+		self.__parsed['symbols'] = None
+		for sh in (section_headers or []):
+			if sh.sh_type == elf.SHT_SYMTAB:
+				self.__parsed['symbols'] = self.__read_symbol_table_section(sh)
+				return
+
+	#  動的シンボルテーブル (SHT_DYNSYM; セクションヘッダーが無い場合は DT_SYMTAB)
+	def __init_dynamic_symbols(self):
+		section_headers = self.section_headers
+		dyn = self.dynamic_headers
+		self.__parsed['dynamic_symbols'] = None
+		symtab = None
+		for sh in (section_headers or []):
+			if sh.sh_type == elf.SHT_DYNSYM:
+				symtab = self.__read_symbol_table_section(sh)
+				break
+		# ハッシュテーブル (GNU 形式を優先)
+		hashtab = None
+		if elf.DT_GNU_HASH in dyn:
+			hashtab = self.__read_gnu_hash(dyn[elf.DT_GNU_HASH], None if symtab is None else len(symtab))
+		elif elf.DT_HASH in dyn:
+			hashtab = self.__read_sysv_hash(dyn[elf.DT_HASH])
+		if symtab is None:
+			# ストリップされたバイナリ: シンボル数をハッシュテーブルから求める
+			if elf.DT_SYMTAB not in dyn:
+				return
+			T = self.get_data_type(elf.Elf32_Sym, elf.Elf64_Sym)
+			entsize = dyn.get(elf.DT_SYMENT, T.struct_length)
+			if entsize < T.struct_length:
+				raise IOError('シンボルテーブルのエントリーサイズが小さすぎます。')
+			if hashtab is not None:
+				count = hashtab.symbol_count()
+			elif elf.DT_STRTAB in dyn and dyn[elf.DT_STRTAB] > dyn[elf.DT_SYMTAB]:
+				# 一般的な配置 (.dynsym の直後に .dynstr) を仮定する
+				count = (dyn[elf.DT_STRTAB] - dyn[elf.DT_SYMTAB]) // entsize
+			else:
+				return
+			data = self.read_by_vaddr(dyn[elf.DT_SYMTAB], count * entsize)
+			symtab = ELFSymbolTable(T, data, count, entsize, self.elf_ident_endian, self.dynamic_string_table)
+		symtab.hash_table = hashtab
+		self.__parsed['dynamic_symbols'] = symtab
+
+	#  シンボルテーブルの取得 (dynamic が真の場合は動的シンボルテーブル)
+	#  テーブルは最初の呼び出しで一度に読み取られ、キャッシュされる。
+	def symbols(self, dynamic=False):
+		if dynamic:
+			return self.__parse_lazily('dynamic_symbols', self.__init_dynamic_symbols, None)
+		return self.__parse_lazily('symbols', self.__init_symbols, None)
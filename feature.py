@@ -0,0 +1,40 @@
+#
+#
+#	z2kit v2 : Security Camp track Z2 : sort of analysis framework
+#
+#	feature.py
+#	Template for feature (used by decisions)
+#
+#	Copyright (C) 2018 Tsukasa OI.
+#
+#	Permission to use, copy, modify, and/or distribute this software
+#	for any purpose with or without fee is hereby granted, provided
+#	that the above copyright notice and this permission notice
+#	appear in all copies.
+#
+#	THE SOFTWARE IS PROVIDED “AS IS” AND ISC DISCLAIMS ALL WARRANTIES
+#	WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+#	MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL ISC BE LIABLE FOR
+#	ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+#	DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+#	WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+#	ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+#	PERFORMANCE OF THIS SOFTWARE.
+#
+#
+import abc
+
+class Feature(metaclass=abc.ABCMeta):
+	@abc.abstractmethod
+	def get_feature(self, data):
+		raise NotImplementedError()
+	#  特徴量のキャッシュに用いるキー
+	#  (パラメーターを持つ特徴量は、パラメーターもキーに含めるよう上書きすること)
+	def cache_key(self):
+		return (type(self),)
+	#  特徴量の版 (計算方法を変えた場合は増やすこと; 特徴量ストアに残る古い値を使わないため)
+	version = 1
+	#  特徴量ストアに用いる名前 (cache_key から作る)
+	def store_name(self):
+		key = self.cache_key()
+		return key[0].__name__ + (repr(key[1:]) if len(key) > 1 else '')
@@ -22,11 +22,22 @@
 #	PERFORMANCE OF THIS SOFTWARE.
 #
 #
+import array
+import collections
 import math
+import re
 import ssdeep
 from . import elf
+from .feature import Feature
+from .filedata import iter_chunks
 
-class LstrfuzzyFeature:
+#  numpy があれば使う (無くても動作する)
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+class LstrfuzzyFeature(Feature):
 	def get_feature(self, data):
 		# 動的リンクされた ELF ファイルでない限り、None を返す
 		if not data.elffile:
@@ -38,43 +49,141 @@ class LstrfuzzyFeature:
 		# 文字列テーブルの ssdeep ハッシュを取る
 		return ssdeep.hash(data.elffile.read_by_vaddr(data.elffile.dynamic_headers[elf.DT_STRTAB], data.elffile.dynamic_headers[elf.DT_STRSZ]))
 
-class FuzzyHashFeature:
+#  ファイルへのマッピング (FileData の streaming=True) の場合、ファイル全体を
+#  コピーせずに少しずつハッシュを計算する
+class FuzzyHashFeature(Feature):
 	def get_feature(self, data):
-		return ssdeep.hash(data.data)
+		if isinstance(data.data, bytes):
+			return ssdeep.hash(data.data)
+		h = ssdeep.Hash()
+		for chunk in iter_chunks(data.data):
+			h.update(bytes(chunk))
+		return h.digest()
 
-class StringsFeature:
+#  印字可能な ASCII 文字 (0x20-0x7e) が min_length 文字以上連続する部分を数える
+#  encoding に 'utf-16le' を指定した場合、UTF-16LE の ASCII 範囲の文字列を数える
+#  (この場合も辞書のキーは ASCII のバイト列)。
+class StringsFeature(Feature):
+	def __init__(self, min_length=4, encoding='ascii'):
+		if min_length < 1:
+			raise ValueError('最小の長さ `{}\' は 1 以上でなければなりません。'.format(min_length))
+		if encoding not in ('ascii', 'utf-16le'):
+			raise ValueError('`{}\': サポートされていないエンコーディングです。'.format(encoding))
+		self.min_length = min_length
+		self.encoding   = encoding
+		if encoding == 'ascii':
+			self.pattern = re.compile(rb'[\x20-\x7e]{%d,}' % min_length)
+		else:
+			self.pattern = re.compile(rb'(?:[\x20-\x7e]\x00){%d,}' % min_length)
+	def cache_key(self):
+		return (type(self), self.min_length, self.encoding)
 	def get_feature(self, data):
-		feature = {}
-		s = bytearray()
-		for ch in data.data:
-			if ch >= 0x20 and ch < 0x7f:
-				s.append(ch)
-			else:
-				if len(s) >= 4:
-					s = bytes(s)
-					if s not in feature:
-						feature[s] = 1
-					else:
-						feature[s] += 1
-				s = bytearray()
-		if len(s) >= 4:
-			s = bytes(s)
-			if s not in feature:
-				feature[s] = 1
-			else:
-				feature[s] += 1
-		return feature
+		strings = self.pattern.findall(data.data)
+		if self.encoding != 'ascii':
+			strings = [s[::2] for s in strings]
+		return dict(collections.Counter(strings))
+
+#  バイト値ごとの出現回数 (Python のループを使わずに数える)
+#  (bincount は入力を整数型に変換するため、大きなデータは一定の大きさごとに数える)
+def byte_histogram(data):
+	if numpy is not None:
+		counts = numpy.zeros(256, dtype=numpy.int64)
+		for chunk in iter_chunks(data):
+			counts += numpy.bincount(numpy.frombuffer(chunk, dtype=numpy.uint8), minlength=256)
+		return counts.tolist()
+	counter = collections.Counter()
+	for chunk in iter_chunks(data):
+		counter.update(chunk)
+	counts = [ 0 ] * 256
+	for ch, n in counter.items():
+		counts[ch] = n
+	return counts
+
+#  出現回数からのエントロピー (bit/byte; 空のデータでは 0)
+def histogram_entropy(counts):
+	entropy = 0.0
+	total = sum(counts)
+	if total == 0:
+		return entropy
+	for i in range(256):
+		p = float(counts[i]) / total
+		if p == 0:
+			continue
+		entropy -= p * math.log2(p)
+	return entropy
+
+#  窓 (window バイト; step バイトずつずらす) ごとのエントロピー
+def windowed_entropy(data, window, step=None):
+	if step is None:
+		step = window
+	view = memoryview(data).cast('B')
+	n = len(view)
+	starts = range(0, max(n - window, 0) + 1, step) if n else range(0)
+	result = array.array('d')
+	if numpy is not None and n >= window:
+		# 窓ごとの出現回数を bincount でまとめて数える (メモリ使用量を抑えるため一定数の窓ごとに処理)
+		a = numpy.frombuffer(view, dtype=numpy.uint8)
+		offsets = numpy.arange(window)
+		BATCH = 256
+		starts = numpy.asarray(starts)
+		for i in range(0, len(starts), BATCH):
+			s = starts[i:i+BATCH]
+			idx = a[s[:, None] + offsets].astype(numpy.intp) + (numpy.arange(len(s)) * 256)[:, None]
+			counts = numpy.bincount(idx.ravel(), minlength=len(s) * 256).reshape(len(s), 256)
+			p = counts / float(window)
+			with numpy.errstate(divide='ignore', invalid='ignore'):
+				e = -numpy.where(p > 0, p * numpy.log2(p), 0.0).sum(axis=1)
+			result.extend(e.tolist())
+		return result
+	for i in starts:
+		result.append(histogram_entropy(byte_histogram(view[i:i+window])))
+	return result
 
-class FileEntropyFeature:
+class FileEntropyFeature(Feature):
 	def get_feature(self, data):
-		entropy = 0
-		counts = [ 0 ] * 256
-		for ch in data.data:
-			counts[ch] += 1
-		total = len(data.data)
-		for i in range(256):
-			p = float(counts[i]) / total
-			if p == 0:
+		return histogram_entropy(byte_histogram(data.data))
+
+#  エントロピーの分布
+#  ファイル全体と、ELF ファイルであれば PT_LOAD セグメントおよびセクションごとに、
+#  全体のエントロピーと窓ごとのエントロピーを求める (パックされたバイナリの検出用)。
+class EntropyProfileFeature(Feature):
+	def __init__(self, window=4096, step=None):
+		if window < 1:
+			raise ValueError('窓の大きさ `{}\' は 1 以上でなければなりません。'.format(window))
+		if step is not None and step < 1:
+			raise ValueError('窓をずらす幅 `{}\' は 1 以上でなければなりません。'.format(step))
+		self.window = window
+		self.step   = window if step is None else step
+	def cache_key(self):
+		return (type(self), self.window, self.step)
+	def __region(self, view, offset, size):
+		region = view[offset:offset+size]
+		return {
+			'offset':  offset,
+			'size':    len(region),
+			'entropy': histogram_entropy(byte_histogram(region)),
+			'windows': windowed_entropy(region, self.window, self.step),
+		}
+	def get_feature(self, data):
+		view = memoryview(data.data).cast('B')
+		feature = {
+			'file':     self.__region(view, 0, len(view)),
+			'segments': [],
+			'sections': [],
+		}
+		e = data.elffile
+		if not e:
+			return feature
+		for ph in e.program_loadinfo:
+			if ph.p_filesz == 0:
 				continue
-			entropy -= p * math.log2(p)
-		return entropy
+			region = self.__region(view, ph.p_offset, ph.p_filesz)
+			region['vaddr'] = ph.p_vaddr
+			feature['segments'].append(region)
+		for sh in (e.section_headers or []):
+			if sh.sh_type == elf.SHT_NOBITS or sh.sh_size == 0:
+				continue
+			region = self.__region(view, sh.sh_offset, sh.sh_size)
+			region['name'] = e.get_section_name(sh)
+			feature['sections'].append(region)
+		return feature
@@ -0,0 +1,185 @@
+#
+#
+#	z2kit v2 : Security Camp track Z2 : sort of analysis framework
+#
+#	featurestore.py
+#	Persistent feature store (keyed by SHA-256 of the file)
+#
+#	Copyright (C) 2018 Tsukasa OI.
+#
+#	Permission to use, copy, modify, and/or distribute this software
+#	for any purpose with or without fee is hereby granted, provided
+#	that the above copyright notice and this permission notice
+#	appear in all copies.
+#
+#	THE SOFTWARE IS PROVIDED “AS IS” AND ISC DISCLAIMS ALL WARRANTIES
+#	WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+#	MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL ISC BE LIABLE FOR
+#	ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+#	DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+#	WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+#	ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+#	PERFORMANCE OF THIS SOFTWARE.
+#
+#
+import os
+import pickle
+import sqlite3
+import time
+
+#  ストアの形式の版 (形式を変えた場合は増やすこと)
+STORE_VERSION = 1
+
+#  特徴量 (や決定器の判定結果) を SQLite に保存する
+#  キーは (ファイルの SHA-256, 名前, 版) で、値は pickle して保存する。
+#  max_bytes を与えた場合、値の大きさの合計がこれを超えると、最も長く参照されて
+#  いないものから削除する (LRU)。書き込みと参照時刻の更新は、それぞれ COMMIT_INTERVAL 件ごと
+#  (もしくは flush() を呼んだ時) にまとめて反映される。
+#  複数のプロセスから同時に使うことができる (プロセスごとに接続を開き直す)。
+class FeatureStore:
+	COMMIT_INTERVAL = 256
+
+	def __init__(self, path, max_bytes=None):
+		self.path = os.path.abspath(path)
+		self.max_bytes = max_bytes
+		self.hits   = 0
+		self.misses = 0
+		self.__db = None
+		self.__pid = None
+		self.__pending = 0
+		self.__touched = []
+		self.__connection()
+
+	#  SQLite の接続はプロセスをまたいで共有できないため、プロセスごとに開き直す
+	def __connection(self):
+		if self.__db is None or self.__pid != os.getpid():
+			self.__db = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+			self.__pid = os.getpid()
+			self.__pending = 0
+			self.__touched = []
+			self.__db.executescript('''
+				PRAGMA journal_mode = WAL;
+				PRAGMA synchronous = NORMAL;
+				CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+				CREATE TABLE IF NOT EXISTS features (
+					sha256 TEXT, name TEXT, version TEXT, value BLOB,
+					size INTEGER, atime REAL,
+					PRIMARY KEY (sha256, name, version)) WITHOUT ROWID;
+				CREATE INDEX IF NOT EXISTS features_atime ON features (atime);
+			''')
+			self.__db.execute('INSERT OR IGNORE INTO meta VALUES (?, ?)', ('version', str(STORE_VERSION)))
+			row = self.__db.execute('SELECT value FROM meta WHERE key = ?', ('version',)).fetchone()
+			self.__db.commit()
+			if row[0] != str(STORE_VERSION):
+				raise ValueError('`{}\': 特徴量ストアの形式の版が異なります。'.format(self.path))
+		return self.__db
+
+	#  値の取得 (found, value) を返す
+	def get(self, sha256, name, version):
+		values = self.get_many(sha256, [(name, version)])
+		if (name, version) in values:
+			return True, values[(name, version)]
+		return False, None
+
+	#  複数の値をまとめて取得する (keys は (名前, 版) のリスト; 見つかったものだけを返す)
+	def get_many(self, sha256, keys):
+		db = self.__connection()
+		wanted = set((name, str(version)) for name, version in keys)
+		names  = sorted(set(name for name, version in wanted))
+		values = {}
+		# SQLite の変数の数の上限を超えないよう、名前を分けて問い合わせる
+		for i in range(0, len(names), 500):
+			chunk = names[i:i+500]
+			for name, version, value in db.execute(
+					'SELECT name, version, value FROM features WHERE sha256 = ? AND name IN ({})'
+					.format(', '.join('?' * len(chunk))), [sha256] + chunk):
+				if (name, version) in wanted:
+					values[(name, version)] = pickle.loads(value)
+					self.__touched.append((sha256, name, version))
+		found = {}
+		for name, version in keys:
+			key = (name, str(version))
+			if key in values:
+				found[(name, version)] = values[key]
+		self.hits   += len(found)
+		self.misses += len(keys) - len(found)
+		# 参照のみが続く場合 (学習のやり直しなど) にも、参照時刻の更新を溜め込まない
+		if len(self.__touched) >= self.COMMIT_INTERVAL:
+			self.flush()
+		return found
+
+	def put(self, sha256, name, version, value):
+		self.put_many(sha256, {(name, version): value})
+
+	#  複数の値をまとめて書き込む (items は (名前, 版) から値への辞書)
+	def put_many(self, sha256, items):
+		db = self.__connection()
+		now = time.time()
+		rows = []
+		for (name, version), value in items.items():
+			blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+			rows.append((sha256, name, str(version), blob, len(blob), now))
+		db.executemany('INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?, ?)', rows)
+		self.__pending += len(rows)
+		if self.__pending >= self.COMMIT_INTERVAL:
+			self.flush()
+
+	#  書き込み・参照時刻の更新を反映し、必要であれば古いものを削除する
+	def flush(self):
+		db = self.__connection()
+		if self.__touched:
+			now = time.time()
+			db.executemany('UPDATE features SET atime = ? WHERE sha256 = ? AND name = ? AND version = ?',
+				[(now,) + key for key in self.__touched])
+			self.__touched = []
+		if self.__pending and self.max_bytes is not None:
+			self.__evict(db)
+		db.commit()
+		self.__pending = 0
+
+	#  大きさの合計が max_bytes の 9 割以下になるまで、参照時刻の古いものから削除する
+	def __evict(self, db):
+		total = db.execute('SELECT COALESCE(SUM(size), 0) FROM features').fetchone()[0]
+		if total <= self.max_bytes:
+			return
+		excess = total - self.max_bytes * 9 // 10
+		# 同じ時刻にまとめて書き込まれたものが多いため、時刻ではなくキーを指定して
+		# 超過した分だけを削除する
+		victims = []
+		for sha256, name, version, size in db.execute(
+				'SELECT sha256, name, version, size FROM features ORDER BY atime, sha256, name, version'):
+			victims.append((sha256, name, version))
+			excess -= size
+			if excess <= 0:
+				break
+		db.executemany('DELETE FROM features WHERE sha256 = ? AND name = ? AND version = ?', victims)
+
+	def size(self):
+		return self.__connection().execute('SELECT COALESCE(SUM(size), 0) FROM features').fetchone()[0]
+
+	def __len__(self):
+		return self.__connection().execute('SELECT COUNT(*) FROM features').fetchone()[0]
+
+	def stats(self):
+		return {
+			'hits':   self.hits,
+			'misses': self.misses,
+		}
+
+	def close(self):
+		if self.__db is not None and self.__pid == os.getpid():
+			self.flush()
+			self.__db.close()
+		self.__db = None
+		self.__pid = None
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state['_FeatureStore__db'] = None
+		state['_FeatureStore__pid'] = None
+		state['_FeatureStore__touched'] = []
+		state['_FeatureStore__pending'] = 0
+		return state
+
+	def __repr__(self):
+		return 'FeatureStore({}, max_bytes={})'.format(repr(self.path), repr(self.max_bytes))
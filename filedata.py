@@ -23,16 +23,145 @@
 #
 #
 import hashlib
-import io
+import mmap
+import tempfile
 from . import elffile
 
+#  ストリーミング時に一度に読み取る (ハッシュを計算する) 大きさ
+CHUNK_SIZE = 1 << 20
+
+#  データを CHUNK_SIZE ごとの memoryview に分けて返す
+#  データがマッピング (mmap) の場合、処理し終えた部分はメモリーから解放する
+#  (読み取り専用のマッピングであるため、再び参照すればファイルから読み直される)。
+def iter_chunks(data):
+	release = isinstance(data, mmap.mmap) and hasattr(data, 'madvise') and hasattr(mmap, 'MADV_DONTNEED')
+	view = memoryview(data).cast('B')
+	for i in range(0, len(view), CHUNK_SIZE):
+		yield view[i:i+CHUNK_SIZE]
+		if release:
+			data.madvise(mmap.MADV_DONTNEED, i, min(CHUNK_SIZE, len(view) - i))
+
+#  データの SHA-256 を CHUNK_SIZE ごとに計算する
+def _sha256(data):
+	h = hashlib.sha256()
+	for chunk in iter_chunks(data):
+		h.update(chunk)
+	return h.hexdigest()
+
+#  store に FeatureStore を与えた場合、特徴量はそこから取得し、無ければ計算して書き込む。
+#  streaming=True の場合、ファイル全体を読み込まずに mmap する
+#  (mmap できないパイプなどは、一時ファイルに書き出してから mmap する)。
+#  この場合、data はファイルへのマッピング (mmap) となり、sha256 および elffile は
+#  最初に参照された時に計算される。使用後は close() を呼ぶ (もしくは with 文で使う) こと。
 class FileData:
-	def __init__(self, filename):
-		with open(filename, 'rb') as f:
-			self.data = f.read()
-		self.sha256 = hashlib.sha256(self.data).hexdigest()
-		self.elffile = None
+	def __init__(self, filename, streaming=False, store=None):
+		self.filename  = filename
+		self.streaming = streaming
+		self.store     = store
+		self.__file    = None
+		self.__sha256  = None
+		self.__elffile = None
+		self.__elffile_parsed = False
+		if streaming:
+			self.__file, self.data = self.__map(filename)
+		else:
+			with open(filename, 'rb') as f:
+				self.data = f.read()
+			self.__sha256 = hashlib.sha256(self.data).hexdigest()
+			self.__parse_elffile()
+		#  特徴量のキャッシュ (同じ特徴量を使う決定器が複数あっても一度しか計算しない)
+		self.feature_cache = {}
+		self.feature_cache_hits   = 0
+		self.feature_cache_misses = 0
+
+	def __map(self, filename):
+		f = open(filename, 'rb')
+		try:
+			m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except (ValueError, OSError):
+			pass
+		else:
+			if hasattr(m, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+				m.madvise(mmap.MADV_SEQUENTIAL)
+			return f, m
+		# 読み取りながら SHA-256 を計算し、一時ファイルに書き出す
+		h = hashlib.sha256()
+		spool = tempfile.TemporaryFile()
+		with f:
+			while True:
+				chunk = f.read(CHUNK_SIZE)
+				if not chunk:
+					break
+				h.update(chunk)
+				spool.write(chunk)
+		spool.flush()
+		self.__sha256 = h.hexdigest()
 		try:
-			self.elffile = elffile.ELFFile(io.BytesIO(self.data))
+			return spool, mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ)
+		except ValueError:
+			# 空のファイルは mmap できない
+			spool.close()
+			return None, b''
+
+	@property
+	def sha256(self):
+		if self.__sha256 is None:
+			self.__sha256 = _sha256(self.data)
+		return self.__sha256
+
+	#  ELF ファイルとして解釈したもの (ELF ファイルでなければ None)
+	@property
+	def elffile(self):
+		if not self.__elffile_parsed:
+			self.__parse_elffile()
+		return self.__elffile
+	def __parse_elffile(self):
+		self.__elffile_parsed = True
+		try:
+			self.__elffile = elffile.ELFFile(self.data)
 		except:
 			pass
+
+	#  マッピングを閉じる (streaming=True の場合のみ意味を持つ)
+	#  特徴量などがまだマッピングを参照している場合、マッピングはそれらが解放された時に閉じられる。
+	def close(self):
+		self.__elffile = None
+		self.feature_cache.clear()
+		if isinstance(self.data, mmap.mmap):
+			try:
+				self.data.close()
+			except BufferError:
+				pass
+		if self.__file is not None:
+			self.__file.close()
+			self.__file = None
+	def __enter__(self):
+		return self
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	#  特徴量の取得 (キャッシュされていなければ計算する)
+	def get_feature(self, feature):
+		key = feature.cache_key()
+		if key in self.feature_cache:
+			self.feature_cache_hits += 1
+			return self.feature_cache[key]
+		self.feature_cache_misses += 1
+		if self.store is None:
+			value = feature.get_feature(self)
+		else:
+			name = feature.store_name()
+			found, value = self.store.get(self.sha256, name, feature.version)
+			if not found:
+				value = feature.get_feature(self)
+				self.store.put(self.sha256, name, feature.version, value)
+		self.feature_cache[key] = value
+		return value
+	def clear_feature_cache(self):
+		self.feature_cache.clear()
+	def feature_cache_stats(self):
+		return {
+			'hits':    self.feature_cache_hits,
+			'misses':  self.feature_cache_misses,
+			'entries': len(self.feature_cache),
+		}
@@ -0,0 +1,231 @@
+#
+#
+#	z2kit v2 : Security Camp track Z2 : sort of analysis framework
+#
+#	forest.py
+#	Bagged ensemble (random forest) of C4.5 decision trees
+#
+#	Copyright (C) 2018 Tsukasa OI.
+#
+#	Permission to use, copy, modify, and/or distribute this software
+#	for any purpose with or without fee is hereby granted, provided
+#	that the above copyright notice and this permission notice
+#	appear in all copies.
+#
+#	THE SOFTWARE IS PROVIDED “AS IS” AND ISC DISCLAIMS ALL WARRANTIES
+#	WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+#	MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL ISC BE LIABLE FOR
+#	ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+#	DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+#	WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+#	ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+#	PERFORMANCE OF THIS SOFTWARE.
+#
+#
+#	使い方:
+#		learner = C4_5DecisionLearner(teacher, deciders)
+#		learner.learn(files)
+#		trees = C4_5ForestLearner(learner).make_forest(100, workers=8)
+#		forest = C4_5ForestDecision(deciders, trees)
+#
+import array
+import concurrent.futures
+import math
+import random
+from multiprocessing import shared_memory
+from .c4_5 import C4_5DecisionLearner, C4_5DecisionBranch, C4_5LearnedData, compile_decision_tree
+from .decision import Decision
+
+#  決定木の構築には決定器の repr だけが必要なため、ワーカーには repr だけを渡す
+class _DeciderRepr:
+	def __init__(self, r):
+		self.r = r
+	def __repr__(self):
+		return self.r
+
+#  木ごとに用いる行 (ブートストラップ標本) と決定器の集合を seed から決める
+#  ビット集合による集計は行の重複を表せないため、復元抽出で選ばれた行を (重複を除いて) 用いる。
+def _tree_sample(seed, nrows, ndeciders, sample_ratio, max_deciders):
+	r = random.Random(seed)
+	bits = bytearray((nrows + 7) // 8)
+	for i in range(max(1, int(nrows * sample_ratio))):
+		k = r.randrange(nrows)
+		bits[k >> 3] |= 1 << (k & 7)
+	rows = int.from_bytes(bits, 'little')
+	deciders = None
+	if max_deciders is not None and max_deciders < ndeciders:
+		deciders = sorted(r.sample(range(ndeciders), max_deciders))
+	return rows, deciders
+
+def _make_tree(learner, seed, sample_ratio, max_deciders, max_depth, min_samples_split):
+	data = learner.learnedData
+	rows, deciders = _tree_sample(seed, data.nrows, len(data.columns) - 1, sample_ratio, max_deciders)
+	return learner.make_decision_tree(rows=rows, deciders=deciders,
+		max_depth=max_depth, min_samples_split=min_samples_split).to_json_object()
+
+#  共有メモリー上の学習データの列
+#  ビット集合の列は参照されるたびに共有メモリーから整数に変換し、数値の列は共有メモリーを
+#  そのまま double の配列として参照するため、ワーカーは学習データの複製を持たない。
+class _SharedColumns:
+	def __init__(self, buf, layout, nbytes):
+		self.buf    = buf
+		self.layout = layout
+		self.nbytes = nbytes
+	def __len__(self):
+		return len(self.layout)
+	def __getitem__(self, index):
+		numeric, offset, size = self.layout[index]
+		if numeric:
+			return self.buf[offset:offset+size].cast('d')
+		return int.from_bytes(self.buf[offset:offset+size], 'little')
+
+class _SharedLearnedData(C4_5LearnedData):
+	def is_numeric(self, index):
+		return self.columns.layout[index][0]
+
+#  学習データを共有メモリーに書き出し、(共有メモリー, 列の配置) を返す
+#  (列の配置は、列ごとの (数値の列か, オフセット, 大きさ))
+def _share_learned_data(data):
+	nbytes = (data.nrows + 7) // 8
+	layout = []
+	offset = 0
+	for column in data.columns:
+		numeric = isinstance(column, array.array)
+		size = column.itemsize * data.nrows if numeric else nbytes
+		layout.append((numeric, offset, size))
+		offset += (size + 7) & ~7
+	shm = shared_memory.SharedMemory(create=True, size=max(1, offset))
+	try:
+		for column, (numeric, offset, size) in zip(data.columns, layout):
+			if numeric:
+				shm.buf[offset:offset+size] = memoryview(column).cast('B')
+			else:
+				shm.buf[offset:offset+size] = column.to_bytes(nbytes, 'little')
+	except:
+		shm.close()
+		shm.unlink()
+		raise
+	return shm, layout
+
+#  並列学習のワーカープロセスの状態
+#  学習データは共有メモリーに一度だけ書き出し、各ワーカーはそれを直接参照する。
+_forest_worker_shm     = None
+_forest_worker_learner = None
+
+def _forest_worker_init(shmName, layout, nrows, reprs):
+	global _forest_worker_shm, _forest_worker_learner
+	_forest_worker_shm = shared_memory.SharedMemory(name=shmName)
+	columns = _SharedColumns(_forest_worker_shm.buf, layout, (nrows + 7) // 8)
+	_forest_worker_learner = C4_5DecisionLearner(None, [_DeciderRepr(r) for r in reprs])
+	_forest_worker_learner.load_learned_data(_SharedLearnedData(columns, nrows))
+
+def _forest_worker_tree(args):
+	return _make_tree(_forest_worker_learner, *args)
+
+#  学習済みの C4_5DecisionLearner の学習データを共有し、多数の決定木を作る
+class C4_5ForestLearner:
+	def __init__(self, learner):
+		if learner.learnedData is None:
+			raise ValueError("事前に学習させることが必要です。")
+		self.learner = learner
+	#  ntrees 本の決定木を作り、C4_5DecisionBranch (もしくは C4_5DecisionLeaf) のリストを返す
+	#  各木は sample_ratio * 行数 回の復元抽出で選んだ行と、無作為に選んだ
+	#  decider_ratio * 決定器の数 個の決定器 (None を与えた場合はすべて) から作る。
+	#  max_depth および min_samples_split は C4_5DecisionLearner.make_decision_tree と同じ。
+	#  workers を指定した場合はその数のプロセスで並列に作る (結果は workers によらず同じ)。
+	def make_forest(self, ntrees, sample_ratio=1.0, decider_ratio=0.5,
+			max_depth=None, min_samples_split=2, workers=None, seed=0):
+		data = self.learner.learnedData
+		ndeciders = len(data.columns) - 1
+		max_deciders = None
+		if decider_ratio is not None:
+			max_deciders = max(1, int(math.ceil(ndeciders * decider_ratio)))
+		tasks = [(seed * 1000003 + i, sample_ratio, max_deciders, max_depth, min_samples_split) for i in range(ntrees)]
+		reprs = [repr(d) for d in self.learner.decisionObjects]
+		if workers is None:
+			learner = C4_5DecisionLearner(None, [_DeciderRepr(r) for r in reprs])
+			learner.load_learned_data(data)
+			trees = [_make_tree(learner, *task) for task in tasks]
+		else:
+			trees = self.__make_forest_parallel(data, reprs, tasks, workers)
+		return [C4_5DecisionBranch.from_json_object(tree) for tree in trees]
+	def __make_forest_parallel(self, data, reprs, tasks, workers):
+		shm, layout = _share_learned_data(data)
+		try:
+			with concurrent.futures.ProcessPoolExecutor(
+					max_workers=workers,
+					initializer=_forest_worker_init,
+					initargs=(shm.name, layout, data.nrows, reprs)) as executor:
+				return list(executor.map(_forest_worker_tree, tasks))
+		finally:
+			shm.close()
+			shm.unlink()
+
+#  決定器の判定結果をファイルごとに一度だけ求める (複数の決定木で共有する)
+class _SharedDecider:
+	def __init__(self, decision, cache, idx):
+		self.decision = decision
+		self.cache    = cache
+		self.idx      = idx
+		self.calls    = 0
+	def decide(self, data):
+		cache = self.cache
+		if self.idx not in cache:
+			self.calls += 1
+			cache[self.idx] = self.decision.decide(data)
+		return cache[self.idx]
+	def get_value(self, data):
+		cache = self.cache
+		if self.idx not in cache:
+			self.calls += 1
+			cache[self.idx] = self.decision.get_value(data)
+		return cache[self.idx]
+
+#  決定木の多数決による判定
+#  真と判定した木の割合が threshold より大きければ True を返す。
+#  各決定器は、ファイルごとに (木の数によらず) 最大 1 回しか評価されない。
+class C4_5ForestDecision(Decision):
+	def __init__(self, decisionObjects, decisionTrees, threshold=0.5):
+		if len(decisionTrees) == 0:
+			raise ValueError('決定木が一つもありません。')
+		self.decisionObjects = decisionObjects
+		self.decisionTrees   = decisionTrees
+		self.threshold       = threshold
+		self.compile()
+	def compile(self):
+		self.__cache = {}
+		self.__shared = [_SharedDecider(d, self.__cache, i) for i, d in enumerate(self.decisionObjects)]
+		self.__decides = [compile_decision_tree(self.__shared, tree) for tree in self.decisionTrees]
+	#  真と判定した木の割合
+	def vote(self, data):
+		self.__cache.clear()
+		try:
+			votes = sum(1 for decide in self.__decides if decide(data))
+		finally:
+			self.__cache.clear()
+		return float(votes) / len(self.__decides)
+	def decide(self, data):
+		return self.vote(data) > self.threshold
+	#  決定器ごとの評価回数
+	def decider_calls(self):
+		return [d.calls for d in self.__shared]
+	def to_json_object(self):
+		return {
+			'threshold': self.threshold,
+			'trees':     [tree.to_json_object() for tree in self.decisionTrees],
+		}
+	@staticmethod
+	def from_json_object(decisionObjects, obj):
+		trees = [C4_5DecisionBranch.from_json_object(tree) for tree in obj['trees']]
+		return C4_5ForestDecision(decisionObjects, trees, obj.get('threshold', 0.5))
+	#  コンパイルされた関数は pickle できないため、復元時にコンパイルし直す
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		for name in ('__cache', '__shared', '__decides'):
+			del state['_C4_5ForestDecision' + name]
+		return state
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.compile()
+	def __repr__(self):
+		return 'C4_5ForestDecision(<{} trees>)'.format(len(self.decisionTrees))
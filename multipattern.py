@@ -0,0 +1,173 @@
+#
+#
+#	z2kit v2 : Security Camp track Z2 : sort of analysis framework
+#
+#	multipattern.py
+#	Multi-pattern matching for string decisions
+#
+#	Copyright (C) 2018 Tsukasa OI.
+#
+#	Permission to use, copy, modify, and/or distribute this software
+#	for any purpose with or without fee is hereby granted, provided
+#	that the above copyright notice and this permission notice
+#	appear in all copies.
+#
+#	THE SOFTWARE IS PROVIDED “AS IS” AND ISC DISCLAIMS ALL WARRANTIES
+#	WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+#	MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL ISC BE LIABLE FOR
+#	ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+#	DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+#	WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+#	ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+#	PERFORMANCE OF THIS SOFTWARE.
+#
+#
+import re
+
+#  印字可能な ASCII 文字か
+def _is_printable(ch):
+	return ch >= 0x20 and ch < 0x7f
+
+#  パターン集合から、共通の接頭辞をまとめたトライ木状の正規表現を作る
+#  (各位置において、その位置から始まる最長のパターンにマッチする)
+def _trie_regex(patterns):
+	END = None
+	root = {}
+	for p in patterns:
+		node = root
+		for ch in p:
+			node = node.setdefault(ch, {})
+		node[END] = True
+	def emit(node):
+		alts = []
+		for ch in sorted(k for k in node if k is not END):
+			child = node[ch]
+			# 分岐の無い部分はまとめて出力する
+			run = bytearray([ch])
+			while END not in child and len(child) == 1:
+				c = next(iter(child))
+				run.append(c)
+				child = child[c]
+			alts.append(re.escape(bytes(run)) + emit(child))
+		if not alts:
+			return b''
+		body = alts[0] if len(alts) == 1 else b'(?:' + b'|'.join(alts) + b')'
+		if END in node:
+			if len(alts) == 1:
+				body = b'(?:' + body + b')'
+			return body + b'?'
+		return body
+	return re.compile(b'(?=(' + emit(root) + b'))', re.DOTALL)
+
+#  マッチした最長のパターンに対し、同じ位置でマッチする (接頭辞となる) パターンの一覧
+def _prefix_table(patterns):
+	pset = set(patterns)
+	return {p: [p[:i] for i in range(1, len(p) + 1) if p[:i] in pset] for p in patterns}
+
+#  複数の文字列型決定器を、データを一度走査するだけでまとめて評価する
+#  決定器は get_search_pattern() によって (パターン, 印字可能文字の境界が必要か) を返す。
+#  このメソッドを持たない (もしくは None を返す) 決定器は、通常通り decide を呼び出す。
+class MultiPatternMatcher:
+	#  既に判定済みのパターンへのマッチがこの回数を超えたら、残りのパターンで正規表現を作り直す
+	REBUILD_THRESHOLD = 4096
+	#  パターンの数がこれより少ない場合は、まとめずに各決定器の decide を呼び出す
+	#  (少数のパターンであれば、個別に検索する方が速い)
+	MIN_PATTERNS = 16
+
+	def __init__(self, decisions):
+		self.decisions = list(decisions)
+		self.__specs   = []
+		self.__needs   = {}  # パターン -> (境界無しが必要か, 境界付きが必要か)
+		for dec in self.decisions:
+			spec = None
+			if hasattr(dec, 'get_search_pattern'):
+				spec = dec.get_search_pattern()
+			if spec is not None:
+				pattern, bounded = spec
+				if len(pattern) == 0:
+					# 空のパターンは (境界無しであれば) 常にマッチする
+					spec = None if bounded else (pattern, False)
+				else:
+					plain0, bounded0 = self.__needs.get(pattern, (False, False))
+					self.__needs[pattern] = (plain0 or not bounded, bounded0 or bounded)
+			self.__specs.append(spec)
+		if len(self.__needs) < self.MIN_PATTERNS:
+			self.__needs = {}
+			self.__specs = [None] * len(self.__specs)
+		self.__cache = {}
+		self.__compiled = self.__compile(frozenset(self.__needs))
+
+	def __compile(self, patterns):
+		if patterns not in self.__cache:
+			self.__cache[patterns] = (_trie_regex(patterns), _prefix_table(patterns)) if patterns else None
+		return self.__cache[patterns]
+
+	#  データ中に見つかったパターンの集合を返す (境界無し, 境界付き)
+	def match(self, data):
+		found_plain   = set()
+		found_bounded = set()
+		remaining = dict(self.__needs)
+		compiled  = self.__compiled
+		pos = 0
+		n = len(data)
+		while compiled is not None and remaining:
+			regex, prefixes = compiled
+			useless = 0
+			restart = None
+			for m in regex.finditer(data, pos):
+				i = m.start()
+				useful = False
+				for p in prefixes[m.group(1)]:
+					if p not in remaining:
+						continue
+					need_plain, need_bounded = remaining[p]
+					if need_plain:
+						found_plain.add(p)
+						need_plain = False
+						useful = True
+					if need_bounded:
+						j = i + len(p)
+						if (i == 0 or not _is_printable(data[i-1])) and (j >= n or not _is_printable(data[j])):
+							found_bounded.add(p)
+							need_bounded = False
+							useful = True
+					if need_plain or need_bounded:
+						remaining[p] = (need_plain, need_bounded)
+					else:
+						del remaining[p]
+				if not remaining:
+					break
+				if not useful:
+					useless += 1
+					if useless > self.REBUILD_THRESHOLD:
+						restart = i + 1
+						break
+			if restart is None:
+				break
+			# 判定済みのパターンを取り除いて走査を続ける
+			# (境界付きのみ未判定のパターンは、境界を満たす出現を探すため残す)
+			pos = restart
+			compiled = self.__compile(frozenset(remaining))
+		return found_plain, found_bounded
+
+	#  i 番目の決定器が、パターンの走査によって評価できるか
+	def is_pattern(self, i):
+		return self.__specs[i] is not None
+
+	#  match の結果から、i 番目の (is_pattern が真である) 決定器の判定結果を返す
+	def decide_matched(self, i, found):
+		pattern, bounded = self.__specs[i]
+		if len(pattern) == 0:
+			return True
+		return pattern in (found[1] if bounded else found[0])
+
+	#  全決定器の判定結果 (決定器の順序)
+	def decide_all(self, data):
+		found = self.match(data.data)
+		result = []
+		for i, dec in enumerate(self.decisions):
+			if self.__specs[i] is None:
+				result.append(dec.decide(data))
+			else:
+				result.append(self.decide_matched(i, found))
+		return result
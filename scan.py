@@ -0,0 +1,230 @@
+#
+#
+#	z2kit v2 : Security Camp track Z2 : sort of analysis framework
+#
+#	scan.py
+#	Parallel file scanner
+#
+#	Copyright (C) 2018 Tsukasa OI.
+#
+#	Permission to use, copy, modify, and/or distribute this software
+#	for any purpose with or without fee is hereby granted, provided
+#	that the above copyright notice and this permission notice
+#	appear in all copies.
+#
+#	THE SOFTWARE IS PROVIDED “AS IS” AND ISC DISCLAIMS ALL WARRANTIES
+#	WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+#	MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL ISC BE LIABLE FOR
+#	ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+#	DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+#	WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+#	ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+#	PERFORMANCE OF THIS SOFTWARE.
+#
+#
+#	使い方: python -m z2kit2.scan (-t 決定木.json | -e 決定器の式) [-j 並列数] [パス...]
+#	パスを与えなかった (もしくは `-' を与えた) 場合、標準入力から 1 行に 1 つのパスを読む。
+#	ディレクトリはその中のファイルを再帰的に走査する。
+#	結果はファイルごとに 1 行の JSON (path, sha256, verdict, seconds) として出力する。
+#
+import argparse
+import ast
+import concurrent.futures
+import json
+import os
+import sys
+import time
+from . import decisions
+from .decision import Decision, NumericValue
+from .featurestore import FeatureStore
+from .c4_5 import C4_5Decision, C4_5DecisionBranch
+from .filedata import FileData
+from .forest import C4_5ForestDecision
+
+#  決定器の式 (decisions の repr と同じ形式) から決定器を作る
+#  (決定木のファイルから任意のコードが実行されないよう、式は評価せずに構文木として解釈する。
+#  受け付けるのは decisions の決定器のクラスの呼び出しのみで、その引数はリテラルか
+#  決定器の式 (およびそれらのリスト・タプル) に限る。)
+#  numeric が真の場合は数値の決定器 (NumericValue; 決定木のしきい値による分岐で用いる) を、
+#  偽の場合は真偽値の決定器 (Decision) を作る。
+def parse_decision(expression, numeric=False):
+	try:
+		node = ast.parse(expression, mode='eval').body
+	except SyntaxError as e:
+		raise ValueError('決定器の式 `{}\' を解釈できません。'.format(expression)) from e
+	if not isinstance(node, ast.Call):
+		raise ValueError('決定器の式 `{}\' は決定器の呼び出しではありません。'.format(expression))
+	base = NumericValue if numeric else Decision
+	if not issubclass(_decision_class(node.func, expression), base):
+		raise ValueError('決定器の式 `{}\' は{}ではありません。'.format(
+			expression, '数値の決定器 (NumericValue)' if numeric else '真偽値の決定器 (Decision)'))
+	return _parse_argument(node, expression)
+
+def _decision_class(node, expression):
+	if isinstance(node, ast.Name):
+		cls = getattr(decisions, node.id, None)
+		if isinstance(cls, type) and issubclass(cls, (Decision, NumericValue)) and cls not in (Decision, NumericValue):
+			return cls
+	raise ValueError('決定器の式 `{}\' には、決定器以外の呼び出しが含まれています。'.format(expression))
+
+#  引数に含まれる決定器は、真偽値の決定器 (DecisionCombination_* の引数) に限る
+def _parse_argument(node, expression, top=True):
+	if isinstance(node, ast.Call):
+		cls = _decision_class(node.func, expression)
+		if not top and not issubclass(cls, Decision):
+			raise ValueError('決定器の式 `{}\' の引数に、真偽値の決定器以外の決定器が含まれています。'.format(expression))
+		args = [_parse_argument(arg, expression, False) for arg in node.args]
+		kwargs = {}
+		for kw in node.keywords:
+			if kw.arg is None:
+				raise ValueError('決定器の式 `{}\' には、使用できない引数が含まれています。'.format(expression))
+			kwargs[kw.arg] = _parse_argument(kw.value, expression, False)
+		return cls(*args, **kwargs)
+	if isinstance(node, ast.List):
+		return [_parse_argument(elt, expression, False) for elt in node.elts]
+	if isinstance(node, ast.Tuple):
+		return tuple(_parse_argument(elt, expression, False) for elt in node.elts)
+	try:
+		return ast.literal_eval(node)
+	except ValueError as e:
+		raise ValueError('決定器の式 `{}\' には、使用できない引数が含まれています。'.format(expression)) from e
+
+#  決定木に含まれる決定器を、各分岐の `decider' に記録された式から作り直す
+#  (しきい値を持つ分岐の決定器は数値の決定器、それ以外は真偽値の決定器でなければならない)
+def _load_deciders(trees):
+	decisionObjects = {}
+	stack = list(trees)
+	while stack:
+		elem = stack.pop()
+		if not isinstance(elem, C4_5DecisionBranch):
+			continue
+		if elem.idx not in decisionObjects:
+			if elem.drepr is None:
+				raise ValueError('決定器 {} の式が決定木に記録されていません。'.format(elem.idx))
+			decisionObjects[elem.idx] = parse_decision(elem.drepr, elem.threshold is not None)
+		stack.append(elem.branch0)
+		stack.append(elem.branch1)
+	objects = [None] * (max(decisionObjects.keys(), default=-1) + 1)
+	for idx, decision in decisionObjects.items():
+		objects[idx] = decision
+	return objects
+
+#  C4_5DecisionBranch.to_json_object の形式の決定木から C4_5Decision を作る
+#  (C4_5ForestDecision.to_json_object の形式であれば C4_5ForestDecision を作る)
+def load_tree(obj):
+	if 'trees' in obj:
+		trees = [C4_5DecisionBranch.from_json_object(tree) for tree in obj['trees']]
+		return C4_5ForestDecision(_load_deciders(trees), trees, obj.get('threshold', 0.5))
+	tree = C4_5DecisionBranch.from_json_object(obj)
+	return C4_5Decision(_load_deciders([tree]), tree)
+
+#  ファイルのパスを順に返す (ディレクトリはその中のファイルを再帰的に返す)
+def iter_paths(paths):
+	for path in paths:
+		if os.path.isdir(path):
+			for root, dirs, files in os.walk(path):
+				dirs.sort()
+				for name in sorted(files):
+					p = os.path.join(root, name)
+					if os.path.isfile(p):
+						yield p
+		else:
+			yield path
+
+#  ワーカープロセスの状態 (決定器はプロセスごとに一度だけ受け取る)
+_scan_worker_state = None
+
+def _scan_worker_init(decision, streaming, store):
+	global _scan_worker_state
+	_scan_worker_state = (decision, streaming, store)
+
+def _scan_file(decision, streaming, store, path):
+	t0 = time.perf_counter()
+	result = {'path': path}
+	try:
+		data = FileData(path, streaming=streaming, store=store)
+		try:
+			result['sha256']  = data.sha256
+			result['verdict'] = decision.decide(data)
+		finally:
+			data.close()
+			if store is not None:
+				store.flush()
+	except Exception as e:
+		result['error'] = '{}: {}'.format(type(e).__name__, e)
+	result['seconds'] = time.perf_counter() - t0
+	return result
+
+def _scan_worker_file(path):
+	decision, streaming, store = _scan_worker_state
+	return _scan_file(decision, streaming, store, path)
+
+#  ファイルを並列に判定し、終わったものから順に結果 (辞書) を返す
+#  同時に処理中となるファイルは最大 max_inflight 個 (既定では並列数の 4 倍) に制限され、
+#  結果が消費されない間は新たなファイルを読み込まない。
+#  workers に 0 を与えた場合、このプロセスで順に判定する。
+#  store に FeatureStore を与えた場合、特徴量はそこから取得する (無ければ計算して書き込む)。
+def scan(paths, decision, workers=None, max_inflight=None, streaming=True, store=None):
+	if workers is None:
+		workers = os.cpu_count() or 1
+	if workers == 0:
+		for path in paths:
+			yield _scan_file(decision, streaming, store, path)
+		return
+	if max_inflight is None:
+		max_inflight = workers * 4
+	if max_inflight < 1:
+		raise ValueError('max_inflight は 1 以上である必要があります。')
+	with concurrent.futures.ProcessPoolExecutor(
+			max_workers=workers,
+			initializer=_scan_worker_init,
+			initargs=(decision, streaming, store)) as executor:
+		inflight = set()
+		for path in paths:
+			if len(inflight) >= max_inflight:
+				done, inflight = concurrent.futures.wait(inflight, return_when=concurrent.futures.FIRST_COMPLETED)
+				for future in done:
+					yield future.result()
+			inflight.add(executor.submit(_scan_worker_file, path))
+		while inflight:
+			done, inflight = concurrent.futures.wait(inflight, return_when=concurrent.futures.FIRST_COMPLETED)
+			for future in done:
+				yield future.result()
+
+def _stdin_paths():
+	for line in sys.stdin:
+		line = line.rstrip('\n')
+		if line:
+			yield line
+
+def main(args):
+	parser = argparse.ArgumentParser(prog='python -m z2kit2.scan')
+	group = parser.add_mutually_exclusive_group(required=True)
+	group.add_argument('-t', '--tree', help='決定木 (JSON) のファイル')
+	group.add_argument('-e', '--expression', help='決定器の式 (例: "BinStringDecision(b\'UPX!\')")')
+	parser.add_argument('-j', '--workers', type=int, default=None, help='並列数 (既定: CPU 数; 0 で並列化しない)')
+	parser.add_argument('--max-inflight', type=int, default=None, help='同時に処理中とするファイルの最大数')
+	parser.add_argument('--no-streaming', action='store_true', help='ファイル全体を読み込む (mmap を使わない)')
+	parser.add_argument('--feature-store', help='特徴量ストア (SQLite) のファイル')
+	parser.add_argument('paths', nargs='*', help='ファイルもしくはディレクトリ (`-\': 標準入力からパスを読む)')
+	opts = parser.parse_args(args)
+	try:
+		if opts.tree is not None:
+			with open(opts.tree, 'r') as f:
+				decision = load_tree(json.load(f))
+		else:
+			decision = parse_decision(opts.expression)
+	except ValueError as e:
+		parser.error(str(e))
+	sources = [_stdin_paths() if path == '-' else [path] for path in (opts.paths or ['-'])]
+	paths = iter_paths(path for source in sources for path in source)
+	store = None if opts.feature_store is None else FeatureStore(opts.feature_store)
+	for result in scan(paths, decision, workers=opts.workers, max_inflight=opts.max_inflight,
+			streaming=not opts.no_streaming, store=store):
+		sys.stdout.write(json.dumps(result) + '\n')
+		sys.stdout.flush()
+	if store is not None:
+		store.close()
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
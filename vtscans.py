@@ -0,0 +1,284 @@
+#
+#
+#	z2kit v2 : Security Camp track Z2 : sort of analysis framework
+#
+#	vtscans.py
+#	VirusTotal scan results store (streaming loader and on-disk index)
+#
+#	Copyright (C) 2018 Tsukasa OI.
+#
+#	Permission to use, copy, modify, and/or distribute this software
+#	for any purpose with or without fee is hereby granted, provided
+#	that the above copyright notice and this permission notice
+#	appear in all copies.
+#
+#	THE SOFTWARE IS PROVIDED “AS IS” AND ISC DISCLAIMS ALL WARRANTIES
+#	WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+#	MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL ISC BE LIABLE FOR
+#	ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+#	DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+#	WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+#	ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+#	PERFORMANCE OF THIS SOFTWARE.
+#
+#
+import json
+import os
+import sqlite3
+import sys
+
+#  索引ファイルの形式の版 (形式を変えた場合は増やすこと)
+INDEX_VERSION = 1
+
+#  索引ファイルの既定のパス (スキャン結果ファイルの隣に置く)
+INDEX_SUFFIX = '.index.sqlite'
+
+__JSON_WS = ' \t\r\n'
+
+def _skip_ws(buf, pos):
+	while pos < len(buf) and buf[pos] in __JSON_WS:
+		pos += 1
+	return pos
+
+#  JSON 配列の要素をファイル全体を読み込まずに一つずつ返す
+def iter_json_array(f, chunk_size=1 << 20):
+	decoder = json.JSONDecoder()
+	buf = f.read(chunk_size)
+	pos = _skip_ws(buf, 0)
+	if pos == len(buf) or buf[pos] != '[':
+		raise ValueError('JSON 配列ではありません。')
+	pos += 1
+	while True:
+		pos = _skip_ws(buf, pos)
+		if pos < len(buf) and buf[pos] == ',':
+			pos += 1
+			continue
+		if pos < len(buf) and buf[pos] == ']':
+			return
+		if pos < len(buf):
+			try:
+				obj, end = decoder.raw_decode(buf, pos)
+				yield obj
+				pos = end
+				continue
+			except json.JSONDecodeError:
+				pass
+		# 要素が途中で切れている: 読み込み済みの部分を捨てて続きを読む
+		# (大きな要素でも二次的な再解析にならないよう、読み込み量を倍々で増やす)
+		more = f.read(max(chunk_size, len(buf) - pos))
+		if not more:
+			raise ValueError('JSON 配列の途中でファイルが終了しています。')
+		buf = buf[pos:] + more
+		pos = 0
+
+#  JSON Lines (1 行 1 オブジェクト) の各行を返す
+def iter_json_lines(f):
+	for line in f:
+		line = line.strip()
+		if line:
+			yield json.loads(line)
+
+#  スキャン結果ファイルの各スキャン結果を返す (JSON 配列・JSON Lines を自動判別)
+def iter_scans(scansFile):
+	with open(scansFile, 'r', encoding='utf-8') as f:
+		head = ''
+		while True:
+			ch = f.read(1)
+			if not ch or ch not in __JSON_WS:
+				head = ch
+				break
+		f.seek(0)
+		if head == '[':
+			yield from iter_json_array(f)
+		else:
+			yield from iter_json_lines(f)
+
+#  一つのスキャン結果から、検知したエンジンとその検知名だけを取り出す
+def _detections(scan):
+	for engine, result in scan.get('scans', {}).items():
+		if result.get('detected') and result.get('result') is not None:
+			yield engine, result['result']
+
+#  VirusTotal のスキャン結果 (sha256 -> {エンジン名: 検知名})
+#
+#  VTDetectionNameDecision は検知していないエンジンの結果を参照しないため、
+#  検知した結果のみを保持する。
+#  index に SQLite 形式の索引ファイルのパスを与えると、初回のみスキャン結果を
+#  解析して索引を作成し、以降は索引を直接参照する (元ファイルの大きさと
+#  更新時刻が変わった場合は作り直す)。index が None の場合はメモリ上に保持する。
+class VTScanStore:
+	def __init__(self, scansFile, index=None):
+		self.scansFile = os.path.abspath(scansFile)
+		self.index = None if index is None else os.path.abspath(index)
+		self.scans = None
+		self.__db = None
+		self.__pid = None
+		if self.index is None:
+			self.__load_memory()
+		elif not self.__index_is_valid():
+			self.__build_index()
+
+	def __source_stamp(self):
+		st = os.stat(self.scansFile)
+		return '{}:{}:{}'.format(INDEX_VERSION, st.st_size, st.st_mtime_ns)
+
+	def __load_memory(self):
+		self.scans = {}
+		for scan in iter_scans(self.scansFile):
+			# エンジン名・検知名は多くのファイルで共通なので intern して共有する
+			self.scans[scan['sha256']] = {
+				sys.intern(engine): sys.intern(result)
+				for engine, result in _detections(scan)
+			}
+
+	def __index_is_valid(self):
+		if not os.path.exists(self.index):
+			return False
+		try:
+			row = self.__connection().execute(
+				'SELECT value FROM meta WHERE key = ?', ('source',)).fetchone()
+		except sqlite3.Error:
+			self.close()
+			return False
+		if row is None or row[0] != self.__source_stamp():
+			self.close()
+			return False
+		return True
+
+	def __build_index(self):
+		self.close()
+		stamp = self.__source_stamp()
+		tmpname = '{}.{}.tmp'.format(self.index, os.getpid())
+		if os.path.exists(tmpname):
+			os.remove(tmpname)
+		db = sqlite3.connect(tmpname)
+		try:
+			# 文字列 (エンジン名・検知名) は names 表で番号に置き換えて格納する
+			db.executescript('''
+				PRAGMA journal_mode = OFF;
+				PRAGMA synchronous = OFF;
+				CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+				CREATE TABLE names (id INTEGER PRIMARY KEY, name TEXT UNIQUE);
+				CREATE TABLE scans (sha256 TEXT PRIMARY KEY) WITHOUT ROWID;
+				CREATE TABLE detections (
+					sha256 TEXT, engine INTEGER, result INTEGER,
+					PRIMARY KEY (sha256, engine)) WITHOUT ROWID;
+			''')
+			names = {}
+			def name_id(name):
+				i = names.get(name)
+				if i is None:
+					i = names[name] = len(names)
+				return i
+			rows_scans = []
+			rows_detections = []
+			def flush():
+				db.executemany('INSERT OR REPLACE INTO scans VALUES (?)', rows_scans)
+				db.executemany('INSERT OR REPLACE INTO detections VALUES (?, ?, ?)', rows_detections)
+				del rows_scans[:]
+				del rows_detections[:]
+			pending = set()
+			for scan in iter_scans(self.scansFile):
+				sha256 = scan['sha256']
+				# 同じ sha256 が複数回現れた場合は後のものを採用する (json.load 版と同じ)
+				if sha256 in pending:
+					flush()
+					pending.clear()
+				db.execute('DELETE FROM detections WHERE sha256 = ?', (sha256,))
+				pending.add(sha256)
+				rows_scans.append((sha256,))
+				for engine, result in _detections(scan):
+					rows_detections.append((sha256, name_id(engine), name_id(result)))
+				if len(rows_detections) >= 65536:
+					flush()
+					pending.clear()
+			flush()
+			db.executemany('INSERT INTO names VALUES (?, ?)', [(i, name) for name, i in names.items()])
+			db.execute('INSERT INTO meta VALUES (?, ?)', ('source', stamp))
+			db.commit()
+		finally:
+			db.close()
+		os.replace(tmpname, self.index)
+
+	#  SQLite の接続はプロセスをまたいで共有できないため、プロセスごとに開き直す
+	def __connection(self):
+		if self.__db is None or self.__pid != os.getpid():
+			self.__db = sqlite3.connect('file:{}?mode=ro'.format(self.index), uri=True, check_same_thread=False)
+			self.__pid = os.getpid()
+		return self.__db
+
+	def close(self):
+		if self.__db is not None and self.__pid == os.getpid():
+			self.__db.close()
+		self.__db = None
+		self.__pid = None
+
+	def __contains__(self, sha256):
+		if self.scans is not None:
+			return sha256 in self.scans
+		return self.__connection().execute(
+			'SELECT 1 FROM scans WHERE sha256 = ?', (sha256,)).fetchone() is not None
+
+	def __len__(self):
+		if self.scans is not None:
+			return len(self.scans)
+		return self.__connection().execute('SELECT COUNT(*) FROM scans').fetchone()[0]
+
+	#  検知したエンジンとその検知名 (スキャン結果がなければ None)
+	def get_detections(self, sha256):
+		if self.scans is not None:
+			return self.scans.get(sha256)
+		if sha256 not in self:
+			return None
+		return dict(self.__connection().execute('''
+			SELECT e.name, r.name FROM detections d
+			JOIN names e ON e.id = d.engine JOIN names r ON r.id = d.result
+			WHERE d.sha256 = ?''', (sha256,)))
+
+	#  指定したエンジンの検知名 (検知していなければ None)
+	def get_result(self, sha256, engine):
+		if self.scans is not None:
+			return self.scans.get(sha256, {}).get(engine)
+		row = self.__connection().execute('''
+			SELECT r.name FROM detections d
+			JOIN names e ON e.id = d.engine JOIN names r ON r.id = d.result
+			WHERE d.sha256 = ? AND e.name = ?''', (sha256, engine)).fetchone()
+		return None if row is None else row[0]
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state['_VTScanStore__db'] = None
+		state['_VTScanStore__pid'] = None
+		return state
+
+	def __repr__(self):
+		return 'VTScanStore({}, index={})'.format(repr(self.scansFile), repr(self.index))
+
+__stores = {}
+
+#  スキャン結果ファイルごとに共有される VTScanStore を返す
+#  (同じファイルから複数の決定器を作っても、解析・索引の読み込みは一度で済む)
+#  既定 (index が None) ではメモリ上に保持し、ファイルは作成しない。
+#  index に索引ファイルのパスを与えた場合はそれを用いる。index が True の場合は
+#  既定のパス (scansFile + INDEX_SUFFIX) を索引として用い、索引を作成できない
+#  (書き込めない場所にある等) 場合はメモリ上に保持する。
+def get_scan_store(scansFile, index=None):
+	fallback = index is True
+	if fallback:
+		index = scansFile + INDEX_SUFFIX
+	key = (os.path.abspath(scansFile), None if index is None else os.path.abspath(index))
+	store = __stores.get(key)
+	if store is None:
+		try:
+			store = VTScanStore(scansFile, index)
+		except (OSError, sqlite3.Error):
+			if not fallback:
+				raise
+			store = VTScanStore(scansFile)
+		__stores[key] = store
+	return store
+
+def clear_scan_stores():
+	for store in __stores.values():
+		store.close()
+	__stores.clear()
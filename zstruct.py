@@ -22,6 +22,8 @@
 #	PERFORMANCE OF THIS SOFTWARE.
 #
 #
+import array
+import mmap
 import struct
 import re
 
@@ -34,6 +36,10 @@ import re
 #       * pack
 #       * struct_length
 #       * init_from
+#       * init_array_from
+#       * unpack_from
+#       * init_from_buffer
+#       * unpack_columns
 __ZSTRUCT_NAME_WHITELIST  = re.compile('^[A-Za-z_][A-Za-z0-9_]*$')
 __ZSTRUCT_NAME_BLACKLISTS = [
 	re.compile('^__'),
@@ -41,6 +47,10 @@ __ZSTRUCT_NAME_BLACKLISTS = [
 	re.compile('^(un)?pack$'),
 	re.compile('^struct_length$'),
 	re.compile('^init_from$'),
+	re.compile('^init_array_from$'),
+	re.compile('^unpack_from$'),
+	re.compile('^init_from_buffer$'),
+	re.compile('^unpack_columns$'),
 ]
 
 #  zstruct 'typedef' 型名の必要要件
@@ -130,6 +140,15 @@ __ZSTRUCT_TYPE_SIZES = {
 	'Q': 8,
 }
 
+#  array.array に格納できる型
+__ZSTRUCT_ARRAY_TYPES = 'bBhHiIlLqQ'
+
+#  型ごとのゼロ値 (無視するメンバーを pack する際に使用)
+__ZSTRUCT_TYPE_ZEROS = {
+	'c': b'\x00',
+	'?': False,
+}
+
 #  zstruct は次のエンディアンをサポートする
 #   1. ネイティブエンディアン (プラットフォーム依存でリトルもしくはビッグ)
 #   2. リトルエンディアン
@@ -139,6 +158,133 @@ ENDIAN_NATIVE = 0
 ENDIAN_LITTLE = 1
 ENDIAN_BIG    = 2
 
+#  unpack に与えることのできるバイト列の型
+#  (memoryview や mmap を与えた場合、データをコピーせずに読み取る)
+__ZSTRUCT_BUFFER_TYPES = (bytes, bytearray, memoryview, mmap.mmap)
+
+#  zstruct が生成するメソッドのテンプレート
+#  (メンバーごとのループや setattr を介さず、構造体ごとに特化したコードを exec で生成する)
+__ZSTRUCT_CODEGEN_TEMPLATE = """
+def class_init(self):
+	{init}
+def class_unpack(self, data, endian=None):
+	if not isinstance(data, _buffers):
+		raise ValueError('unpack にはバイト列が必要です。')
+	v = _structs[_default if endian is None else endian].unpack(data)
+	{unpack}
+def class_unpack_from(self, buffer, offset=0, endian=None):
+	if not isinstance(buffer, _buffers):
+		raise ValueError('unpack_from にはバイト列が必要です。')
+	v = _structs[_default if endian is None else endian].unpack_from(buffer, offset)
+	{unpack}
+def class_pack(self, endian=None):
+	return _structs[_default if endian is None else endian].pack({pack})
+def class_init_from(cls, data, endian=None):
+	if _fast and cls is _cls:
+		if not isinstance(data, _buffers):
+			raise ValueError('unpack にはバイト列が必要です。')
+		v = _structs[_default if endian is None else endian].unpack(data)
+		o = _new(cls)
+		{fast}
+		return o
+	o = cls()
+	o.unpack(data, endian=endian)
+	return o
+def class_init_from_buffer(cls, buffer, offset=0, endian=None):
+	if _fast and cls is _cls:
+		if not isinstance(buffer, _buffers):
+			raise ValueError('unpack_from にはバイト列が必要です。')
+		v = _structs[_default if endian is None else endian].unpack_from(buffer, offset)
+		o = _new(cls)
+		{fast}
+		return o
+	o = cls()
+	o.unpack_from(buffer, offset, endian=endian)
+	return o
+def class_init_array_from(cls, data, count, entsize=None, endian=None, offset=0):
+	s = _structs[_default if endian is None else endian]
+	if not (_fast and cls is _cls):
+		if entsize is None:
+			entsize = s.size
+		_check_rows(s, data, count, entsize, offset)
+		return [cls.init_from_buffer(data, i, endian=endian) for i in range(offset, offset + max(count, 0) * entsize, entsize)]
+	a = []
+	append = a.append
+	for v in _iter_rows(s, data, count, entsize, offset):
+		o = _new(cls)
+		{fast}
+		append(o)
+	return a
+"""
+
+#  テーブル (同じ構造体の配列) の範囲の確認
+def __zstruct_check_rows(s, data, count, entsize, offset):
+	if not isinstance(data, __ZSTRUCT_BUFFER_TYPES):
+		raise ValueError('unpack にはバイト列が必要です。')
+	if entsize < s.size:
+		raise ValueError('エントリーサイズ `{}\' は構造体の長さ `{}\' より小さくすることができません。'.format(entsize, s.size))
+	if count > 0 and (offset < 0 or len(data) < offset + (count - 1) * entsize + s.size):
+		raise ValueError('`{}\' 個のエントリーを読み取るにはデータが足りません。'.format(count))
+
+#  テーブルの各エントリーを unpack した値のタプルを順に返す
+def __zstruct_iter_rows(s, data, count, entsize, offset):
+	if entsize is None:
+		entsize = s.size
+	__zstruct_check_rows(s, data, count, entsize, offset)
+	if count <= 0:
+		return iter(())
+	end = offset + count * entsize
+	if entsize == s.size:
+		# 連続したテーブルは iter_unpack で一度に処理する (memoryview によりコピーしない)
+		return s.iter_unpack(memoryview(data)[offset:end])
+	# エントリー間に隙間がある場合は unpack_from でずらしながら読む
+	unpack_from = s.unpack_from
+	return (unpack_from(data, i) for i in range(offset, end, entsize))
+
+#  unpack された値 (v) をメンバーに格納する文と、pack に渡す引数列を生成する
+def __zstruct_codegen_members(ynames, yarray, ytypes):
+	targets = []
+	values  = []
+	packs   = []
+	j = 0
+	for xname, l, t in zip(ynames, yarray, ytypes):
+		n = l if l else 1
+		if xname is None:
+			# 無視するメンバーはゼロ埋めする
+			packs.extend([repr(__ZSTRUCT_TYPE_ZEROS.get(t, 0))] * n)
+		elif l:
+			targets.append(xname)
+			values.append('v[{}:{}]'.format(j, j + l))
+			packs.append('*self.{}'.format(xname))
+		else:
+			targets.append(xname)
+			values.append('v[{}]'.format(j))
+			packs.append('self.{}'.format(xname))
+		j += n
+	simple = len(targets) == j
+	def stores(obj):
+		if not targets:
+			return ['pass']
+		# 配列も無視するメンバーも無い場合、タプルの展開で一度に代入できる
+		if simple:
+			return ['{} = v'.format(', '.join('{}.{}'.format(obj, x) for x in targets) + (',' if j == 1 else ''))]
+		return ['{}.{} = {}'.format(obj, x, v) for x, v in zip(targets, values)]
+	return stores, packs
+
+#  __slots__ を持つクラスとして作り直す (インスタンスごとの __dict__ を持たない)
+#  基底クラスも __slots__ を持たない限り __dict__ は残ることに注意。
+def __zstruct_make_slotted(cls, ynames):
+	slots = tuple(x for x in ynames if x is not None)
+	ns = dict(cls.__dict__)
+	ns.pop('__dict__', None)
+	ns.pop('__weakref__', None)
+	for name in slots:
+		if name in ns:
+			raise ValueError('`{}\': __slots__ を持つ構造体のメンバーはクラス属性と衝突することができません。'.format(name))
+	ns['__slots__']    = slots
+	ns['__qualname__'] = cls.__qualname__
+	return type(cls)(cls.__name__, cls.__bases__, ns)
+
 def zstruct(*args, **kwargs):
 	if len(args) == 0 and 'members' not in kwargs:
 		raise ValueError('構造体のメンバーを与える必要があります。')
@@ -169,6 +315,7 @@ def zstruct(*args, **kwargs):
 			typedefs[zname] = tspec
 	ynames  = []
 	yarray  = []
+	ytypes  = []
 	yformat = ''
 	yendian = ENDIAN_NATIVE
 	ylength = 0
@@ -213,6 +360,7 @@ def zstruct(*args, **kwargs):
 				ttype = aspec.group(3)
 		# Resolve member type specification
 		ttype = __ZSTRUCT_TYPES[ttype]
+		ytypes.append(ttype)
 		if tslen:
 			zlength = int(tslen)
 			yformat += tslen
@@ -222,59 +370,44 @@ def zstruct(*args, **kwargs):
 			yarray.append(0)
 			ylength += __ZSTRUCT_TYPE_SIZES[ttype]
 		yformat += ttype
+	# 各エンディアン用の struct.Struct をデコレーション時に一度だけ生成する
+	ystructs = [struct.Struct(e + yformat) for e in __ZSTRUCT_ENDIANS]
+	ystores, ypacks = __zstruct_codegen_members(ynames, yarray, ytypes)
 	def zstruct_main(cls):
+		if 'slots' in kwargs and kwargs['slots']:
+			cls = __zstruct_make_slotted(cls, ynames)
 		setattr(cls, '__struct_names__',  ynames)
 		setattr(cls, '__struct_array__',  yarray)
 		setattr(cls, '__struct_format__', yformat)
 		setattr(cls, '__struct_endian__', yendian)
+		setattr(cls, '__struct_structs__', ystructs)
 		setattr(cls, 'struct_length', ylength)
-		def class_init(self):
-			xnames  = self.__struct_names__
-			xarray  = self.__struct_array__
-			for i in range(len(xnames)):
-				if xnames[i] is None:
-					continue
-				if xarray[i]:
-					setattr(self, xnames[i], xarray[i] * [0])
-				else:
-					setattr(self, xnames[i], 0)
-		def class_unpack(self, data, **kwargs0):
-			if not isinstance(data, (bytes, bytearray)):
-				raise ValueError('unpack にはバイト列が必要です。')
-			xnames  = self.__struct_names__
-			xarray  = self.__struct_array__
-			xendian = self.__struct_endian__
-			if 'endian' in kwargs0:
-				xendian = kwargs0['endian']
-			data = struct.unpack(__ZSTRUCT_ENDIANS[xendian] + self.__struct_format__, data)
-			j = 0
-			for i in range(len(xnames)):
-				xname = xnames[i]
-				l = xarray[i]
-				if xname is not None:
-					if l:
-						setattr(self, xnames[i], data[j:j+l])
-					else:
-						setattr(self, xnames[i], data[j])
-				j += l if l else 1
-		def class_pack(self, **kwargs0):
-			xnames  = self.__struct_names__
-			xarray  = self.__struct_array__
-			xendian = self.__struct_endian__
-			if 'endian' in kwargs0:
-				xendian = kwargs0['endian']
-			args0 = []
-			for i in range(len(xnames)):
-				l = xarray[i]
-				if xnames[i] is None:
-					for j in range(l if l else 1):
-						args0.append(0)
-				else:
-					if l:
-						args0.extend(getattr(self, xnames[i]))
-					else:
-						args0.append(getattr(self, xnames[i]))
-			return struct.pack(__ZSTRUCT_ENDIANS[xendian] + self.__struct_format__, *args0)
+		override_init = 'override_init' in kwargs and kwargs['override_init']
+		# unpack が独自に定義されていたり __init__ を上書きしたりする場合、
+		# init_from は生成したコードによる高速な経路を使わない
+		fast_init_from = not override_init and not hasattr(cls, 'unpack') and not hasattr(cls, 'unpack_from')
+		env = {
+			'_structs': ystructs,
+			'_default': yendian,
+			'_new':     object.__new__,
+			'_buffers': __ZSTRUCT_BUFFER_TYPES,
+			'_cls':     None,
+			'_fast':    fast_init_from,
+			'_check_rows': __zstruct_check_rows,
+			'_iter_rows':  __zstruct_iter_rows,
+		}
+		exec(__ZSTRUCT_CODEGEN_TEMPLATE.format(
+			init   = '\n\t'.join(
+				'self.{} = {}'.format(xname, '{} * [0]'.format(xarray) if xarray else '0')
+				for xname, xarray in zip(ynames, yarray) if xname is not None) or 'pass',
+			unpack = '\n\t'.join(ystores('self')),
+			pack   = ', '.join(ypacks),
+			fast   = '\n\t\t'.join(ystores('o')),
+		), env)
+		class_init        = env['class_init']
+		class_unpack      = env['class_unpack']
+		class_unpack_from = env['class_unpack_from']
+		class_pack        = env['class_pack']
 		def class_repr(self):
 			xnames  = self.__struct_names__
 			xarray  = self.__struct_array__
@@ -296,24 +429,47 @@ def zstruct(*args, **kwargs):
 					s += '\n'
 			s += '}'
 			return s
-		@classmethod
-		def class_init_from(cls, data, **kwargs):
-			o = cls()
-			o.unpack(data, **kwargs)
-			return o
+		class_init_from        = classmethod(env['class_init_from'])
+		class_init_from_buffer = classmethod(env['class_init_from_buffer'])
+		class_init_array_from  = classmethod(env['class_init_array_from'])
+		#  テーブルを列 (メンバー) ごとに読み取る
+		#  整数型のメンバーは array.array として、それ以外はリストとして返す。
+		def class_unpack_columns(cls, data, count, entsize=None, endian=None, offset=0):
+			s = ystructs[yendian if endian is None else endian]
+			cols = list(zip(*__zstruct_iter_rows(s, data, count, entsize, offset)))
+			if not cols:
+				cols = [()] * len(s.unpack(bytes(s.size)))
+			result = {}
+			j = 0
+			for xname, l, t in zip(ynames, yarray, ytypes):
+				if xname is not None:
+					if l:
+						result[xname] = list(zip(*cols[j:j+l]))
+					elif t in __ZSTRUCT_ARRAY_TYPES:
+						result[xname] = array.array(t, cols[j])
+					else:
+						result[xname] = list(cols[j])
+				j += l if l else 1
+			return result
+		class_unpack_columns = classmethod(class_unpack_columns)
 		prefix = '_' + cls.__name__.lstrip('_') + '__internal_'
 		def set_attr(name, func):
 			setattr(cls, prefix + name, func)
 			if not hasattr(cls, name):
 				setattr(cls, name, func)
-		if not ('override_init' in kwargs and kwargs['override_init']):
+		if not override_init:
 			setattr(cls, '__init__', class_init)
 		if not ('override_repr' in kwargs and kwargs['override_repr']):
 			setattr(cls, '__repr__', class_repr)
 		setattr(cls, prefix + 'init', class_init)
 		setattr(cls, prefix + 'repr', class_repr)
-		set_attr('unpack', class_unpack)
-		set_attr('pack',   class_pack)
-		setattr(cls, 'init_from', class_init_from)
+		set_attr('unpack',      class_unpack)
+		set_attr('pack',        class_pack)
+		set_attr('unpack_from', class_unpack_from)
+		setattr(cls, 'init_from',        class_init_from)
+		setattr(cls, 'init_from_buffer', class_init_from_buffer)
+		setattr(cls, 'init_array_from',  class_init_array_from)
+		setattr(cls, 'unpack_columns',   class_unpack_columns)
+		env['_cls'] = cls
 		return cls
 	return zstruct_main